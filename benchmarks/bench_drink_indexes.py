@@ -0,0 +1,101 @@
+"""Drink debt query latency with and without the drink_debts_v2 secondary indexes.
+
+Seeds ROWS debts across many guilds and channels, then reports p50/p99 for the
+queries that still hit SQLite: the ledger's channel load, an amount-ordered
+channel scan and the server-wide creditor lookup on drink_debt_totals.
+
+    DISCORD_TOKEN=x python benchmarks/bench_drink_indexes.py [rows]
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import calebv3  # noqa: E402
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+GUILDS, CHANNELS, USERS = 100, 20, 60
+SAMPLES = 2000
+
+QUERIES = {
+    "channel load": (
+        "SELECT debtor_id, creditor_id, amount FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND amount > 0",
+        lambda g, c, u: (g, c),
+    ),
+    "channel top 15": (
+        "SELECT debtor_id, creditor_id, amount FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? ORDER BY amount DESC LIMIT 15",
+        lambda g, c, u: (g, c),
+    ),
+    "server creditor lookup": (
+        "SELECT debtor_id, amount FROM drink_debt_totals WHERE guild_id = ? AND creditor_id = ?",
+        lambda g, c, u: (g, u),
+    ),
+}
+
+
+class Bot:
+    pass
+
+
+async def init_schema():
+    cog = calebv3.DrinkCounter(Bot())
+    cog.db = await calebv3.Database.attach(cog.bot)
+    await cog.init_db()
+    await cog.db.detach()
+
+
+def seed(conn: sqlite3.Connection):
+    rng = random.Random(1)
+    rows, seen = [], set()
+    while len(rows) < ROWS:
+        key = (rng.randrange(GUILDS), rng.randrange(CHANNELS), rng.randrange(USERS * 20), rng.randrange(USERS * 20))
+        if key[2] != key[3] and key not in seen:
+            seen.add(key)
+            rows.append((*key, rng.randint(1, 50)))
+    conn.executemany(
+        "INSERT INTO drink_debts_v2 (guild_id, channel_id, debtor_id, creditor_id, amount) VALUES (?, ?, ?, ?, ?)", rows
+    )
+    conn.commit()
+
+
+def measure(conn: sqlite3.Connection, label: str):
+    rng = random.Random(2)
+    print(f"-- {label}")
+    for name, (sql, params) in QUERIES.items():
+        timings = []
+        for _ in range(SAMPLES):
+            args = params(rng.randrange(GUILDS), rng.randrange(CHANNELS), rng.randrange(USERS * 20))
+            start = time.perf_counter()
+            conn.execute(sql, args).fetchall()
+            timings.append((time.perf_counter() - start) * 1e6)
+        q = statistics.quantiles(timings, n=100)
+        print(f"{name:24} p50 {q[49]:8.0f} us   p99 {q[98]:8.0f} us")
+
+
+def main():
+    calebv3.DB_PATH = Path(tempfile.mkdtemp()) / "bench.db"
+    asyncio.run(init_schema())
+    conn = sqlite3.connect(calebv3.DB_PATH)
+    conn.execute("DROP INDEX idx_drink_debts_v2_amount")
+    start = time.perf_counter()
+    seed(conn)
+    print(f"Seeded {ROWS} rows in {time.perf_counter() - start:.1f} s")
+    measure(conn, "without secondary indexes")
+    conn.close()
+
+    # init_db recreates the indexes; PRAGMA optimize runs when the pool closes
+    asyncio.run(init_schema())
+    conn = sqlite3.connect(calebv3.DB_PATH)
+    measure(conn, "with init_db indexes")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
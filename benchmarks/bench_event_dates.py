@@ -0,0 +1,131 @@
+"""upcoming_events queries before and after the epoch-seconds migration.
+
+Seeds EVENTS rows in the old layout (ISO strings in HK time, no indexes, PENDING
+of them not yet announced), times the old scheduler pass, cleanup and full
+listing, then lets init_db migrate the table and times their replacements.
+Cleanup deletes are rolled back so every run sees the same rows. Min of RUNS.
+
+    DISCORD_TOKEN=x python benchmarks/bench_event_dates.py [events]
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import calebv3  # noqa: E402
+
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+PENDING = 0.1
+RUNS = 5
+
+
+class Bot:
+    pass
+
+
+def best(fn) -> float:
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def rolled_back(conn: sqlite3.Connection, *statements):
+    def run():
+        for sql, params in statements:
+            conn.execute(sql, params)
+        conn.rollback()
+    return run
+
+
+def seed(conn: sqlite3.Connection, now: datetime):
+    conn.execute("""
+        CREATE TABLE upcoming_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_date TIMESTAMP NOT NULL,
+            event_name TEXT NOT NULL,
+            has_time BOOLEAN NOT NULL,
+            announced_1w BOOLEAN DEFAULT 0,
+            announced_1d BOOLEAN DEFAULT 0,
+            role_mention TEXT
+        )
+    """)
+    rng = random.Random(1)
+    rows = []
+    for i in range(EVENTS):
+        pending = rng.random() < PENDING
+        # Cleanup runs every 30 minutes, so only a thin slice of announced events is due for deletion
+        days = rng.uniform(1, 365) if pending else rng.uniform(-2.02, 1)
+        event_dt = (now + timedelta(days=days)).replace(microsecond=0)
+        rows.append((event_dt.isoformat(), f"Event {i}", 1, int(not pending or days < 7), int(not pending)))
+    conn.executemany(
+        "INSERT INTO upcoming_events (event_date, event_name, has_time, announced_1w, announced_1d) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    conn.commit()
+
+
+def old_scheduler_pass(conn: sqlite3.Connection):
+    rows = conn.execute(
+        "SELECT id, event_date, announced_1w, announced_1d FROM upcoming_events WHERE announced_1d = 0"
+    ).fetchall()
+    for row in rows:
+        datetime.fromisoformat(row[1])
+
+
+async def migrate():
+    cog = calebv3.EventAnnouncer(Bot())
+    cog.db = await calebv3.Database.attach(cog.bot)
+    await cog.init_db()
+    await cog.db.detach()
+
+
+def main():
+    calebv3.DB_PATH = Path(tempfile.mkdtemp()) / "bench.db"
+    conn = sqlite3.connect(calebv3.DB_PATH)
+    hk_now = calebv3.get_hk_now()
+    seed(conn, hk_now)
+    cutoff_iso = (hk_now - timedelta(days=2)).isoformat()
+    old = {
+        "scheduler pass": best(lambda: old_scheduler_pass(conn)),
+        "cleanup range": best(rolled_back(conn, ("DELETE FROM upcoming_events WHERE event_date < ?", (cutoff_iso,)))),
+        "full listing": best(lambda: conn.execute("SELECT * FROM upcoming_events ORDER BY event_date ASC").fetchall()),
+    }
+    conn.close()
+
+    start = time.perf_counter()
+    asyncio.run(migrate())
+    print(f"Migrated {EVENTS} events in {time.perf_counter() - start:.1f} s")
+
+    conn = sqlite3.connect(calebv3.DB_PATH)
+    cutoff = int(time.time()) - 2 * 86400
+    new = {
+        "scheduler pass": best(lambda: conn.execute("""
+            SELECT id, event_date, announced_1w, rrule, announced_through_1w, announced_through_1d
+            FROM upcoming_events WHERE announced_1d = 0
+        """).fetchall()),
+        "cleanup range": best(rolled_back(
+            conn,
+            ("DELETE FROM upcoming_events WHERE event_date < ? AND rrule IS NULL", (cutoff,)),
+            ("DELETE FROM upcoming_events WHERE rrule IS NOT NULL AND ends_at < ?", (cutoff,)),
+        )),
+        "full listing": best(lambda: conn.execute("SELECT * FROM upcoming_events ORDER BY event_date, id").fetchall()),
+    }
+    conn.close()
+
+    # The old scheduler pass ran every 30 minutes; its replacement runs once at startup
+    for name in old:
+        print(f"{name:16} {old[name]:8.1f} ms -> {new[name]:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""/view_events page latency with many recurring series.
+
+Seeds SERIES daily series and ONE_OFFS one-off events, then times events_page()
+walking the first PAGES pages and jumping straight to cursors some days ahead,
+which is what the Next button does deep into a listing. The page cache is cleared
+before every call.
+
+    DISCORD_TOKEN=x python benchmarks/bench_events_page.py [series] [one_offs]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import calebv3  # noqa: E402
+
+SERIES = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+ONE_OFFS = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+PAGES = 30
+CURSOR_DAYS = [1, 3, 10]
+RUNS = 5
+
+
+class Bot:
+    pass
+
+
+async def timed_page(cog, after, page):
+    cog.page_cache.clear()
+    start = time.perf_counter()
+    _, next_start = await cog.events_page(after, page, None, None)
+    return (time.perf_counter() - start) * 1000, next_start
+
+
+async def main():
+    calebv3.DB_PATH = Path(tempfile.mkdtemp()) / "bench.db"
+    cog = calebv3.EventAnnouncer(Bot())
+    cog.db = await calebv3.Database.attach(cog.bot)
+    await cog.init_db()
+
+    rng = random.Random(1)
+    now = int(time.time())
+    daily = str(calebv3.RecurrenceRule.parse("FREQ=DAILY"))
+    rows = [(now + rng.randrange(86400), f"Series {i}", 1, None, daily, None) for i in range(SERIES)]
+    rows += [(now + rng.randrange(365 * 86400), f"Event {i}", 1, None, None, None) for i in range(ONE_OFFS)]
+    start = time.perf_counter()
+    await cog.store_events(rows)
+    print(f"Seeded {SERIES} series and {ONE_OFFS} one-offs in {time.perf_counter() - start:.1f} s")
+
+    after, timings = None, []
+    for page in range(1, PAGES + 1):
+        elapsed, after = await timed_page(cog, after, page)
+        timings.append(elapsed)
+    print(f"{'pages 1-' + str(PAGES):24} first {timings[0]:7.1f} ms   last {timings[-1]:7.1f} ms")
+
+    for days in CURSOR_DAYS:
+        cursor = (now + days * 86400, 0)
+        timings = [(await timed_page(cog, cursor, 2))[0] for _ in range(RUNS)]
+        print(f"{f'cursor {days} days ahead':24} median {statistics.median(timings):7.1f} ms")
+
+    await cog.db.detach()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
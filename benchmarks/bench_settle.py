@@ -0,0 +1,56 @@
+"""settle_debts() on synthetic debt graphs.
+
+Builds random channels of USERS members with EDGES debts (including cycles),
+times settle_debts and checks every member's net balance is unchanged.
+
+    DISCORD_TOKEN=x python benchmarks/bench_settle.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from calebv3 import settle_debts  # noqa: E402
+
+GRAPHS = [(100, 1_000), (1_000, 20_000), (5_000, 100_000), (10_000, 250_000)]
+RUNS = 5
+
+
+def random_debts(users: int, edges: int, rng: random.Random) -> dict:
+    debts = {}
+    while len(debts) < edges:
+        debtor, creditor = rng.randrange(users), rng.randrange(users)
+        if debtor != creditor:
+            debts[(debtor, creditor)] = rng.randint(1, 20)
+    return debts
+
+
+def balances(debts) -> dict:
+    net = {}
+    for (debtor, creditor), amount in debts:
+        net[debtor] = net.get(debtor, 0) - amount
+        net[creditor] = net.get(creditor, 0) + amount
+    return {user: bal for user, bal in net.items() if bal}
+
+
+def main():
+    rng = random.Random(7)
+    for users, edges in GRAPHS:
+        debts = random_debts(users, edges, rng)
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            transfers = settle_debts(debts)
+            timings.append((time.perf_counter() - start) * 1e3)
+        assert balances(debts.items()) == balances(((d, c), amt) for d, c, amt in transfers)
+        assert len(transfers) < users
+        print(f"{users:>6} users / {edges:>7} debts -> {len(transfers):>5} transfers   "
+              f"median {statistics.median(timings):7.1f} ms   max {max(timings):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ All features include both prefix commands (!) and slash commands (/)
 """
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import asyncio
 import aiosqlite
@@ -18,7 +18,19 @@ from pathlib import Path
 from datetime import datetime
 from typing import Optional
 import os
+import random
+import re
+import sys
+import copy
+import json
 import time
+import itertools
+from queue import Empty
+from collections import OrderedDict, deque
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 
 # Use certifi for SSL certificates
 try:
@@ -95,8 +107,496 @@ ffmpeg_options = {
     'options': '-vn -reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -loglevel quiet'
 }
 
+# Streaming reads straight from the remote media URL, so the reconnect flags must be input options
+ffmpeg_stream_options = {
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+    'options': '-vn -loglevel quiet'
+}
+
+# Stream songs instead of downloading them first (per-guild, toggled with /streammode)
+STREAM_BY_DEFAULT = True
+# A stream that stops this many seconds before the song's end failed in FFmpeg (expired URL, 403)
+STREAM_FAILURE_SLACK = 10
+
 ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
 
+# On-disk audio cache, keyed by extractor + video ID and evicted least-recently-used
+AUDIO_CACHE_DIR = Path(__file__).parent / "audio_cache"
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Songs that stream are also downloaded into the cache in the background, this many at once
+AUDIO_CACHE_FILL_CONCURRENCY = 2
+# index.json is rewritten (off the event loop) at most this often
+AUDIO_CACHE_SAVE_DELAY = 5
+
+# yt-dlp extraction runs in its own processes so it can't stall the event loop. At least two,
+# since a playlist listing keeps a worker busy and one is always left for single songs
+EXTRACT_WORKERS = max(2, min(4, (os.cpu_count() or 2) - 1))
+EXTRACT_TIMEOUT = 30
+# Replace each worker process after this many extractions (Python 3.11+)
+EXTRACT_JOBS_PER_WORKER = 50
+
+# yt-dlp metadata cache: how long a query -> song mapping is trusted, and how many are kept
+METADATA_TTL = 6 * 60 * 60
+METADATA_MAX_ENTRIES = 2048
+# Also keep the metadata cache in the bot database so it survives restarts
+METADATA_PERSIST = True
+
+# Prefetch: resolve/download this many upcoming songs while the current one plays
+PREFETCH_AHEAD = 2
+# Max prefetch downloads running at once across all guilds
+PREFETCH_CONCURRENCY = 2
+
+# Playlists are enumerated once (without resolving songs) and queued this many entries at a time
+PLAYLIST_CHUNK = 100
+PLAYLIST_MAX_ENTRIES = 1000
+
+# Music queues are saved to the database (at most this often) so a restart can resume them
+QUEUE_SAVE_INTERVAL = 2
+# After a failed save, wait twice as long before each retry, up to this many seconds
+QUEUE_SAVE_MAX_BACKOFF = 300
+
+
+# ========================= AUDIO CACHE =========================
+
+class AudioCache:
+    """Content-addressed download cache shared by every guild.
+
+    Files are named after their extractor and video ID, so repeat plays of a
+    song skip the download entirely. index.json records size and last use per
+    entry so lookups and eviction never need a directory scan.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = directory / "index.json"
+        # key -> {"file": name, "size": bytes}, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._downloads = {}
+        self._fills = set()
+        self._fill_slots = asyncio.Semaphore(AUDIO_CACHE_FILL_CONCURRENCY)
+        self._save_handle = None
+        self._saving = None
+        self._load()
+
+    @staticmethod
+    def key(data):
+        return re.sub(r'[^\w.-]', '_', f"{data.get('extractor_key') or data.get('extractor')}-{data['id']}")
+
+    def _load(self):
+        self.directory.mkdir(exist_ok=True)
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = []
+        for key, entry in saved:
+            if (self.directory / entry["file"]).exists():
+                self.entries[key] = entry
+                self.total_bytes += entry["size"]
+
+    def save(self):
+        """Write index.json now (at shutdown)"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self._write_index(list(self.entries.items()))
+
+    def _write_index(self, entries):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _schedule_save(self):
+        # Lookups only reorder the LRU list, so one write covers every change in the window
+        if self._save_handle is None:
+            self._save_handle = asyncio.get_running_loop().call_later(AUDIO_CACHE_SAVE_DELAY, self._start_save)
+
+    def _start_save(self):
+        self._save_handle = None
+        if self._saving is not None and not self._saving.done():
+            return self._schedule_save()  # Previous write still running; don't race it on the temp file
+        loop = asyncio.get_running_loop()
+        self._saving = loop.run_in_executor(None, self._write_index, list(self.entries.items()))
+        self._saving.add_done_callback(self._save_done)
+
+    @staticmethod
+    def _save_done(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"[Music] Failed to save audio cache index: {future.exception()}")
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def lookup(self, key):
+        """Path of a cached song (marking it recently used), or None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_saved += entry["size"]
+        self._schedule_save()
+        return str(self.directory / entry["file"])
+
+    def fill(self, key, data, *, loop, query=None):
+        """Download a song that is being streamed into the cache in the background.
+
+        Pass the full info_dict as data, or None and the query to extract it from.
+        """
+        if key in self.entries or key in self._downloads:
+            return
+        
+        async def fill():
+            async with self._fill_slots:
+                if key in self.entries:
+                    return  # Another fill got there while this one waited
+                try:
+                    info = data if data is not None else await metadata_cache.extract(query, loop=loop)
+                    # yt-dlp fills in the info_dict it downloads from; the stream keeps using the original
+                    await self.fetch(key, copy.deepcopy(info), loop=loop)
+                except Exception as e:
+                    print(f"[Music] Background download of {key} failed: {e}")
+        
+        task = asyncio.ensure_future(fill())
+        self._fills.add(task)
+        task.add_done_callback(self._fills.discard)
+
+    async def fetch(self, key, data, *, loop):
+        """Download a song into the cache, sharing one download between concurrent callers"""
+        job = self._downloads.get(key)
+        if job is None:
+            job = self._downloads[key] = asyncio.ensure_future(self._download(key, data, loop))
+            job.add_done_callback(lambda _: self._downloads.pop(key, None))
+        return await asyncio.shield(job)
+
+    async def _download(self, key, data, loop):
+        def download():
+            info = ytdl.process_ie_result(data, download=True)
+            downloads = info.get('requested_downloads') or [info]
+            return downloads[0].get('filepath') or ytdl.prepare_filename(info)
+        
+        downloaded = await loop.run_in_executor(None, download)
+        name = key + Path(downloaded).suffix
+        os.replace(downloaded, self.directory / name)
+        
+        size = (self.directory / name).stat().st_size
+        self.entries[key] = {"file": name, "size": size}
+        self.total_bytes += size
+        self._evict()
+        self._schedule_save()
+        return str(self.directory / name)
+
+    def _evict(self):
+        # Least recently used first, never the song just added
+        for key in list(self.entries)[:-1]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            entry = self.entries[key]
+            try:
+                os.remove(self.directory / entry["file"])
+            except FileNotFoundError:
+                pass  # Already gone; just drop it from the index
+            except OSError:
+                continue  # Still open by FFmpeg on Windows; keep it indexed and retry on the next eviction
+            del self.entries[key]
+            self.total_bytes -= entry["size"]
+
+
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+
+
+# ========================= EXTRACTION WORKERS =========================
+
+# Each worker process builds its own YoutubeDL once and reuses it for every job
+_worker_ytdl = None
+_worker_flat_ytdl = None
+
+def _init_extract_worker():
+    global _worker_ytdl, _worker_flat_ytdl
+    _worker_ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
+    # Lists playlist entries without extracting each video
+    _worker_flat_ytdl = yt_dlp.YoutubeDL({**ytdl_format_options, 'noplaylist': False, 'extract_flat': 'in_playlist'})
+
+def _warm_extract_worker():
+    return os.getpid()
+
+def _extract_in_worker(query):
+    data = _worker_ytdl.extract_info(query, download=False)
+    # Only plain JSON-able data can travel back to the bot process
+    return _worker_ytdl.sanitize_info(data) if data is not None else None
+
+def _playlist_entries(url):
+    """The playlist's entries as yt-dlp lists them: lazily, page by page as they're iterated"""
+    data = _worker_flat_ytdl.extract_info(url, download=False, process=False)
+    # Some URLs only redirect to the canonical playlist page
+    for _ in range(3):
+        if data is None or data.get('_type') != 'url':
+            break
+        data = _worker_flat_ytdl.extract_info(data['url'], ie_key=data.get('ie_key'), download=False, process=False)
+    entries = (data or {}).get('entries') or []
+    if isinstance(entries, yt_dlp.utils.PagedList):
+        entries = itertools.chain.from_iterable(
+            itertools.takewhile(bool, (entries.getslice(start, start + PLAYLIST_CHUNK)
+                                       for start in itertools.count(0, PLAYLIST_CHUNK)))
+        )
+    return entries
+
+def _stream_playlist_in_worker(url, chunks, stop, chunk_size, max_entries):
+    """Enumerate a playlist once, putting lists of entries on chunks as they come; None marks the end"""
+    try:
+        chunk = []
+        for entry in itertools.islice(_playlist_entries(url), max_entries):
+            if stop.is_set():
+                return
+            if entry:
+                chunk.append({'url': entry.get('url') or entry.get('webpage_url'),
+                              'title': entry.get('title'), 'duration': entry.get('duration')})
+            if len(chunk) == chunk_size:
+                chunks.put(chunk)
+                chunk = []
+        if chunk:
+            chunks.put(chunk)
+    except Exception as e:
+        chunks.put(str(e))
+    finally:
+        chunks.put(None)
+
+
+class ExtractionPool:
+    """Size-bounded process pool of pre-warmed yt-dlp workers.
+
+    Extraction is CPU-heavy Python that holds the GIL, so running it on the
+    default thread pool stalls the gateway and voice heartbeats. Jobs wait in
+    an asyncio queue for a free worker, time out after EXTRACT_TIMEOUT, and a
+    stuck or crashed pool is replaced.
+    """
+
+    def __init__(self, workers: int, timeout: float, jobs_per_worker: int):
+        self.workers = workers
+        self.timeout = timeout
+        self.jobs_per_worker = jobs_per_worker
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(workers)
+        # Playlist listings may use all but one worker, so song lookups never wait behind them
+        self._listing_slots = asyncio.Semaphore(max(1, workers - 1))
+        # Serves the queues playlist listings are streamed back through; started on first use
+        self._manager = None
+
+    def start(self):
+        # spawn: forking a process that already runs the bot's threads isn't safe
+        options = {"mp_context": multiprocessing.get_context("spawn"), "initializer": _init_extract_worker}
+        if sys.version_info >= (3, 11):
+            options["max_tasks_per_child"] = self.jobs_per_worker
+        self._pool = ProcessPoolExecutor(self.workers, **options)
+        for _ in range(self.workers):
+            self._pool.submit(_warm_extract_worker)
+        print(f"[Music] Started {self.workers} extraction workers")
+
+    def shutdown(self):
+        self._stop_pool()
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def _stop_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def recycle(self, pool: ProcessPoolExecutor):
+        """Replace a broken or stuck pool, killing its workers"""
+        if self._pool is not pool:
+            return  # Already replaced by another job
+        # ProcessPoolExecutor can't cancel a running job, so terminate its processes directly
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        self._stop_pool()
+        self.start()
+
+    async def extract(self, query: str) -> Optional[dict]:
+        return await self.run(_extract_in_worker, query)
+
+    async def stream_playlist(self, url: str, chunk_size: int, max_entries: int):
+        """Flat entries (url, title, duration) of a playlist, yielded chunk_size at a time.
+
+        One worker walks yt-dlp's lazy entry list once, so each page of the
+        playlist is fetched a single time however long it is. The worker is
+        busy until the listing ends, so it holds an extraction slot for as long;
+        at most workers - 1 listings run at once.
+        """
+        async with self._listing_slots, self._slots:
+            if self._pool is None:
+                self.start()
+            loop = asyncio.get_running_loop()
+            if self._manager is None:
+                self._manager = await loop.run_in_executor(None, multiprocessing.get_context("spawn").Manager)
+            pool = self._pool
+            chunks, stop = self._manager.Queue(), self._manager.Event()
+            pool.submit(_stream_playlist_in_worker, url, chunks, stop, chunk_size, max_entries)
+            try:
+                while True:
+                    try:
+                        chunk = await loop.run_in_executor(None, chunks.get, True, self.timeout)
+                    except Empty:
+                        self.recycle(pool)
+                        raise Exception(f"Timed out listing `{url}`")
+                    if chunk is None:
+                        return
+                    if isinstance(chunk, str):
+                        raise Exception(chunk)
+                    yield chunk
+            finally:
+                try:
+                    stop.set()  # Stops the listing early if the caller gave up on it
+                except (OSError, EOFError):
+                    pass  # Manager already shut down with the cog
+
+    async def run(self, func, *args):
+        async with self._slots:
+            for attempt in range(2):
+                if self._pool is None:
+                    self.start()
+                pool = self._pool
+                try:
+                    return await asyncio.wait_for(asyncio.wrap_future(pool.submit(func, *args)), self.timeout)
+                except asyncio.TimeoutError:
+                    self.recycle(pool)
+                    raise Exception(f"Timed out looking up `{args[0]}`")
+                except BrokenProcessPool:
+                    # A worker died (or was recycled under us); retry once on a fresh pool
+                    self.recycle(pool)
+                    if attempt:
+                        raise Exception("Extraction worker crashed, please try again.")
+
+
+extract_pool = ExtractionPool(EXTRACT_WORKERS, EXTRACT_TIMEOUT, EXTRACT_JOBS_PER_WORKER)
+
+
+def is_playlist_url(query: str) -> bool:
+    """A playlist link (not a single video that happens to be played from a playlist)"""
+    parsed = urlparse(query.strip())
+    if parsed.scheme not in ("http", "https"):
+        return False
+    params = parse_qs(parsed.query)
+    return ('list' in params and 'v' not in params) or '/playlist' in parsed.path or '/sets/' in parsed.path
+
+
+# ========================= METADATA CACHE =========================
+
+class MetadataCache:
+    """TTL cache from normalized search queries / URLs to the info_dict fields playback needs.
+
+    Repeated or concurrent requests for the same query share one yt-dlp
+    extraction. Entries keep the direct format URL together with its expiry,
+    so streaming can reuse it until YouTube invalidates it.
+    """
+
+    FIELDS = ('id', 'title', 'duration', 'url', 'extractor', 'extractor_key', 'webpage_url')
+
+    def __init__(self, ttl: float, max_entries: int, db_path: Optional[Path] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.db_path = db_path
+        # normalized query -> info subset (plus 'expires_at' / 'url_expires_at')
+        self.entries = OrderedDict()
+        self._extracting = {}
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        query = query.strip()
+        if query.startswith(("http://", "https://")):
+            return query
+        return " ".join(query.casefold().split())
+
+    def get(self, query: str) -> Optional[dict]:
+        key = self.normalize(query)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires_at'] < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    @staticmethod
+    def stream_url_valid(entry: dict) -> bool:
+        return bool(entry.get('url')) and entry['url_expires_at'] > time.time() + 60
+
+    async def extract(self, query: str, *, loop) -> dict:
+        """Run a full yt-dlp extraction for a query (once, however many callers ask) and cache it"""
+        key = self.normalize(query)
+        job = self._extracting.get(key)
+        if job is None:
+            job = self._extracting[key] = asyncio.ensure_future(self._extract(query, key, loop))
+            job.add_done_callback(lambda _: self._extracting.pop(key, None))
+        return await asyncio.shield(job)
+
+    async def _extract(self, query: str, key: str, loop) -> dict:
+        data = await extract_pool.extract(query)
+        if data is None:
+            raise Exception("Could not retrieve information from the provided URL.")
+        if 'entries' in data:
+            data = data['entries'][0]
+        await self.put(key, data)
+        return data
+
+    async def put(self, key: str, data: dict):
+        now = time.time()
+        entry = {field: data.get(field) for field in self.FIELDS}
+        entry['expires_at'] = now + self.ttl
+        # YouTube format URLs carry their own expiry timestamp
+        expire = parse_qs(urlparse(entry['url'] or "").query).get('expire')
+        entry['url_expires_at'] = float(expire[0]) if expire else now + self.ttl
+        
+        # The resolved page URL is also a valid lookup for the same song
+        keys = {key, entry['webpage_url']} - {None}
+        for k in keys:
+            self.entries[k] = entry
+            self.entries.move_to_end(k)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        
+        if self.db_path is not None:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.executemany(
+                    "INSERT OR REPLACE INTO ytdl_metadata (query, info, expires_at) VALUES (?, ?, ?)",
+                    [(k, json.dumps(entry), entry['expires_at']) for k in keys]
+                )
+                await db.commit()
+
+    async def load(self):
+        """Create the persistence table and load unexpired entries from it"""
+        if self.db_path is None:
+            return
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS ytdl_metadata (
+                    query TEXT PRIMARY KEY,
+                    info TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            await db.execute("DELETE FROM ytdl_metadata WHERE expires_at < ?", (time.time(),))
+            await db.commit()
+            cursor = await db.execute(
+                "SELECT query, info FROM ytdl_metadata ORDER BY expires_at DESC LIMIT ?", (self.max_entries,)
+            )
+            for query, info in reversed(await cursor.fetchall()):
+                self.entries[query] = json.loads(info)
+
+
+metadata_cache = MetadataCache(METADATA_TTL, METADATA_MAX_ENTRIES, DB_PATH if METADATA_PERSIST else None)
+
 
 # ========================= YOUTUBE SOURCE =========================
 
@@ -109,14 +609,54 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.filename = filename
 
     @classmethod
-    async def create_source(cls, url, *, loop, stream=False):
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=True))
-        if data is None:
-            raise Exception("Could not retrieve information from the provided URL.")
-        if 'entries' in data:
-            data = data['entries'][0]
-        filename = ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data, filename=filename)
+    async def resolve(cls, url, *, loop, stream=False):
+        """Extract a song without starting FFmpeg. Returns (data, filename).
+
+        Cached songs always play from disk. Otherwise, with stream=True
+        data['url'] is the direct media URL and filename is None, and the song
+        is downloaded into the cache in the background for the next play.
+        """
+        cached = metadata_cache.get(url)
+        if cached is not None:
+            filename = audio_cache.lookup(AudioCache.key(cached))
+            if filename is not None:
+                return cached, filename
+            if stream and metadata_cache.stream_url_valid(cached):
+                # The cached entry is only a subset of the info_dict; the fill extracts the rest
+                audio_cache.fill(AudioCache.key(cached), None, loop=loop, query=url)
+                return cached, None
+            # Downloading (or refreshing an expired stream URL) needs the full info_dict
+            data = await metadata_cache.extract(url, loop=loop)
+        else:
+            data = await metadata_cache.extract(url, loop=loop)
+            filename = audio_cache.lookup(AudioCache.key(data))
+            if filename is not None:
+                return data, filename
+        
+        if stream:
+            # Play straight away, and have the file on disk for the next time it's played
+            audio_cache.fill(AudioCache.key(data), data, loop=loop)
+            return data, None
+        return data, await audio_cache.fetch(AudioCache.key(data), data, loop=loop)
+
+    @classmethod
+    def from_resolved(cls, data, filename, start=0):
+        """Build the FFmpeg source, optionally starting `start` seconds in"""
+        options = ffmpeg_stream_options if filename is None else ffmpeg_options
+        if start:
+            options = {**options, 'before_options': f"{options.get('before_options', '')} -ss {start:.1f}".strip()}
+        return cls(discord.FFmpegPCMAudio(filename or data['url'], **options), data=data, filename=filename)
+
+    @classmethod
+    async def create_source(cls, url, *, loop, stream=False, start=0):
+        if stream:
+            try:
+                data, filename = await cls.resolve(url, loop=loop, stream=True)
+                return cls.from_resolved(data, filename, start)
+            except Exception as e:
+                print(f"[Music] Streaming failed, falling back to download: {e}")
+        data, filename = await cls.resolve(url, loop=loop)
+        return cls.from_resolved(data, filename, start)
 
 
 # ========================= ROLE ASSIGNMENT COG =========================
@@ -521,6 +1061,225 @@ class DrinkCounter(commands.Cog):
         await interaction.response.send_message(embed=embed)
 
 
+# ========================= MUSIC QUEUE =========================
+
+LOOP_MODES = ("off", "track", "queue")
+
+
+def format_duration(seconds) -> str:
+    seconds = int(seconds or 0)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+
+class Track:
+    """One queued song. Title/duration are filled in as soon as they're known"""
+    __slots__ = ('url', 'title', 'duration', 'requester_id', 'download', 'seq')
+
+    def __init__(self, url: str, title: Optional[str] = None, duration: Optional[float] = None, requester_id: Optional[int] = None):
+        self.url = url
+        self.title = title
+        self.duration = duration
+        self.requester_id = requester_id
+        # Set once streaming this track has failed, so it is downloaded from then on
+        self.download = False
+        # Sort key of this track's saved row, set by the queue holding it
+        self.seq = None
+        if title is None:
+            cached = metadata_cache.get(url)
+            if cached is not None:
+                self.title, self.duration = cached['title'], cached['duration']
+
+    def update(self, data: dict):
+        self.title = data.get('title') or self.title
+        self.duration = data.get('duration') or self.duration
+
+    def label(self) -> str:
+        duration = f" `{format_duration(self.duration)}`" if self.duration else ""
+        return f"{self.title or self.url}{duration}"
+
+
+class GuildQueue:
+    """Upcoming tracks for one guild plus the one playing now.
+
+    Backed by a deque so taking the next song is O(1); positions used by the
+    commands are 1-based. Every track carries a sort key (seq) for its saved
+    row, and each change records the rows it inserts or deletes in `changes`,
+    so saving a queue writes only what changed rather than the whole queue.
+    """
+
+    def __init__(self):
+        self.tracks = deque()
+        self.current: Optional[Track] = None
+        self.loop = "off"
+        # Set by skip so a looped track still moves on
+        self.skipping = False
+        # Bumped on every change so the saver knows to update the session row
+        self.version = 0
+        # Row changes not saved yet: ("insert", track), ("delete", seq), or ("reset",) to rewrite them all
+        self.changes = []
+        # Monotonic time the current track would have been at 0:00, and when it was paused
+        self.started_at: Optional[float] = None
+        self.paused_at: Optional[float] = None
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __bool__(self):
+        return bool(self.tracks)
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    def head(self, count: int) -> list:
+        return [track for _, track in zip(range(count), self.tracks)]
+
+    def _record(self, change: tuple):
+        self.changes.append(change)
+        # A long unsaved backlog (nobody listening, or the database is down) is cheaper rewritten
+        if len(self.changes) > 2 * len(self.tracks) + 16:
+            self.changes = [("reset",)]
+
+    def _renumber(self):
+        for seq, track in enumerate(self.tracks):
+            track.seq = seq
+        self.changes = [("reset",)]
+
+    def append(self, track: Track):
+        track.seq = self.tracks[-1].seq + 1 if self.tracks else 0
+        self.tracks.append(track)
+        self._record(("insert", track))
+        self.version += 1
+
+    def appendleft(self, track: Track):
+        track.seq = self.tracks[0].seq - 1 if self.tracks else 0
+        self.tracks.appendleft(track)
+        self._record(("insert", track))
+        self.version += 1
+
+    def extend(self, tracks):
+        for track in tracks:
+            self.append(track)
+
+    def _popleft(self) -> Track:
+        track = self.tracks.popleft()
+        self._record(("delete", track.seq))
+        return track
+
+    def next(self) -> Optional[Track]:
+        """Advance to the next track to play, honouring the loop mode"""
+        finished, skipped = self.current, self.skipping
+        self.skipping = False
+        self.version += 1
+        self.started_at = self.paused_at = None
+        if finished is not None:
+            if self.loop == "track" and not skipped:
+                return finished
+            if self.loop == "queue":
+                self.append(finished)
+        self.current = self._popleft() if self.tracks else None
+        return self.current
+
+    def play_now(self, track: Track) -> Track:
+        """Make track current straight away (nothing was playing)"""
+        self.appendleft(track)
+        self.skipping = True
+        return self.next()
+
+    def requeue_current(self):
+        """Put the current track back at the front of the queue, to be played again"""
+        if self.current is not None:
+            self.appendleft(self.current)
+            self.current = None
+            self.started_at = self.paused_at = None
+
+    def remove(self, position: int) -> Track:
+        track = self.tracks[position - 1]
+        del self.tracks[position - 1]
+        self._record(("delete", track.seq))
+        self.version += 1
+        return track
+
+    def move(self, source: int, destination: int) -> Track:
+        track = self.remove(source)
+        self.tracks.insert(destination - 1, track)
+        # Its new key falls between its neighbours', so no other row changes
+        before = self.tracks[destination - 2].seq if destination > 1 else None
+        after = self.tracks[destination].seq if destination < len(self.tracks) else None
+        if before is None and after is None:
+            track.seq = 0
+        elif before is None:
+            track.seq = after - 1
+        elif after is None:
+            track.seq = before + 1
+        else:
+            track.seq = (before + after) / 2
+            if not before < track.seq < after:
+                self._renumber()  # Out of float precision between these two
+                return track
+        self._record(("insert", track))
+        return track
+
+    def shuffle(self):
+        tracks = list(self.tracks)
+        random.shuffle(tracks)
+        self.tracks = deque(tracks)
+        self._renumber()
+        self.version += 1
+
+    def clear(self):
+        self.tracks.clear()
+        self.changes = [("reset",)]
+        self.version += 1
+
+    def set_loop(self, mode: str):
+        self.loop = mode
+        self.version += 1
+
+    def mark_started(self, offset: float = 0.0):
+        self.started_at = time.monotonic() - offset
+        self.paused_at = None
+
+    def mark_paused(self):
+        if self.started_at is not None and self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def mark_resumed(self):
+        if self.paused_at is not None:
+            self.started_at += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def position(self) -> float:
+        """Seconds into the current track"""
+        if self.started_at is None:
+            return 0.0
+        return (self.paused_at or time.monotonic()) - self.started_at
+
+    def remaining(self) -> tuple:
+        """(seconds left including the current track, number of tracks with unknown length)"""
+        tracks = [self.current, *self.tracks] if self.current else self.tracks
+        known = [t.duration for t in tracks if t.duration]
+        return sum(known), len(tracks) - len(known)
+
+    def describe(self, limit: int = 10) -> str:
+        if not self.tracks and self.current is None:
+            return "Queue is empty."
+        lines = []
+        if self.current is not None:
+            lines.append(f"▶️ Now: {self.current.label()}")
+        lines += [f"{i}. {track.label()}" for i, track in enumerate(self.head(limit), 1)]
+        if len(self.tracks) > limit:
+            lines.append(f"...and {len(self.tracks) - limit} more")
+        seconds, unknown = self.remaining()
+        total = f"⏱️ {len(self.tracks)} queued, {format_duration(seconds)} remaining"
+        if unknown:
+            total += f" (+{unknown} of unknown length)"
+        if self.loop != "off":
+            total += f" | 🔁 loop {self.loop}"
+        return "📜 Queue:\n" + "\n".join(lines) + "\n" + total
+
+
 # ========================= MUSIC COG =========================
 
 class Music(commands.Cog):
@@ -528,41 +1287,391 @@ class Music(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        # guild_id -> GuildQueue
         self.queues = {}
         self.last_connection_attempt = {}
+        # guild_id -> [(track, task), ...] lined up with the head of that guild's queue
+        self.prefetched = {}
+        self.prefetch_semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+        # guild_id -> True to stream, False to download first
+        self.stream_mode = {}
+        # guild_id -> tasks still enumerating playlists into that guild's queue
+        self.playlist_loaders = {}
+        # guild_id -> text channel "Now playing" messages go to (saved with the queue)
+        self.text_channels = {}
+        # guild_id -> GuildQueue.version last written to the database, and the queue it was
+        self.saved_versions = {}
+        self.saved_queues = {}
+        self.save_failures = 0
+        self.save_retry_at = 0.0
+        self.restored = False
+    
+    async def cog_load(self):
+        extract_pool.start()
+        await metadata_cache.load()
+        await self.init_db()
+        self.save_queues.start()
+        print(f"[Music] Cog loaded! {len(metadata_cache.entries)} cached song lookups")
+    
+    async def cog_unload(self):
+        self.save_queues.cancel()
+        extract_pool.shutdown()
+        audio_cache.save()
+    
+    async def init_db(self):
+        async with aiosqlite.connect(DB_PATH) as db:
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS music_sessions (
+                    guild_id INTEGER PRIMARY KEY,
+                    voice_channel_id INTEGER NOT NULL,
+                    text_channel_id INTEGER,
+                    loop_mode TEXT NOT NULL DEFAULT 'off',
+                    stream INTEGER,
+                    current_url TEXT,
+                    current_title TEXT,
+                    current_duration REAL,
+                    current_requester_id INTEGER,
+                    position REAL NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS music_queue_tracks (
+                    guild_id INTEGER NOT NULL,
+                    seq REAL NOT NULL,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    duration REAL,
+                    requester_id INTEGER,
+                    PRIMARY KEY (guild_id, seq)
+                ) WITHOUT ROWID
+            """)
+            await db.commit()
+    
+    def is_streaming(self, guild_id, track: Optional[Track] = None):
+        if track is not None and track.download:
+            return False
+        return self.stream_mode.get(guild_id, STREAM_BY_DEFAULT)
+    
+    def queue_for(self, guild_id) -> GuildQueue:
+        if guild_id not in self.queues:
+            self.queues[guild_id] = GuildQueue()
+        return self.queues[guild_id]
+    
+    # ===== PREFETCH =====
+    
+    def prefetch(self, guild_id):
+        """Start resolving the next PREFETCH_AHEAD queued songs in the background"""
+        window = self.queues[guild_id].head(PREFETCH_AHEAD) if guild_id in self.queues else []
+        pending = self.prefetched.setdefault(guild_id, [])
+        
+        keep = 0
+        while keep < min(len(pending), len(window)) and pending[keep][0] is window[keep]:
+            keep += 1
+        for _, task in pending[keep:]:
+            task.cancel()
+        del pending[keep:]
+        
+        for track in window[keep:]:
+            pending.append((track, asyncio.create_task(self._prefetch_one(track, self.is_streaming(guild_id, track)))))
+    
+    async def _prefetch_one(self, track, stream):
+        async with self.prefetch_semaphore:
+            # Downloads land in the audio cache, so a cancelled prefetch still isn't wasted
+            data, filename = await YTDLSource.resolve(track.url, loop=self.bot.loop, stream=stream)
+            track.update(data)
+            return data, filename
+    
+    def cancel_prefetch(self, guild_id):
+        for _, task in self.prefetched.pop(guild_id, []):
+            task.cancel()
+    
+    # ===== QUEUE PERSISTENCE =====
+    
+    @tasks.loop(seconds=QUEUE_SAVE_INTERVAL)
+    async def save_queues(self):
+        """Save queue changes, backing off while the database keeps failing"""
+        if time.monotonic() < self.save_retry_at:
+            return
+        try:
+            await self.write_queues()
+        except Exception as e:
+            self.save_failures += 1
+            delay = min(QUEUE_SAVE_MAX_BACKOFF, QUEUE_SAVE_INTERVAL * 2 ** self.save_failures)
+            self.save_retry_at = time.monotonic() + delay
+            print(f"[Music] Failed to save queues, retrying in {delay}s: {e}")
+        else:
+            self.save_failures = 0
+    
+    async def write_queues(self):
+        """Write the rows each queue changed since the last save, and the play position of the rest.
+
+        Changes are batched per QUEUE_SAVE_INTERVAL rather than written from the
+        queue methods themselves, which are synchronous; a queue the saver
+        hasn't written before (or that was shuffled or cleared) is rewritten whole.
+        """
+        sessions, positions, rewrites, deletes, inserts, active, saved = [], [], [], [], [], set(), []
+        now = time.time()
+        # Snapshot everything before the first await so each queue is saved consistently
+        for guild_id, queue in self.queues.items():
+            guild = self.bot.get_guild(guild_id)
+            voice_client = guild.voice_client if guild else None
+            if voice_client is None or voice_client.channel is None or (queue.current is None and not queue):
+                continue
+            active.add(guild_id)
+            if self.saved_versions.get(guild_id) == queue.version and self.saved_queues.get(guild_id) is queue:
+                if queue.current is not None:
+                    positions.append((queue.position(), now, guild_id))
+                continue
+            current = queue.current
+            sessions.append((
+                guild_id, voice_client.channel.id, self.text_channels.get(guild_id), queue.loop,
+                self.stream_mode.get(guild_id),
+                *((current.url, current.title, current.duration, current.requester_id) if current else (None,) * 4),
+                queue.position(), now
+            ))
+            
+            changes = queue.changes
+            if self.saved_queues.get(guild_id) is not queue or any(change[0] == "reset" for change in changes):
+                rewrites.append((guild_id,))
+                inserts.extend(self.track_row(guild_id, track) for track in queue)
+            else:
+                # Net effect per row, so an insert followed by its delete writes nothing
+                net = {}
+                for change in changes:
+                    if change[0] == "insert":
+                        net[change[1].seq] = self.track_row(guild_id, change[1])
+                    else:
+                        net[change[1]] = None
+                deletes.extend((guild_id, seq) for seq, values in net.items() if values is None)
+                inserts.extend(values for values in net.values() if values is not None)
+            saved.append((guild_id, queue, changes, len(changes), queue.version))
+        removed = [guild_id for guild_id in self.saved_versions if guild_id not in active]
+        if not (sessions or positions or removed):
+            return
+        
+        async with aiosqlite.connect(DB_PATH) as db:
+            await db.executemany("DELETE FROM music_queue_tracks WHERE guild_id = ?", [*rewrites, *((g,) for g in removed)])
+            await db.executemany("DELETE FROM music_sessions WHERE guild_id = ?", [(g,) for g in removed])
+            await db.executemany("DELETE FROM music_queue_tracks WHERE guild_id = ? AND seq = ?", deletes)
+            await db.executemany("INSERT OR REPLACE INTO music_queue_tracks VALUES (?, ?, ?, ?, ?, ?)", inserts)
+            await db.executemany("INSERT OR REPLACE INTO music_sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", sessions)
+            await db.executemany("UPDATE music_sessions SET position = ?, updated_at = ? WHERE guild_id = ?", positions)
+            await db.commit()
+        
+        for guild_id in removed:
+            self.saved_versions.pop(guild_id, None)
+            self.saved_queues.pop(guild_id, None)
+        for guild_id, queue, changes, count, version in saved:
+            # Changes made while writing stay queued; a reset replaced the list, and its rewrite covers them
+            if queue.changes is changes:
+                del changes[:count]
+            self.saved_queues[guild_id] = queue
+            self.saved_versions[guild_id] = version
+    
+    @staticmethod
+    def track_row(guild_id, track):
+        return (guild_id, track.seq, track.url, track.title, track.duration, track.requester_id)
+    
+    async def restore_sessions(self):
+        """Rejoin voice and resume every queue that was playing when the bot last stopped"""
+        if self.restored:
+            return
+        self.restored = True
+        async with aiosqlite.connect(DB_PATH) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("SELECT * FROM music_sessions")
+            sessions = await cursor.fetchall()
+            cursor = await db.execute("SELECT * FROM music_queue_tracks ORDER BY guild_id, seq")
+            saved_tracks = {}
+            for row in await cursor.fetchall():
+                saved_tracks.setdefault(row['guild_id'], []).append(
+                    Track(row['url'], row['title'], row['duration'], row['requester_id'])
+                )
+        
+        dropped = []
+        for session in sessions:
+            guild_id = session['guild_id']
+            try:
+                resumed = await self.restore_session(session, saved_tracks.get(guild_id, []))
+            except Exception as e:
+                print(f"[Music] Could not resume queue in guild {guild_id}: {e}")
+                resumed = False
+            if not resumed:
+                dropped.append((guild_id,))
+        
+        if dropped:
+            async with aiosqlite.connect(DB_PATH) as db:
+                await db.executemany("DELETE FROM music_queue_tracks WHERE guild_id = ?", dropped)
+                await db.executemany("DELETE FROM music_sessions WHERE guild_id = ?", dropped)
+                await db.commit()
+        print(f"[Music] Resumed {len(sessions) - len(dropped)}/{len(sessions)} saved queues")
+    
+    async def restore_session(self, session, tracks) -> bool:
+        guild = self.bot.get_guild(session['guild_id'])
+        if guild is None or guild.voice_client is not None:
+            return False
+        voice_channel = guild.get_channel(session['voice_channel_id'])
+        text_channel = guild.get_channel(session['text_channel_id'] or 0)
+        if voice_channel is None or text_channel is None:
+            return False
+        if not any(not m.bot for m in voice_channel.members):
+            return False  # Nobody left to listen
+        
+        guild_id = guild.id
+        queue = GuildQueue()
+        queue.loop = session['loop_mode']
+        queue.extend(tracks)
+        self.queues[guild_id] = queue
+        self.text_channels[guild_id] = text_channel.id
+        if session['stream'] is not None:
+            self.stream_mode[guild_id] = bool(session['stream'])
+        
+        voice_client = await voice_channel.connect(timeout=60.0, reconnect=True, self_deaf=True)
+        if session['current_url'] is None:
+            await self.play_next(text_channel)
+            return True
+        
+        track = queue.play_now(Track(
+            session['current_url'], session['current_title'],
+            session['current_duration'], session['current_requester_id']
+        ))
+        position = session['position']
+        source = await self.next_source(guild_id, track, start=position)
+        voice_client.play(source, after=self.after_play(text_channel, queue, track, source))
+        queue.mark_started(position)
+        self.prefetch(guild_id)
+        await text_channel.send(f"🔁 Resumed **{source.title}** from {format_duration(position)} after a restart")
+        return True
+    
+    # ===== PLAYLISTS =====
+    
+    async def enqueue_playlist(self, guild_id, url, requester_id=None):
+        """Queue the first chunk of a playlist now and keep listing the rest in the background.
+
+        Entries are queued as tracks carrying only what the listing gave us;
+        like any queued song they are only resolved once the prefetch window
+        reaches them. Playlists added while another is still loading load
+        alongside it. Returns (songs queued so far, whether more are coming).
+        """
+        queue = self.queue_for(guild_id)
+        chunks = extract_pool.stream_playlist(url, PLAYLIST_CHUNK, PLAYLIST_MAX_ENTRIES)
+        try:
+            entries = await chunks.__anext__()
+        except StopAsyncIteration:
+            entries = []
+        except BaseException:
+            await chunks.aclose()
+            raise
+        queue.extend(self.playlist_tracks(entries, requester_id))
+        more = len(entries) == PLAYLIST_CHUNK
+        if more:
+            task = asyncio.create_task(self._load_playlist_rest(guild_id, queue, url, chunks, requester_id))
+            self.playlist_loaders.setdefault(guild_id, set()).add(task)
+        else:
+            await chunks.aclose()
+        self.prefetch(guild_id)
+        return len(entries), more
+    
+    @staticmethod
+    def playlist_tracks(entries, requester_id):
+        return [Track(e['url'], e['title'], e['duration'], requester_id) for e in entries if e['url']]
+    
+    async def _load_playlist_rest(self, guild_id, queue, url, chunks, requester_id):
+        try:
+            async for entries in chunks:
+                if self.queues.get(guild_id) is not queue:
+                    return  # Queue was cleared (left / rejoined) while we were listing
+                queue.extend(self.playlist_tracks(entries, requester_id))
+                self.prefetch(guild_id)
+            print(f"[Music] Finished queueing playlist {url}")
+        except Exception as e:
+            print(f"[Music] Stopped queueing playlist {url}: {e}")
+        finally:
+            await chunks.aclose()
+            loaders = self.playlist_loaders.get(guild_id)
+            if loaders is not None:
+                loaders.discard(asyncio.current_task())
+                if not loaders:
+                    del self.playlist_loaders[guild_id]
+    
+    def cancel_playlist(self, guild_id):
+        """Stop every playlist still loading into a guild's queue"""
+        for task in self.playlist_loaders.pop(guild_id, ()):
+            task.cancel()
+    
+    async def next_source(self, guild_id, track, start=0):
+        """Build the source for a track just taken off the queue, using its prefetch if ready"""
+        pending = self.prefetched.get(guild_id)
+        if pending and pending[0][0] is track:
+            _, task = pending.pop(0)
+            try:
+                data, filename = await task
+                if filename is None or os.path.exists(filename):
+                    return YTDLSource.from_resolved(data, filename, start)
+            except Exception:
+                pass  # Fall back to a fresh attempt below
+        source = await YTDLSource.create_source(track.url, loop=self.bot.loop, stream=self.is_streaming(guild_id, track), start=start)
+        track.update(source.data)
+        return source
+    
+    def after_play(self, ctx_or_interaction, queue, track, source):
+        """The voice client's after callback: play the next song, or retry a stream that died.
+
+        FFmpeg failures (an expired stream URL, a 403) don't raise anywhere we
+        could catch them; the song just ends early. Such a track goes back to
+        the front of the queue and is downloaded instead.
+        
+        discord.py calls this from its audio thread, so all of it is handed to
+        the event loop rather than touching the queue there.
+        """
+        guild_id = ctx_or_interaction.guild.id
+        
+        def finished(error):
+            position = queue.position()
+            if (source.filename is None and self.queues.get(guild_id) is queue and queue.current is track
+                    and not queue.skipping and (error is not None or (
+                        track.duration and position < track.duration - STREAM_FAILURE_SLACK))):
+                print(f"[Music] Stream of {track.url} stopped at {format_duration(position)} "
+                      f"({error or 'ended early'}), retrying as a download")
+                track.download = True
+                queue.requeue_current()
+                self.bot.loop.create_task(self.play_next(ctx_or_interaction, start=position))
+            else:
+                self.bot.loop.create_task(self.play_next(ctx_or_interaction))
+        
+        def after(error):
+            self.bot.loop.call_soon_threadsafe(finished, error)
+        return after
     
-    async def play_next(self, ctx_or_interaction):
-        """Play the next song in queue"""
-        # Handle both Context and Interaction
+    async def play_next(self, ctx_or_interaction, start=0):
+        """Play the next song in queue, the first one `start` seconds in"""
+        # Handle Context, Interaction and (after a restart) a plain text channel
+        guild = ctx_or_interaction.guild
+        voice_client = guild.voice_client
         if isinstance(ctx_or_interaction, discord.Interaction):
-            guild = ctx_or_interaction.guild
-            voice_client = ctx_or_interaction.guild.voice_client
             send = ctx_or_interaction.followup.send
         else:
-            guild = ctx_or_interaction.guild
-            voice_client = ctx_or_interaction.voice_client
             send = ctx_or_interaction.send
         
         guild_id = guild.id
-        if self.queues.get(guild_id):
-            next_url = self.queues[guild_id].pop(0)
+        queue = self.queues.get(guild_id)
+        track = queue.next() if queue is not None else None
+        while track is not None:
             try:
-                source = await YTDLSource.create_source(next_url, loop=self.bot.loop, stream=False)
+                source = await self.next_source(guild_id, track, start=start)
             except Exception as e:
+                # Keep going: one unavailable video shouldn't stop a whole playlist
                 await send(f"Error: {e}")
-                return
+                queue.current = None  # Never loop a track that can't play
+                track, start = queue.next(), 0
+                continue
 
-            def after_play(error):
-                try:
-                    os.remove(source.filename)
-                except:
-                    pass
-                self.bot.loop.create_task(self.play_next(ctx_or_interaction))
-
-            voice_client.play(source, after=after_play)
-            await send(f"🎵 Now playing: **{source.title}**")
-        else:
-            await send("Queue is empty.")
+            voice_client.play(source, after=self.after_play(ctx_or_interaction, queue, track, source))
+            queue.mark_started(start)
+            self.prefetch(guild_id)
+            return await send(f"🎵 Now playing: **{source.title}**")
+        await send("Queue is empty.")
 
     # ===== PREFIX COMMANDS =====
     
@@ -590,7 +1699,7 @@ class Music(commands.Cog):
         
         try:
             await channel.connect(timeout=60.0, reconnect=True, self_deaf=True)
-            self.queues[guild_id] = []
+            self.queues[guild_id] = GuildQueue()
             await ctx.send(f"✅ Joined **{channel.name}**")
         except Exception as e:
             await ctx.send(f"❌ Failed to join: {e}")
@@ -605,33 +1714,43 @@ class Music(commands.Cog):
                 return await ctx.send("You're not in a voice channel!")
         
         guild_id = ctx.guild.id
-        if guild_id not in self.queues:
-            self.queues[guild_id] = []
+        queue = self.queue_for(guild_id)
+        self.text_channels[guild_id] = ctx.channel.id
+        
+        if is_playlist_url(url):
+            try:
+                count, more = await self.enqueue_playlist(guild_id, url, ctx.author.id)
+            except Exception as e:
+                return await ctx.send(f"Error: {e}")
+            await ctx.send(f"📝 Added {count} songs from playlist{' (loading more...)' if more else ''}")
+            if not ctx.voice_client.is_playing():
+                await self.play_next(ctx)
+            return
         
+        track = Track(url, requester_id=ctx.author.id)
         if ctx.voice_client.is_playing():
-            self.queues[guild_id].append(url)
-            return await ctx.send(f"📝 Added to queue: {url}")
+            queue.append(track)
+            self.prefetch(guild_id)
+            return await ctx.send(f"📝 Added to queue: {track.label()}")
         
+        queue.play_now(track)
         try:
             await ctx.send("🔄 Loading...")
-            source = await YTDLSource.create_source(url, loop=self.bot.loop, stream=False)
+            source = await YTDLSource.create_source(url, loop=self.bot.loop, stream=self.is_streaming(guild_id))
         except Exception as e:
+            queue.current = None
             return await ctx.send(f"Error: {e}")
+        track.update(source.data)
 
-        def after_play(error):
-            try:
-                os.remove(source.filename)
-            except:
-                pass
-            self.bot.loop.create_task(self.play_next(ctx))
-
-        ctx.voice_client.play(source, after=after_play)
+        ctx.voice_client.play(source, after=self.after_play(ctx, queue, track, source))
+        queue.mark_started()
         await ctx.send(f"🎵 Now playing: **{source.title}**")
     
     @commands.command(name='skip')
     async def skip(self, ctx):
         """Skip current song"""
         if ctx.voice_client and ctx.voice_client.is_playing():
+            self.queue_for(ctx.guild.id).skipping = True
             ctx.voice_client.stop()
             await ctx.send("⏭️ Skipped!")
         else:
@@ -640,12 +1759,72 @@ class Music(commands.Cog):
     @commands.command(name='queue')
     async def view_queue(self, ctx):
         """View the queue"""
-        guild_id = ctx.guild.id
-        if guild_id in self.queues and self.queues[guild_id]:
-            msg = "📜 Queue:\n" + "\n".join([f"{i+1}. {song}" for i, song in enumerate(self.queues[guild_id][:10])])
-            await ctx.send(msg)
-        else:
-            await ctx.send("Queue is empty.")
+        await ctx.send(self.queue_for(ctx.guild.id).describe())
+    
+    @commands.command(name='remove')
+    async def remove(self, ctx, position: int):
+        """Remove a song from the queue by position"""
+        await ctx.send(self.remove_text(ctx.guild.id, position))
+    
+    @commands.command(name='move')
+    async def move(self, ctx, source: int, destination: int):
+        """Move a queued song to another position"""
+        await ctx.send(self.move_text(ctx.guild.id, source, destination))
+    
+    @commands.command(name='shuffle')
+    async def shuffle(self, ctx):
+        """Shuffle the queue"""
+        await ctx.send(self.shuffle_text(ctx.guild.id))
+    
+    @commands.command(name='clear')
+    async def clear(self, ctx):
+        """Clear the queue (the current song keeps playing)"""
+        await ctx.send(self.clear_text(ctx.guild.id))
+    
+    @commands.command(name='loop')
+    async def loop(self, ctx, mode: str = None):
+        """Set loop mode: off, track or queue"""
+        await ctx.send(self.loop_text(ctx.guild.id, mode))
+    
+    # ===== QUEUE EDITING (shared by prefix and slash commands) =====
+    
+    def remove_text(self, guild_id, position):
+        queue = self.queue_for(guild_id)
+        if not 1 <= position <= len(queue):
+            return f"No song at position {position}."
+        track = queue.remove(position)
+        self.prefetch(guild_id)
+        return f"🗑️ Removed: {track.label()}"
+    
+    def move_text(self, guild_id, source, destination):
+        queue = self.queue_for(guild_id)
+        if not (1 <= source <= len(queue) and 1 <= destination <= len(queue)):
+            return f"Positions must be between 1 and {len(queue)}."
+        track = queue.move(source, destination)
+        self.prefetch(guild_id)
+        return f"↕️ Moved {track.label()} to position {destination}"
+    
+    def shuffle_text(self, guild_id):
+        queue = self.queue_for(guild_id)
+        queue.shuffle()
+        self.prefetch(guild_id)
+        return f"🔀 Shuffled {len(queue)} songs"
+    
+    def clear_text(self, guild_id):
+        self.cancel_playlist(guild_id)
+        queue = self.queue_for(guild_id)
+        count = len(queue)
+        queue.clear()
+        self.prefetch(guild_id)
+        return f"🧹 Cleared {count} songs from the queue"
+    
+    def loop_text(self, guild_id, mode):
+        queue = self.queue_for(guild_id)
+        if mode is not None:
+            if mode.lower() not in LOOP_MODES:
+                return f"Loop mode must be one of: {', '.join(LOOP_MODES)}"
+            queue.set_loop(mode.lower())
+        return f"🔁 Loop mode: **{queue.loop}**"
     
     @commands.command(name='leave')
     async def leave(self, ctx):
@@ -655,6 +1834,8 @@ class Music(commands.Cog):
                 ctx.voice_client.stop()
             await ctx.voice_client.disconnect(force=True)
             self.queues.pop(ctx.guild.id, None)
+            self.cancel_prefetch(ctx.guild.id)
+            self.cancel_playlist(ctx.guild.id)
             await ctx.send("👋 Disconnected!")
         else:
             await ctx.send("Not in a voice channel.")
@@ -664,6 +1845,7 @@ class Music(commands.Cog):
         """Pause playback"""
         if ctx.voice_client and ctx.voice_client.is_playing():
             ctx.voice_client.pause()
+            self.queue_for(ctx.guild.id).mark_paused()
             await ctx.send("⏸️ Paused!")
         else:
             await ctx.send("Nothing playing.")
@@ -673,10 +1855,37 @@ class Music(commands.Cog):
         """Resume playback"""
         if ctx.voice_client and ctx.voice_client.is_paused():
             ctx.voice_client.resume()
+            self.queue_for(ctx.guild.id).mark_resumed()
             await ctx.send("▶️ Resumed!")
         else:
             await ctx.send("Nothing paused.")
 
+    @commands.command(name='streammode')
+    async def streammode(self, ctx, mode: str = None):
+        """Toggle streaming (on) or download-first (off) playback"""
+        if mode is not None:
+            if mode.lower() in ("on", "true", "yes", "1"):
+                self.stream_mode[ctx.guild.id] = True
+            elif mode.lower() in ("off", "false", "no", "0"):
+                self.stream_mode[ctx.guild.id] = False
+            else:
+                return await ctx.send("Stream mode must be `on` or `off`.")
+        state = "streaming" if self.is_streaming(ctx.guild.id) else "download first"
+        await ctx.send(f"📡 Playback mode: **{state}**")
+
+    @commands.command(name='cachestats')
+    async def cachestats(self, ctx):
+        """Show audio cache hit rate and size"""
+        await ctx.send(self.cache_stats_text())
+    
+    def cache_stats_text(self):
+        return (
+            f"💾 Audio cache: {len(audio_cache.entries)} songs, "
+            f"{audio_cache.total_bytes / 1024 ** 2:.0f}/{audio_cache.max_bytes / 1024 ** 2:.0f} MB | "
+            f"hit rate {audio_cache.hit_rate:.0%} ({audio_cache.hits}/{audio_cache.hits + audio_cache.misses}) | "
+            f"{audio_cache.bytes_saved / 1024 ** 2:.0f} MB of downloads saved"
+        )
+
     # ===== SLASH COMMANDS =====
     
     @app_commands.command(name="join", description="Join your voice channel")
@@ -704,7 +1913,7 @@ class Music(commands.Cog):
         
         try:
             await channel.connect(timeout=60.0, reconnect=True, self_deaf=True)
-            self.queues[guild_id] = []
+            self.queues[guild_id] = GuildQueue()
             await interaction.followup.send(f"✅ Joined **{channel.name}**")
         except Exception as e:
             await interaction.followup.send(f"❌ Failed: {e}")
@@ -718,7 +1927,7 @@ class Music(commands.Cog):
                 channel = interaction.user.voice.channel
                 try:
                     await channel.connect(timeout=60.0, reconnect=True, self_deaf=True)
-                    self.queues[interaction.guild.id] = []
+                    self.queues[interaction.guild.id] = GuildQueue()
                 except Exception as e:
                     return await interaction.followup.send(f"❌ Failed to join: {e}")
             else:
@@ -727,31 +1936,41 @@ class Music(commands.Cog):
             await interaction.response.defer()
         
         guild_id = interaction.guild.id
-        if guild_id not in self.queues:
-            self.queues[guild_id] = []
+        queue = self.queue_for(guild_id)
+        self.text_channels[guild_id] = interaction.channel_id
+        
+        if is_playlist_url(query):
+            try:
+                count, more = await self.enqueue_playlist(guild_id, query, interaction.user.id)
+            except Exception as e:
+                return await interaction.followup.send(f"Error: {e}")
+            await interaction.followup.send(f"📝 Added {count} songs from playlist{' (loading more...)' if more else ''}")
+            if not interaction.guild.voice_client.is_playing():
+                await self.play_next(interaction)
+            return
         
+        track = Track(query, requester_id=interaction.user.id)
         if interaction.guild.voice_client.is_playing():
-            self.queues[guild_id].append(query)
-            return await interaction.followup.send(f"📝 Added to queue: {query}")
+            queue.append(track)
+            self.prefetch(guild_id)
+            return await interaction.followup.send(f"📝 Added to queue: {track.label()}")
         
+        queue.play_now(track)
         try:
-            source = await YTDLSource.create_source(query, loop=self.bot.loop, stream=False)
+            source = await YTDLSource.create_source(query, loop=self.bot.loop, stream=self.is_streaming(guild_id))
         except Exception as e:
+            queue.current = None
             return await interaction.followup.send(f"Error: {e}")
+        track.update(source.data)
 
-        def after_play(error):
-            try:
-                os.remove(source.filename)
-            except:
-                pass
-            self.bot.loop.create_task(self.play_next(interaction))
-
-        interaction.guild.voice_client.play(source, after=after_play)
+        interaction.guild.voice_client.play(source, after=self.after_play(interaction, queue, track, source))
+        queue.mark_started()
         await interaction.followup.send(f"🎵 Now playing: **{source.title}**")
     
     @app_commands.command(name="skip", description="Skip the current song")
     async def slash_skip(self, interaction: discord.Interaction):
         if interaction.guild.voice_client and interaction.guild.voice_client.is_playing():
+            self.queue_for(interaction.guild.id).skipping = True
             interaction.guild.voice_client.stop()
             await interaction.response.send_message("⏭️ Skipped!")
         else:
@@ -759,13 +1978,39 @@ class Music(commands.Cog):
     
     @app_commands.command(name="queue", description="View the music queue")
     async def slash_queue(self, interaction: discord.Interaction):
-        guild_id = interaction.guild.id
-        if guild_id in self.queues and self.queues[guild_id]:
-            msg = "📜 Queue:\n" + "\n".join([f"{i+1}. {song}" for i, song in enumerate(self.queues[guild_id][:10])])
-            await interaction.response.send_message(msg)
+        queue = self.queue_for(interaction.guild.id)
+        if queue or queue.current is not None:
+            await interaction.response.send_message(queue.describe())
         else:
             await interaction.response.send_message("Queue is empty.", ephemeral=True)
     
+    @app_commands.command(name="remove", description="Remove a song from the queue")
+    @app_commands.describe(position="Queue position (see /queue)")
+    async def slash_remove(self, interaction: discord.Interaction, position: int):
+        await interaction.response.send_message(self.remove_text(interaction.guild.id, position))
+    
+    @app_commands.command(name="move", description="Move a queued song to another position")
+    @app_commands.describe(source="Current position", destination="New position")
+    async def slash_move(self, interaction: discord.Interaction, source: int, destination: int):
+        await interaction.response.send_message(self.move_text(interaction.guild.id, source, destination))
+    
+    @app_commands.command(name="shuffle", description="Shuffle the queue")
+    async def slash_shuffle(self, interaction: discord.Interaction):
+        await interaction.response.send_message(self.shuffle_text(interaction.guild.id))
+    
+    @app_commands.command(name="clear", description="Clear the queue")
+    async def slash_clear(self, interaction: discord.Interaction):
+        await interaction.response.send_message(self.clear_text(interaction.guild.id))
+    
+    @app_commands.command(name="loop", description="Loop the current song or the whole queue")
+    @app_commands.choices(mode=[
+        app_commands.Choice(name="Off", value="off"),
+        app_commands.Choice(name="Current song", value="track"),
+        app_commands.Choice(name="Whole queue", value="queue"),
+    ])
+    async def slash_loop(self, interaction: discord.Interaction, mode: app_commands.Choice[str]):
+        await interaction.response.send_message(self.loop_text(interaction.guild.id, mode.value))
+    
     @app_commands.command(name="leave", description="Leave the voice channel")
     async def slash_leave(self, interaction: discord.Interaction):
         if interaction.guild.voice_client:
@@ -773,6 +2018,8 @@ class Music(commands.Cog):
                 interaction.guild.voice_client.stop()
             await interaction.guild.voice_client.disconnect(force=True)
             self.queues.pop(interaction.guild.id, None)
+            self.cancel_prefetch(interaction.guild.id)
+            self.cancel_playlist(interaction.guild.id)
             await interaction.response.send_message("👋 Disconnected!")
         else:
             await interaction.response.send_message("Not in a voice channel.", ephemeral=True)
@@ -781,6 +2028,7 @@ class Music(commands.Cog):
     async def slash_pause(self, interaction: discord.Interaction):
         if interaction.guild.voice_client and interaction.guild.voice_client.is_playing():
             interaction.guild.voice_client.pause()
+            self.queue_for(interaction.guild.id).mark_paused()
             await interaction.response.send_message("⏸️ Paused!")
         else:
             await interaction.response.send_message("Nothing playing.", ephemeral=True)
@@ -789,20 +2037,35 @@ class Music(commands.Cog):
     async def slash_resume(self, interaction: discord.Interaction):
         if interaction.guild.voice_client and interaction.guild.voice_client.is_paused():
             interaction.guild.voice_client.resume()
+            self.queue_for(interaction.guild.id).mark_resumed()
             await interaction.response.send_message("▶️ Resumed!")
         else:
             await interaction.response.send_message("Nothing paused.", ephemeral=True)
     
+    @app_commands.command(name="streammode", description="Stream songs or download them before playing")
+    @app_commands.describe(enabled="Stream (faster start) or download first (more reliable)")
+    async def slash_streammode(self, interaction: discord.Interaction, enabled: bool):
+        self.stream_mode[interaction.guild.id] = enabled
+        state = "streaming" if enabled else "download first"
+        await interaction.response.send_message(f"📡 Playback mode: **{state}**")
+    
+    @app_commands.command(name="cachestats", description="Show audio cache statistics")
+    async def slash_cachestats(self, interaction: discord.Interaction):
+        await interaction.response.send_message(self.cache_stats_text(), ephemeral=True)
+    
     @app_commands.command(name="musichelp", description="Show music commands")
     async def slash_musichelp(self, interaction: discord.Interaction):
         embed = discord.Embed(title="🎵 Music Commands", color=discord.Color.purple())
         embed.add_field(name="Commands", value="""
 `/join` - Join voice channel
-`/play <url/search>` - Play a song
+`/play <url/search>` - Play a song or playlist
 `/skip` - Skip current song
 `/pause` - Pause playback
 `/resume` - Resume playback
-`/queue` - View queue
+`/queue` - View queue and time remaining
+`/remove <pos>` `/move <from> <to>` - Edit queue
+`/shuffle` `/clear` `/loop <off/track/queue>`
+`/streammode <on/off>` - Stream or download first
 `/leave` - Leave channel
         """, inline=False)
         await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -847,6 +2110,11 @@ async def on_ready():
             await vc.disconnect(force=True)
         except:
             pass
+    
+    # Rejoin and resume the queues that were playing before the restart
+    music = bot.get_cog("Music")
+    if music is not None:
+        bot.loop.create_task(music.restore_sessions())
 
 
 @bot.event
@@ -884,7 +2152,8 @@ React to role messages to get roles!
     
     embed.add_field(name="🎵 Music", value="""
 `/join` `/leave` `/play <url>`
-`/skip` `/pause` `/resume` `/queue`
+`/skip` `/pause` `/resume` `/queue` `/streammode`
+`/remove` `/move` `/shuffle` `/clear` `/loop`
     """, inline=False)
     
     embed.set_footer(text="Use / for slash commands or ! for prefix commands")
@@ -906,7 +2175,8 @@ async def slash_help(interaction: discord.Interaction):
     """, inline=False)
     
     embed.add_field(name="🎵 Music", value="""
-`/join` `/leave` `/play` `/skip` `/pause` `/resume` `/queue`
+`/join` `/leave` `/play` `/skip` `/pause` `/resume` `/queue` `/streammode`
+`/remove` `/move` `/shuffle` `/clear` `/loop`
     """, inline=False)
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -3,10 +3,20 @@ from discord.ext import commands, tasks
 from discord import app_commands
 import asyncio
 import aiosqlite
+import bisect
+import csv
+import heapq
+import io
+import itertools
+import json
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 import os
+import re
+import time
 
 # Load Discord token from environment variable
 DISCORD_TOKEN = os.environ.get("DISCORD_TOKEN")
@@ -24,9 +34,66 @@ HK_TZ = timezone(timedelta(hours=8), name="HKT")
 # Database file path for bot data
 DB_PATH = Path(__file__).parent / "caleb_bot_data.db"
 
+# Number of long-lived SQLite connections shared by all cogs
+DB_POOL_SIZE = 4
+
+# Per-connection prepared statement cache (sqlite3 reuses compiled SQL by text)
+DB_STATEMENT_CACHE_SIZE = 256
+
+# Drink ledger write-behind: once a change is pending, wait up to N seconds for more to
+# join it (or until M pairs are pending), then write them all in one transaction
+DRINK_FLUSH_INTERVAL = 0.25
+DRINK_FLUSH_BATCH = 64
+# Back-off after a failed flush, and how often cog_unload retries before spilling to disk
+DRINK_FLUSH_RETRY_DELAY = 5
+DRINK_UNLOAD_FLUSH_ATTEMPTS = 3
+# Pending changes that could not be written on unload; replayed on the next load
+DRINK_PENDING_PATH = Path(__file__).parent / "drink_pending.json"
+# Channels kept in memory; idle ones with nothing pending are evicted beyond this
+DRINK_CACHE_CHANNELS = 1024
+
+# Number of rows shown by /leaderboard, and how many channels keep a cached ranking
+LEADERBOARD_SIZE = 15
+LEADERBOARD_CACHE_CHANNELS = 128
+
+# Bulk /owe_bulk: matches a user mention like <@123> or <@!123>
+MENTION_RE = re.compile(r"<@!?(\d+)>")
+
+# scope option for /drinks and /leaderboard
+DRINK_SCOPES = [
+    app_commands.Choice(name="This channel", value="channel"),
+    app_commands.Choice(name="Whole server", value="server"),
+]
+
+# Number of rendered /drinks and /leaderboard embeds kept for reuse
+RENDER_CACHE_SIZE = 512
+
 # Event Announcement Channel
 ANNOUNCEMENT_CHANNEL_ID = 1261146184521875469  # ⚠️ REPLACE THIS WITH YOUR TARGET CHANNEL ID
 
+# Announcements go out this long before an event (seconds)
+ANNOUNCE_OFFSETS = {"1w": 7 * 86400, "1d": 86400}
+# The scheduler re-checks the clock at least this often (seconds), in case it was changed
+EVENT_SCHEDULER_MAX_SLEEP = 3600
+# An announcement that couldn't be posted is retried after this delay, doubling up to the max
+EVENT_RETRY_BASE_DELAY = 30
+EVENT_RETRY_MAX_DELAY = 3600
+
+# /view_events: events per page (embeds hold at most 25 fields), how long a rendered
+# page is reused (seconds), how many are kept, and how long the buttons stay active
+EVENTS_PAGE_SIZE = 10
+EVENTS_PAGE_CACHE_TTL = 30
+EVENTS_PAGE_CACHE_SIZE = 256
+EVENTS_VIEW_TIMEOUT = 300
+# Longest window the days filter accepts
+EVENTS_MAX_DAYS = 3650
+# Recurring series are read off their index this many at a time while a page is filled
+EVENTS_SERIES_BATCH = 100
+
+# /add_event file import (CSV or iCalendar) limits
+EVENT_IMPORT_MAX_BYTES = 2 * 1024 * 1024
+EVENT_IMPORT_MAX_EVENTS = 5000
+
 # Role Assignment: Map emoji to role name
 EMOJI_ROLE_MAP = {
     "🕹": "gamer",
@@ -36,30 +103,458 @@ EMOJI_ROLE_MAP = {
     "🐕": "神犬",
 }
 
-# Tracked message IDs for role assignment
+# Tracked message IDs for role assignment (seeded into the role_messages table;
+# messages created with !setup_roles are stored there too)
 ROLE_MESSAGE_IDS = {
     1261173511511216231: 0,
     1261157962702127104: 0,
 }
 
+# Role mutation queue: wait this long for toggles to coalesce, then space member edits out
+ROLE_BATCH_WINDOW = 0.5
+ROLE_EDIT_INTERVAL = 0.5
+
 def get_hk_now():
     """Helper function to always get the current time in Hong Kong timezone"""
     return datetime.now(HK_TZ).replace(tzinfo=None)
 
+def hk_to_epoch(dt: datetime) -> int:
+    """Epoch seconds (UTC) for a naive Hong Kong time, as stored in upcoming_events"""
+    return int(dt.replace(tzinfo=HK_TZ).timestamp())
+
+def epoch_to_hk(ts: float) -> datetime:
+    """Naive Hong Kong time for stored epoch seconds, for display"""
+    return datetime.fromtimestamp(ts, HK_TZ).replace(tzinfo=None)
+
+def member_name(guild: discord.Guild, user_id: int) -> str:
+    """Display name of a guild member, or '?' if they are no longer in the guild"""
+    member = guild.get_member(user_id)
+    return member.display_name if member else '?'
+
+
+# ========================= DATABASE SERVICE =========================
+
+class Database:
+    """Bot-wide pool of long-lived aiosqlite connections shared by every cog.
+
+    Each aiosqlite connection owns a worker thread, so opening one per command
+    is expensive. The pool is opened by the first cog that attaches to it and
+    closed when the last one detaches (on cog_unload / bot shutdown).
+    """
+
+    def __init__(self, path: Path, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._pool: asyncio.Queue = asyncio.Queue()
+        self._connections: list[aiosqlite.Connection] = []
+        self._users = 0
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def attach(cls, bot: commands.Bot) -> "Database":
+        """Return the bot's shared database, opening it on first use"""
+        db = getattr(bot, "db", None)
+        if db is None:
+            db = bot.db = cls(DB_PATH)
+        async with db._lock:
+            if db._users == 0:
+                await db.open()
+            db._users += 1
+        return db
+
+    async def detach(self):
+        """Release one user of the pool; the last one closes all connections"""
+        async with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                await self.close()
+
+    async def open(self):
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path, cached_statements=DB_STATEMENT_CACHE_SIZE)
+            conn.row_factory = aiosqlite.Row
+            await conn.execute("PRAGMA journal_mode = WAL")
+            await conn.execute("PRAGMA synchronous = NORMAL")
+            await conn.execute("PRAGMA busy_timeout = 5000")
+            # Any ANALYZE run by PRAGMA optimize samples instead of scanning whole tables
+            await conn.execute("PRAGMA analysis_limit = 400")
+            self._connections.append(conn)
+            self._pool.put_nowait(conn)
+        print(f"[Database] Opened {self.size} connections to {self.path}")
+
+    async def close(self):
+        for conn in self._connections:
+            # Refreshes planner stats only for tables whose queries would benefit
+            await conn.execute("PRAGMA optimize")
+            await conn.close()
+        self._connections.clear()
+        self._pool = asyncio.Queue()
+        print(f"[Database] Closed connections to {self.path}")
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connection from the pool for the duration of the block"""
+        conn = await self._pool.get()
+        try:
+            yield conn
+        finally:
+            # Never hand a connection back with a half-finished transaction
+            if conn.in_transaction:
+                await conn.rollback()
+            self._pool.put_nowait(conn)
+
 
 # ========================= ROLE ASSIGNMENT COG =========================
 
+def emoji_key(emoji) -> str | int:
+    """Normalized lookup key for an emoji: custom emoji by ID, unicode without variation selectors"""
+    if getattr(emoji, "id", None):
+        return emoji.id
+    return str(emoji).replace('\ufe0f', '')
+
+
+class RoleMutationQueue:
+    """Per-guild scheduler for reaction role changes.
+
+    Toggles are coalesced per member (last change per role wins, so an add
+    followed by a remove is a no-op) and applied as one member.edit(roles=...)
+    per member, spaced ROLE_EDIT_INTERVAL apart to stay inside the member-edit
+    rate limit bucket. discord.py still handles any 429 it gets back.
+
+    The role list sent replaces the member's roles, so it is built from the
+    member as fetched right before the edit, not from the cache, which can lag
+    behind changes made elsewhere and would have them reverted.
+    """
+
+    def __init__(self, guild: discord.Guild, on_edit=None):
+        self.guild = guild
+        # Awaited as on_edit(guild_id, member_id, added role IDs, removed role IDs) after each edit
+        self.on_edit = on_edit
+        # member_id -> {role_id: True to add / False to remove}
+        self.pending: dict[int, dict[int, bool]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.applied = 0
+        # Duration of the most recent member.edit call (seconds)
+        self.last_edit_latency = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending)
+
+    def submit(self, member_id: int, role_id: int, add: bool):
+        self.pending.setdefault(member_id, {})[role_id] = add
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _drain(self):
+        # Give a burst of reactions a moment to pile up (and cancel out) first
+        await asyncio.sleep(ROLE_BATCH_WINDOW)
+        while self.pending:
+            member_id = next(iter(self.pending))
+            changes = self.pending.pop(member_id)
+            if await self._apply(member_id, changes):
+                await asyncio.sleep(ROLE_EDIT_INTERVAL)
+
+    async def _apply(self, member_id: int, changes: dict[int, bool]) -> bool:
+        """Apply one member's net changes; returns True if an API call was made"""
+        try:
+            member = await self.guild.fetch_member(member_id)
+        except discord.HTTPException:
+            return True
+        
+        current = {role.id for role in member.roles if not role.is_default()}
+        desired = set(current)
+        for role_id, add in changes.items():
+            if add:
+                desired.add(role_id)
+            else:
+                desired.discard(role_id)
+        if desired == current:
+            return False
+        
+        roles = [role for role in map(self.guild.get_role, desired) if role is not None]
+        added = [role for role in roles if role.id not in current]
+        removed = [role for role in member.roles if role.id in current - desired]
+        started = time.monotonic()
+        try:
+            await member.edit(roles=roles, reason="Role assignment via reaction")
+            self.last_edit_latency = time.monotonic() - started
+            self.applied += 1
+            print(f"[RoleAssignment] {member.display_name}: added {[r.name for r in added]}, removed {[r.name for r in removed]}")
+        except discord.Forbidden:
+            print(f"[RoleAssignment] Permission denied editing roles of {member.display_name}")
+            return True
+        except discord.HTTPException as e:
+            print(f"[RoleAssignment] Error: {e}")
+            return True
+        
+        if self.on_edit is not None:
+            try:
+                await self.on_edit(self.guild.id, member_id, [r.id for r in added], [r.id for r in removed])
+            except Exception as e:
+                print(f"[RoleAssignment] Failed to record role grants for {member.display_name}: {e}")
+        return True
+
+
 class RoleAssignment(commands.Cog):
     """Cog for handling role assignment via emoji reactions"""
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.role_messages = ROLE_MESSAGE_IDS.copy()
+        self.db: Optional[Database] = None
+        # message_id -> (guild_id, channel_id); 0 means not known yet (legacy hardcoded IDs)
+        self.role_messages: dict[int, tuple[int, int]] = {}
+        self.emoji_roles = {emoji_key(emoji): role_name for emoji, role_name in EMOJI_ROLE_MAP.items()}
+        # guild_id -> {(message_id, emoji key): role_id}
+        self.role_index: dict[int, dict[tuple[int, str | int], int]] = {}
+        # guild_id -> RoleMutationQueue
+        self.mutation_queues: dict[int, RoleMutationQueue] = {}
+        self._reconcile_task: Optional[asyncio.Task] = None
+    
+    async def cog_load(self):
+        self.db = await Database.attach(self.bot)
+        await self.init_db()
+        # The cog is added from on_ready, so the guild cache is already populated
+        for guild in self.bot.guilds:
+            self.build_index(guild)
+        self._reconcile_task = asyncio.create_task(self.reconcile_all())
+    
+    async def cog_unload(self):
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+        for queue in self.mutation_queues.values():
+            queue.cancel()
+        await self.db.detach()
+    
+    async def init_db(self):
+        async with self.db.connection() as db:
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS role_messages (
+                    message_id INTEGER PRIMARY KEY,
+                    guild_id INTEGER NOT NULL DEFAULT 0,
+                    channel_id INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await db.executemany(
+                "INSERT OR IGNORE INTO role_messages (message_id, channel_id) VALUES (?, ?)",
+                ROLE_MESSAGE_IDS.items()
+            )
+            # Roles the bot itself handed out for a reaction; only these are ever revoked by
+            # reconciliation, so roles granted by hand are left alone
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS role_grants (
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    role_id INTEGER NOT NULL,
+                    PRIMARY KEY (guild_id, role_id, user_id)
+                ) WITHOUT ROWID
+            """)
+            await db.commit()
+            
+            cursor = await db.execute("SELECT message_id, guild_id, channel_id FROM role_messages")
+            self.role_messages = {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+    
+    async def register_message(self, message_id: int, guild_id: int, channel_id: int):
+        """Store (or locate) a role message and refresh the affected indexes"""
+        # Update the registry and indexes together, before any await, so they never disagree
+        self.role_messages[message_id] = (guild_id, channel_id)
+        for guild in self.bot.guilds:
+            self.build_index(guild)
+        
+        async with self.db.connection() as db:
+            await db.execute(
+                """INSERT INTO role_messages (message_id, guild_id, channel_id) VALUES (?, ?, ?)
+                   ON CONFLICT(message_id) DO UPDATE SET guild_id = excluded.guild_id, channel_id = excluded.channel_id""",
+                (message_id, guild_id, channel_id)
+            )
+            await db.commit()
+    
+    def queue_for(self, guild: discord.Guild) -> RoleMutationQueue:
+        queue = self.mutation_queues.get(guild.id)
+        if queue is None:
+            queue = self.mutation_queues[guild.id] = RoleMutationQueue(guild, self.record_grants)
+        return queue
+    
+    async def record_grants(self, guild_id: int, user_id: int, added: list[int], removed: list[int]):
+        async with self.db.connection() as db:
+            await db.executemany(
+                "INSERT OR IGNORE INTO role_grants (guild_id, user_id, role_id) VALUES (?, ?, ?)",
+                [(guild_id, user_id, role_id) for role_id in added]
+            )
+            await db.executemany(
+                "DELETE FROM role_grants WHERE guild_id = ? AND user_id = ? AND role_id = ?",
+                [(guild_id, user_id, role_id) for role_id in removed]
+            )
+            await db.commit()
+    
+    def build_index(self, guild: discord.Guild):
+        """(Re)build the guild's (message, emoji) -> role ID index"""
+        roles_by_name = {role.name: role.id for role in guild.roles}
+        index = {}
+        for key, role_name in self.emoji_roles.items():
+            role_id = roles_by_name.get(role_name)
+            if role_id is None:
+                print(f"[RoleAssignment] Role '{role_name}' not found in {guild.name}")
+                continue
+            for message_id, (guild_id, _) in self.role_messages.items():
+                if guild_id in (0, guild.id):
+                    index[(message_id, key)] = role_id
+        self.role_index[guild.id] = index
+    
+    def resolve_role(self, payload: discord.RawReactionActionEvent) -> Optional[int]:
+        """Role ID for a reaction, or None if it isn't on a role message / mapped emoji"""
+        index = self.role_index.get(payload.guild_id)
+        if index is None:
+            return None
+        return index.get((payload.message_id, emoji_key(payload.emoji)))
+    
+    # ===== STARTUP RECONCILIATION =====
+    
+    async def reconcile_all(self):
+        """Catch up on reactions that were added or removed while the bot was offline"""
+        uncertain = await self.locate_legacy_messages()
+        await asyncio.gather(*(self.reconcile_guild(guild, located=guild.id not in uncertain)
+                               for guild in self.bot.guilds))
+    
+    async def locate_legacy_messages(self) -> set[int]:
+        """Find the channels of role messages stored without a location.
+
+        Returns the IDs of guilds that may still hold one that wasn't found
+        (a channel couldn't be read), where removals must wait.
+        """
+        uncertain: set[int] = set()
+        missing = 0
+        for message_id in [mid for mid, (gid, _) in self.role_messages.items() if gid == 0]:
+            location = None
+            for guild in self.bot.guilds:
+                for channel in guild.text_channels:
+                    # A message is never older than its channel
+                    if channel.id > message_id:
+                        continue
+                    if not channel.permissions_for(guild.me).read_message_history:
+                        uncertain.add(guild.id)
+                        continue
+                    try:
+                        await channel.fetch_message(message_id)
+                    except discord.NotFound:
+                        continue
+                    except discord.HTTPException:
+                        uncertain.add(guild.id)
+                        continue
+                    location = (guild.id, channel.id)
+                    break
+                if location:
+                    break
+            if location:
+                await self.register_message(message_id, *location)
+                print(f"[RoleAssignment] Located role message {message_id} in channel {location[1]}")
+            else:
+                missing += 1
+                print(f"[RoleAssignment] Role message {message_id} not found in any readable channel")
+        return uncertain if missing else set()
+    
+    async def reconcile_guild(self, guild: discord.Guild, located: bool = True):
+        messages = [(mid, cid) for mid, (gid, cid) in self.role_messages.items() if gid == guild.id]
+        if not messages:
+            return
+        results = await asyncio.gather(*(self._fetch_reactors(guild, mid, cid) for mid, cid in messages))
+        
+        # Removing roles is only safe when every role message in this guild was read
+        complete = located
+        reactors: dict[int, set[int]] = {}
+        for result in results:
+            if result is None:
+                complete = False
+                continue
+            for role_id, user_ids in result.items():
+                reactors.setdefault(role_id, set()).update(user_ids)
+        
+        async with self.db.connection() as db:
+            cursor = await db.execute("SELECT role_id, user_id FROM role_grants WHERE guild_id = ?", (guild.id,))
+            granted: dict[int, set[int]] = {}
+            for row in await cursor.fetchall():
+                granted.setdefault(row[0], set()).add(row[1])
+        
+        queue = self.queue_for(guild)
+        added = removed = 0
+        stale = []
+        for role_id in set(self.role_index.get(guild.id, {}).values()):
+            role = guild.get_role(role_id)
+            if role is None:
+                continue
+            wanted = reactors.get(role_id, set())
+            holders = {member.id for member in role.members}
+            ours = granted.get(role_id, set())
+            for user_id in wanted - holders:
+                queue.submit(user_id, role_id, add=True)
+                added += 1
+            # Someone else took the role away since; forget the grant
+            stale += [(guild.id, user_id, role_id) for user_id in ours - holders]
+            if complete:
+                # Only revoke what the bot granted; roles given by hand stay
+                for user_id in (ours & holders) - wanted:
+                    queue.submit(user_id, role_id, add=False)
+                    removed += 1
+        
+        if stale:
+            async with self.db.connection() as db:
+                await db.executemany("DELETE FROM role_grants WHERE guild_id = ? AND user_id = ? AND role_id = ?", stale)
+                await db.commit()
+        print(f"[RoleAssignment] Reconciled {guild.name}: {added} role(s) to add, {removed} to remove")
+    
+    async def _fetch_reactors(self, guild: discord.Guild, message_id: int, channel_id: int) -> Optional[dict[int, set[int]]]:
+        """role_id -> IDs of users reacting with that role's emoji on one message, or None on failure"""
+        channel = guild.get_channel(channel_id)
+        if channel is None:
+            return None
+        try:
+            message = await channel.fetch_message(message_id)
+        except discord.HTTPException:
+            return None
+        
+        index = self.role_index.get(guild.id, {})
+        reactions = [(index[(message_id, emoji_key(r.emoji))], r) for r in message.reactions
+                     if (message_id, emoji_key(r.emoji)) in index]
+        
+        async def user_ids(reaction: discord.Reaction) -> set[int]:
+            return {user.id async for user in reaction.users(limit=None) if user.id != self.bot.user.id}
+        
+        try:
+            results = await asyncio.gather(*(user_ids(reaction) for _, reaction in reactions))
+        except discord.HTTPException:
+            return None
+        
+        reactors: dict[int, set[int]] = {}
+        for (role_id, _), ids in zip(reactions, results):
+            reactors.setdefault(role_id, set()).update(ids)
+        return reactors
     
     @commands.Cog.listener()
     async def on_ready(self):
         print(f"[RoleAssignment] Cog loaded!")
     
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.build_index(guild)
+    
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        self.build_index(role.guild)
+    
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.build_index(role.guild)
+    
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if before.name != after.name:
+            self.build_index(after.guild)
+    
     @commands.command(name="setup_roles")
     @commands.has_permissions(administrator=True)
     async def setup_roles(self, ctx: commands.Context):
@@ -78,89 +573,416 @@ class RoleAssignment(commands.Cog):
         for emoji in EMOJI_ROLE_MAP.keys():
             await message.add_reaction(emoji)
         
-        self.role_messages[message.id] = ctx.channel.id
+        await self.register_message(message.id, ctx.guild.id, ctx.channel.id)
         print(f"[RoleAssignment] Setup message created: {message.id}")
     
+    @commands.command(name="role_queue")
+    @commands.has_permissions(administrator=True)
+    async def role_queue_stats(self, ctx: commands.Context):
+        """Show the reaction role queue depth and edit latency for this server."""
+        queue = self.queue_for(ctx.guild)
+        await ctx.send(
+            f"🎭 Role queue: **{queue.depth}** member(s) pending | "
+            f"{queue.applied} edit(s) applied | last edit took {queue.last_edit_latency:.2f}s"
+        )
+    
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
-        if payload.user_id == self.bot.user.id:
-            return
-        
-        emoji_str = str(payload.emoji).replace('\ufe0f', '')
-        if emoji_str not in EMOJI_ROLE_MAP:
+        role_id = self.resolve_role(payload)
+        if role_id is None or payload.user_id == self.bot.user.id:
             return
         
         guild = self.bot.get_guild(payload.guild_id)
         if guild is None:
             return
         
-        member = guild.get_member(payload.user_id)
-        if member is None:
-            try:
-                member = await guild.fetch_member(payload.user_id)
-            except discord.HTTPException:
-                return
-        
-        role_name = EMOJI_ROLE_MAP[emoji_str]
-        role = discord.utils.get(guild.roles, name=role_name)
+        # Legacy hardcoded messages learn their location from the first reaction they get
+        if self.role_messages[payload.message_id][0] == 0:
+            await self.register_message(payload.message_id, payload.guild_id, payload.channel_id)
         
-        if role is None:
-            print(f"[RoleAssignment] Role '{role_name}' not found")
-            return
-        
-        try:
-            await member.add_roles(role, reason="Role assignment via reaction")
-            print(f"[RoleAssignment] Added '{role_name}' to {member.display_name}")
-        except discord.Forbidden:
-            print(f"[RoleAssignment] Permission denied for '{role_name}'")
-        except discord.HTTPException as e:
-            print(f"[RoleAssignment] Error: {e}")
+        self.queue_for(guild).submit(payload.user_id, role_id, add=True)
     
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
-        emoji_str = str(payload.emoji).replace('\ufe0f', '')
-        if emoji_str not in EMOJI_ROLE_MAP:
+        role_id = self.resolve_role(payload)
+        if role_id is None:
             return
         
         guild = self.bot.get_guild(payload.guild_id)
         if guild is None:
             return
         
-        member = guild.get_member(payload.user_id)
-        if member is None:
-            try:
-                member = await guild.fetch_member(payload.user_id)
-            except discord.HTTPException:
-                return
+        self.queue_for(guild).submit(payload.user_id, role_id, add=False)
+
+
+# ========================= DRINK COUNTER COG =========================
+
+def settle_debts(debts: dict[tuple[int, int], int]) -> list[tuple[int, int, int]]:
+    """Reduce a debt graph to a minimal-ish set of transfers (debtor_id, creditor_id, amount).
+
+    Debts are collapsed into one net balance per user (which also removes every
+    cycle), then the largest debtor repeatedly pays the largest creditor. This
+    needs at most n - 1 transfers for n users and runs in O(n log n).
+    """
+    balances: dict[int, int] = {}
+    for (debtor_id, creditor_id), amount in debts.items():
+        balances[debtor_id] = balances.get(debtor_id, 0) - amount
+        balances[creditor_id] = balances.get(creditor_id, 0) + amount
+    
+    # Max-heaps via negated balances
+    owed = [(-bal, uid) for uid, bal in balances.items() if bal > 0]
+    owing = [(bal, uid) for uid, bal in balances.items() if bal < 0]
+    heapq.heapify(owed)
+    heapq.heapify(owing)
+    
+    transfers = []
+    while owed and owing:
+        neg_credit, creditor_id = heapq.heappop(owed)
+        neg_debt, debtor_id = heapq.heappop(owing)
+        amount = min(-neg_credit, -neg_debt)
+        transfers.append((debtor_id, creditor_id, amount))
+        if -neg_credit > amount:
+            heapq.heappush(owed, (neg_credit + amount, creditor_id))
+        if -neg_debt > amount:
+            heapq.heappush(owing, (neg_debt + amount, debtor_id))
+    return transfers
+
+
+class DrinkLedger:
+    """In-memory write-behind cache in front of drink_debts_v2.
+
+    Reads are answered from memory. Mutations update memory immediately and are
+    coalesced per (guild, channel, debtor, creditor); flush() writes the latest
+    amount of every changed pair in one transaction. Multi-pair operations
+    (add_many, settle) apply their changes and flush them under the flush lock,
+    so no flush ever sees half of one. A crash loses at most the changes made
+    since the last flush.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        # (guild_id, channel_id) -> {(debtor_id, creditor_id): amount}, LRU-ordered
+        self.channels: OrderedDict[tuple[int, int], dict[tuple[int, int], int]] = OrderedDict()
+        # (guild_id, channel_id, debtor_id, creditor_id) -> (reason of the first pending change,
+        # amount currently in the DB)
+        self._pending: dict[tuple[int, int, int, int], tuple[Optional[str], int]] = {}
+        # (guild_id, channel_id) -> [(-amount, debtor_id, creditor_id), ...] kept sorted, LRU-evicted
+        self.rankings: OrderedDict[tuple[int, int], list[tuple[int, int, int]]] = OrderedDict()
+        # (guild_id, channel_id) -> number of mutations, used to invalidate rendered embeds
+        self.versions: dict[tuple[int, int], int] = {}
+        # guild_id -> number of mutations across all of the guild's channels
+        self.guild_versions: dict[int, int] = {}
+        self._load_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        # Set when a change is pending / when a full batch is pending
+        self._dirty = asyncio.Event()
+        self._batch_full = asyncio.Event()
+
+    async def channel(self, guild_id: int, channel_id: int) -> dict:
+        """Return the channel's debts, loading them from the DB on first access"""
+        key = (guild_id, channel_id)
+        debts = self.channels.get(key)
+        if debts is not None:
+            self.channels.move_to_end(key)
+            return debts
         
-        role_name = EMOJI_ROLE_MAP[emoji_str]
-        role = discord.utils.get(guild.roles, name=role_name)
+        async with self._load_lock:
+            debts = self.channels.get(key)
+            if debts is None:
+                async with self.db.connection() as db:
+                    cursor = await db.execute(
+                        "SELECT debtor_id, creditor_id, amount FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND amount > 0",
+                        key
+                    )
+                    debts = {(row[0], row[1]): row[2] for row in await cursor.fetchall()}
+                self.channels[key] = debts
+                self._evict_idle()
+        return debts
+
+    def _evict_idle(self):
+        """Drop least recently used channels beyond DRINK_CACHE_CHANNELS that have nothing left to write"""
+        # A flush in flight may still need to put its batch back into _pending
+        if len(self.channels) <= DRINK_CACHE_CHANNELS or self._flush_lock.locked():
+            return
+        busy = {key[:2] for key in self._pending}
+        # The last entry is the channel being loaded right now
+        for key in list(self.channels)[:-1]:
+            if len(self.channels) <= DRINK_CACHE_CHANNELS:
+                break
+            if key not in busy:
+                del self.channels[key]
+                self.rankings.pop(key, None)
+
+    async def add(self, guild_id: int, channel_id: int, debtor_id: int, 
+                  creditor_id: int, amount: int, reason: str = None) -> int:
+        debts = await self.channel(guild_id, channel_id)
+        return self._add(guild_id, channel_id, debts, debtor_id, creditor_id, amount, reason)
+
+    def _add(self, guild_id: int, channel_id: int, debts: dict, debtor_id: int,
+             creditor_id: int, amount: int, reason: str = None) -> int:
+        old_amount = debts.get((debtor_id, creditor_id), 0)
+        new_amount = old_amount + amount
+        debts[(debtor_id, creditor_id)] = new_amount
+        self._rerank((guild_id, channel_id), debtor_id, creditor_id, old_amount, new_amount)
+        self._mark_dirty((guild_id, channel_id, debtor_id, creditor_id), old_amount, reason)
+        return new_amount
+
+    async def pay(self, guild_id: int, channel_id: int, debtor_id: int, 
+                  creditor_id: int, amount: int) -> tuple[bool, int]:
+        debts = await self.channel(guild_id, channel_id)
+        current = debts.get((debtor_id, creditor_id), 0)
+        if current <= 0:
+            return False, 0
         
-        if role is None:
+        new_amount = max(0, current - amount)
+        if new_amount == 0:
+            del debts[(debtor_id, creditor_id)]
+        else:
+            debts[(debtor_id, creditor_id)] = new_amount
+        self._rerank((guild_id, channel_id), debtor_id, creditor_id, current, new_amount)
+        self._mark_dirty((guild_id, channel_id, debtor_id, creditor_id), current)
+        return True, new_amount
+
+    async def top(self, guild_id: int, channel_id: int, limit: int) -> list[tuple[int, int, int]]:
+        """Return the channel's largest debts as (debtor_id, creditor_id, amount)"""
+        key = (guild_id, channel_id)
+        ranking = self.rankings.get(key)
+        if ranking is None:
+            debts = await self.channel(guild_id, channel_id)
+            ranking = sorted((-amt, d, c) for (d, c), amt in debts.items())
+            self.rankings[key] = ranking
+            if len(self.rankings) > LEADERBOARD_CACHE_CHANNELS:
+                self.rankings.popitem(last=False)
+        else:
+            self.rankings.move_to_end(key)
+        return [(d, c, -neg_amt) for neg_amt, d, c in ranking[:limit]]
+
+    def _rerank(self, key: tuple[int, int], debtor_id: int, creditor_id: int, old_amount: int, new_amount: int):
+        """Move one pair inside the channel's cached ranking, if there is one"""
+        ranking = self.rankings.get(key)
+        if ranking is None:
             return
+        if old_amount > 0:
+            i = bisect.bisect_left(ranking, (-old_amount, debtor_id, creditor_id))
+            del ranking[i]
+        if new_amount > 0:
+            bisect.insort(ranking, (-new_amount, debtor_id, creditor_id))
+
+    async def add_many(self, guild_id: int, channel_id: int, 
+                       entries: list[tuple[int, int, int]], reason: str = None) -> list[int]:
+        """Apply many (debtor_id, creditor_id, amount) debts and write them in one transaction.
+
+        If the write fails, none of the debts are kept and the error is raised.
+        """
+        async with self._flush_lock:
+            debts = await self.channel(guild_id, channel_id)
+            old_debts = {(d, c): debts.get((d, c), 0) for d, c, _ in entries}
+            totals = [self._add(guild_id, channel_id, debts, d, c, amt, reason) for d, c, amt in entries]
+            try:
+                await self._write_pending()
+            except Exception:
+                # The pairs stay pending, so the next flush rewrites their old amounts
+                for (debtor_id, creditor_id), amount in old_debts.items():
+                    current = debts.pop((debtor_id, creditor_id), 0)
+                    if amount > 0:
+                        debts[(debtor_id, creditor_id)] = amount
+                    self._rerank((guild_id, channel_id), debtor_id, creditor_id, current, amount)
+                    self._mark_dirty((guild_id, channel_id, debtor_id, creditor_id), amount)
+                raise
+        return totals
+
+    async def settle(self, guild_id: int, channel_id: int, apply: bool = False) -> tuple[int, list[tuple[int, int, int]]]:
+        """Compute the channel's settlement; with apply=True replace its debts with it.
+
+        Returns (number of debts before, transfers). If the settlement can't be
+        written, the channel is put back as it was and the error is raised.
+        """
+        if not apply:
+            debts = await self.channel(guild_id, channel_id)
+            return len(debts), settle_debts(debts)
         
+        async with self._flush_lock:
+            # Swap the whole channel in one step (no await) so no /owe can interleave
+            debts = await self.channel(guild_id, channel_id)
+            before = len(debts)
+            transfers = settle_debts(debts)
+            old_debts = dict(debts)
+            debts.clear()
+            for debtor_id, creditor_id, amount in transfers:
+                debts[(debtor_id, creditor_id)] = amount
+            self.rankings.pop((guild_id, channel_id), None)
+            changed = [(guild_id, channel_id, d, c) for d, c in set(old_debts) | set(debts)]
+            for key in changed:
+                self._mark_dirty(key, old_debts.get(key[2:], 0), "Settlement")
+            
+            # Write the settlement out now, as a single transaction
+            try:
+                await self._write_pending()
+            except Exception:
+                # The pairs stay pending, so the next flush rewrites their old amounts
+                debts.clear()
+                debts.update(old_debts)
+                self.rankings.pop((guild_id, channel_id), None)
+                for key in changed:
+                    self._mark_dirty(key, 0)
+                raise
+        return before, transfers
+
+    def version(self, guild_id: int, channel_id: int) -> int:
+        return self.versions.get((guild_id, channel_id), 0)
+
+    def guild_version(self, guild_id: int) -> int:
+        return self.guild_versions.get(guild_id, 0)
+
+    def _mark_dirty(self, key: tuple[int, int, int, int], old_amount: int, reason: str = None):
+        channel_key = key[:2]
+        self.versions[channel_key] = self.versions.get(channel_key, 0) + 1
+        self.guild_versions[key[0]] = self.guild_versions.get(key[0], 0) + 1
+        # Only the first change since the last write knows what the DB holds
+        self._pending.setdefault(key, (reason, old_amount))
+        self._dirty.set()
+        if len(self._pending) >= DRINK_FLUSH_BATCH:
+            self._batch_full.set()
+
+    async def wait_for_changes(self):
+        """Block until a change is pending, then give concurrent ones up to DRINK_FLUSH_INTERVAL to join it"""
+        await self._dirty.wait()
         try:
-            await member.remove_roles(role, reason="Role removal via reaction")
-            print(f"[RoleAssignment] Removed '{role_name}' from {member.display_name}")
-        except (discord.Forbidden, discord.HTTPException):
+            await asyncio.wait_for(self._batch_full.wait(), DRINK_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
             pass
+        self._dirty.clear()
+        self._batch_full.clear()
 
+    async def flush(self):
+        """Write every pending change to the DB in a single transaction"""
+        async with self._flush_lock:
+            await self._write_pending()
+
+    def _pending_rows(self, pending: dict) -> tuple[list, list]:
+        """Split pending pairs into (upsert rows, delete keys) using their current amounts"""
+        upserts, deletes = [], []
+        for (guild_id, channel_id, debtor_id, creditor_id), (reason, _) in pending.items():
+            amount = self.channels[(guild_id, channel_id)].get((debtor_id, creditor_id), 0)
+            if amount > 0:
+                upserts.append((guild_id, channel_id, debtor_id, creditor_id, amount, reason))
+            else:
+                deletes.append((guild_id, channel_id, debtor_id, creditor_id))
+        return upserts, deletes
+
+    async def _write_pending(self):
+        # Caller holds _flush_lock
+        if not self._pending:
+            return
+        upserts, deletes = self._pending_rows(self._pending)
+        pending, self._pending = self._pending, {}
+        try:
+            await self.write_rows(self.db, upserts, deletes)
+        except BaseException:
+            # Amounts are written as absolute values, so retrying the batch later is safe.
+            # The failed batch's entries win: their DB amounts are still the real ones
+            self._pending.update(pending)
+            self._dirty.set()
+            raise
+
+    def pending_deltas(self, guild_id: int) -> dict[tuple[int, int], int]:
+        """Guild-wide (debtor_id, creditor_id) -> change not yet written to the DB.
+
+        Call while holding _flush_lock (see consistent_read), so no batch is half-written.
+        """
+        deltas: dict[tuple[int, int], int] = {}
+        for (g, channel_id, debtor_id, creditor_id), (_, stored) in self._pending.items():
+            if g != guild_id:
+                continue
+            delta = self.channels[(g, channel_id)].get((debtor_id, creditor_id), 0) - stored
+            if delta:
+                deltas[(debtor_id, creditor_id)] = deltas.get((debtor_id, creditor_id), 0) + delta
+        return deltas
+
+    def consistent_read(self) -> asyncio.Lock:
+        """Hold while reading the DB together with pending_deltas()"""
+        return self._flush_lock
+
+    @staticmethod
+    async def write_rows(database: Database, upserts: list, deletes: list):
+        async with database.connection() as db:
+            await db.executemany(
+                """INSERT INTO drink_debts_v2 (guild_id, channel_id, debtor_id, creditor_id, amount, reason)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(guild_id, channel_id, debtor_id, creditor_id)
+                   DO UPDATE SET amount = excluded.amount""",
+                upserts
+            )
+            await db.executemany(
+                "DELETE FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND debtor_id = ? AND creditor_id = ?",
+                deletes
+            )
+            await db.commit()
+
+    def spill_pending(self, path: Path) -> int:
+        """Save pending changes that could not be written to a JSON file; returns how many"""
+        upserts, deletes = self._pending_rows(self._pending)
+        path.write_text(json.dumps({"upserts": upserts, "deletes": deletes}))
+        return len(upserts) + len(deletes)
 
-# ========================= DRINK COUNTER COG =========================
 
 class DrinkCounter(commands.Cog):
     """Cog for tracking drink debts between users (per-channel)"""
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.db_path = DB_PATH
+        self.db: Optional[Database] = None
+        self.ledger: Optional[DrinkLedger] = None
+        # key -> (stamp, embed); the stamp covers ledger version, member names and channel name
+        self.render_cache: OrderedDict[tuple, tuple[tuple, discord.Embed]] = OrderedDict()
+        # guild_id -> bumped whenever a member's display name may have changed
+        self.name_versions: dict[int, int] = {}
     
     async def cog_load(self):
+        self.db = await Database.attach(self.bot)
         await self.init_db()
+        await self.replay_spilled()
+        self.ledger = DrinkLedger(self.db)
+        self.flush_loop.start()
         print(f"[DrinkCounter] Cog loaded!")
     
+    async def cog_unload(self):
+        self.flush_loop.cancel()
+        for attempt in range(1, DRINK_UNLOAD_FLUSH_ATTEMPTS + 1):
+            try:
+                await self.ledger.flush()
+                break
+            except Exception as e:
+                print(f"[DrinkCounter] Flush on unload failed (attempt {attempt}/{DRINK_UNLOAD_FLUSH_ATTEMPTS}): {e}")
+                if attempt < DRINK_UNLOAD_FLUSH_ATTEMPTS:
+                    await asyncio.sleep(attempt)
+        else:
+            count = self.ledger.spill_pending(DRINK_PENDING_PATH)
+            print(f"[DrinkCounter] ERROR: {count} drink debt changes could not be written; "
+                  f"saved to {DRINK_PENDING_PATH} and replayed on next start")
+        await self.db.detach()
+    
+    async def replay_spilled(self):
+        """Write changes spilled by a failed unload flush, then remove the file"""
+        if not DRINK_PENDING_PATH.exists():
+            return
+        spilled = json.loads(DRINK_PENDING_PATH.read_text())
+        await DrinkLedger.write_rows(self.db, spilled["upserts"], spilled["deletes"])
+        DRINK_PENDING_PATH.unlink()
+        print(f"[DrinkCounter] Replayed {len(spilled['upserts']) + len(spilled['deletes'])} spilled drink debt changes")
+    
+    @tasks.loop()
+    async def flush_loop(self):
+        """Background group commit of pending drink debt changes"""
+        await self.ledger.wait_for_changes()
+        try:
+            await self.ledger.flush()
+        except Exception as e:
+            print(f"[DrinkCounter] Failed to flush drink debts: {e}")
+            await asyncio.sleep(DRINK_FLUSH_RETRY_DELAY)
+    
     async def init_db(self):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.connection() as db:
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS drink_debts_v2 (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -174,90 +996,304 @@ class DrinkCounter(commands.Cog):
                     UNIQUE(guild_id, channel_id, debtor_id, creditor_id)
                 )
             """)
+            
+            # Covering index for the ledger's channel load and amount-ordered channel scans.
+            # Creditor-side lookups are answered from the in-memory ledger, so the old
+            # creditor index only cost writes
+            await db.execute("DROP INDEX IF EXISTS idx_drink_debts_v2_creditor")
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_drink_debts_v2_amount
+                ON drink_debts_v2 (guild_id, channel_id, amount DESC, debtor_id, creditor_id)
+            """)
+            
+            # Materialized per-guild totals across all channels, kept current by triggers
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS drink_debt_totals (
+                    guild_id INTEGER NOT NULL,
+                    debtor_id INTEGER NOT NULL,
+                    creditor_id INTEGER NOT NULL,
+                    amount INTEGER NOT NULL,
+                    PRIMARY KEY (guild_id, debtor_id, creditor_id)
+                ) WITHOUT ROWID
+            """)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_drink_debt_totals_creditor
+                ON drink_debt_totals (guild_id, creditor_id, debtor_id, amount)
+            """)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_drink_debt_totals_amount
+                ON drink_debt_totals (guild_id, amount DESC, debtor_id, creditor_id)
+            """)
+            
+            # Backfill once for databases created before the totals table existed
+            cursor = await db.execute("SELECT EXISTS (SELECT 1 FROM drink_debt_totals)")
+            if not (await cursor.fetchone())[0]:
+                await db.execute("""
+                    INSERT INTO drink_debt_totals (guild_id, debtor_id, creditor_id, amount)
+                    SELECT guild_id, debtor_id, creditor_id, SUM(amount) FROM drink_debts_v2
+                    WHERE amount > 0 GROUP BY guild_id, debtor_id, creditor_id
+                """)
+            
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_drink_debts_v2_insert AFTER INSERT ON drink_debts_v2
+                BEGIN
+                    INSERT INTO drink_debt_totals (guild_id, debtor_id, creditor_id, amount)
+                    VALUES (NEW.guild_id, NEW.debtor_id, NEW.creditor_id, NEW.amount)
+                    ON CONFLICT (guild_id, debtor_id, creditor_id) DO UPDATE SET amount = amount + excluded.amount;
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_drink_debts_v2_update AFTER UPDATE OF amount ON drink_debts_v2
+                BEGIN
+                    UPDATE drink_debt_totals SET amount = amount + NEW.amount - OLD.amount
+                    WHERE guild_id = NEW.guild_id AND debtor_id = NEW.debtor_id AND creditor_id = NEW.creditor_id;
+                    DELETE FROM drink_debt_totals
+                    WHERE guild_id = NEW.guild_id AND debtor_id = NEW.debtor_id AND creditor_id = NEW.creditor_id AND amount <= 0;
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_drink_debts_v2_delete AFTER DELETE ON drink_debts_v2
+                BEGIN
+                    UPDATE drink_debt_totals SET amount = amount - OLD.amount
+                    WHERE guild_id = OLD.guild_id AND debtor_id = OLD.debtor_id AND creditor_id = OLD.creditor_id;
+                    DELETE FROM drink_debt_totals
+                    WHERE guild_id = OLD.guild_id AND debtor_id = OLD.debtor_id AND creditor_id = OLD.creditor_id AND amount <= 0;
+                END
+            """)
             await db.commit()
     
     async def add_drink_debt(self, guild_id: int, channel_id: int, debtor_id: int, 
                              creditor_id: int, amount: int = 1, reason: str = None) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT amount FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND debtor_id = ? AND creditor_id = ?",
-                (guild_id, channel_id, debtor_id, creditor_id)
-            )
-            row = await cursor.fetchone()
-            
-            if row:
-                new_amount = row[0] + amount
-                await db.execute(
-                    "UPDATE drink_debts_v2 SET amount = ? WHERE guild_id = ? AND channel_id = ? AND debtor_id = ? AND creditor_id = ?",
-                    (new_amount, guild_id, channel_id, debtor_id, creditor_id)
-                )
-            else:
-                new_amount = amount
-                await db.execute(
-                    "INSERT INTO drink_debts_v2 (guild_id, channel_id, debtor_id, creditor_id, amount, reason) VALUES (?, ?, ?, ?, ?, ?)",
-                    (guild_id, channel_id, debtor_id, creditor_id, amount, reason)
-                )
-            
-            await db.commit()
-            return new_amount
+        return await self.ledger.add(guild_id, channel_id, debtor_id, creditor_id, amount, reason)
     
     async def pay_drink_debt(self, guild_id: int, channel_id: int, debtor_id: int, 
                              creditor_id: int, amount: int = 1) -> tuple[bool, int]:
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT amount FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND debtor_id = ? AND creditor_id = ?",
-                (guild_id, channel_id, debtor_id, creditor_id)
-            )
-            row = await cursor.fetchone()
-            
-            if not row or row[0] <= 0:
-                return False, 0
-            
-            new_amount = max(0, row[0] - amount)
-            
-            if new_amount == 0:
-                await db.execute(
-                    "DELETE FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND debtor_id = ? AND creditor_id = ?",
-                    (guild_id, channel_id, debtor_id, creditor_id)
-                )
-            else:
-                await db.execute(
-                    "UPDATE drink_debts_v2 SET amount = ? WHERE guild_id = ? AND channel_id = ? AND debtor_id = ? AND creditor_id = ?",
-                    (new_amount, guild_id, channel_id, debtor_id, creditor_id)
-                )
-            
-            await db.commit()
-            return True, new_amount
+        return await self.ledger.pay(guild_id, channel_id, debtor_id, creditor_id, amount)
     
     async def get_user_debts(self, guild_id: int, channel_id: int, user_id: int) -> dict:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
+        debts = await self.ledger.channel(guild_id, channel_id)
+        return {
+            "owes": [(creditor_id, amt) for (debtor_id, creditor_id), amt in debts.items() if debtor_id == user_id],
+            "owed": [(debtor_id, amt) for (debtor_id, creditor_id), amt in debts.items() if creditor_id == user_id]
+        }
+    
+    async def get_top_debts(self, guild_id: int, channel_id: int, limit: int = LEADERBOARD_SIZE) -> list:
+        top = await self.ledger.top(guild_id, channel_id, limit)
+        return [{"debtor_id": d, "creditor_id": c, "amount": amt} for d, c, amt in top]
+    
+    async def get_all_debts(self, guild_id: int, channel_id: int) -> list:
+        debts = await self.ledger.channel(guild_id, channel_id)
+        rows = [{"debtor_id": d, "creditor_id": c, "amount": amt} for (d, c), amt in debts.items()]
+        rows.sort(key=lambda row: row["amount"], reverse=True)
+        return rows
+
+    async def get_server_user_debts(self, guild_id: int, user_id: int) -> dict:
+        # Totals are maintained by triggers on written rows; changes still pending in
+        # the ledger are added on top
+        async with self.ledger.consistent_read(), self.db.connection() as db:
             cursor = await db.execute(
-                "SELECT creditor_id, amount FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND debtor_id = ? AND amount > 0",
-                (guild_id, channel_id, user_id)
+                "SELECT creditor_id, amount FROM drink_debt_totals WHERE guild_id = ? AND debtor_id = ?",
+                (guild_id, user_id)
             )
-            owes = await cursor.fetchall()
+            owes = {row["creditor_id"]: row["amount"] for row in await cursor.fetchall()}
             
             cursor = await db.execute(
-                "SELECT debtor_id, amount FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND creditor_id = ? AND amount > 0",
-                (guild_id, channel_id, user_id)
+                "SELECT debtor_id, amount FROM drink_debt_totals WHERE guild_id = ? AND creditor_id = ?",
+                (guild_id, user_id)
             )
-            owed = await cursor.fetchall()
-            
-            return {
-                "owes": [(row["creditor_id"], row["amount"]) for row in owes],
-                "owed": [(row["debtor_id"], row["amount"]) for row in owed]
-            }
+            owed = {row["debtor_id"]: row["amount"] for row in await cursor.fetchall()}
+            deltas = self.ledger.pending_deltas(guild_id)
+        
+        for (debtor_id, creditor_id), delta in deltas.items():
+            if debtor_id == user_id:
+                owes[creditor_id] = owes.get(creditor_id, 0) + delta
+            elif creditor_id == user_id:
+                owed[debtor_id] = owed.get(debtor_id, 0) + delta
+        return {
+            "owes": [(uid, amt) for uid, amt in owes.items() if amt > 0],
+            "owed": [(uid, amt) for uid, amt in owed.items() if amt > 0]
+        }
     
-    async def get_all_debts(self, guild_id: int, channel_id: int) -> list:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+    async def get_server_top_debts(self, guild_id: int, limit: int = LEADERBOARD_SIZE) -> list:
+        async with self.ledger.consistent_read(), self.db.connection() as db:
+            deltas = self.ledger.pending_deltas(guild_id)
+            # Every row beyond the first limit + len(deltas) is unchanged and smaller than
+            # `limit` unchanged rows, so it can't make the board
             cursor = await db.execute(
-                "SELECT debtor_id, creditor_id, amount FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND amount > 0 ORDER BY amount DESC",
-                (guild_id, channel_id)
+                "SELECT debtor_id, creditor_id, amount FROM drink_debt_totals WHERE guild_id = ? ORDER BY amount DESC LIMIT ?",
+                (guild_id, limit + len(deltas))
             )
-            return await cursor.fetchall()
+            totals = {(row["debtor_id"], row["creditor_id"]): row["amount"] for row in await cursor.fetchall()}
+            missing = [pair for pair in deltas if pair not in totals]
+            if missing:
+                cursor = await db.execute(
+                    f"""SELECT debtor_id, creditor_id, amount FROM drink_debt_totals WHERE guild_id = ?
+                        AND (debtor_id, creditor_id) IN (VALUES {', '.join(['(?, ?)'] * len(missing))})""",
+                    (guild_id, *itertools.chain.from_iterable(missing))
+                )
+                totals.update({(row["debtor_id"], row["creditor_id"]): row["amount"] for row in await cursor.fetchall()})
+        
+        for pair, delta in deltas.items():
+            totals[pair] = totals.get(pair, 0) + delta
+        ranked = sorted(((-amt, d, c) for (d, c), amt in totals.items() if amt > 0))[:limit]
+        return [{"debtor_id": d, "creditor_id": c, "amount": -neg_amt} for neg_amt, d, c in ranked]
+    
+    async def add_drink_debts(self, guild_id: int, channel_id: int, 
+                              entries: list[tuple[int, int, int]], reason: str = None) -> list[int]:
+        return await self.ledger.add_many(guild_id, channel_id, entries, reason)
+    
+    def parse_bulk_debts(self, guild: discord.Guild, entries_text: str) -> tuple[list, list]:
+        """Parse '@debtor @creditor [@creditor ...] [amount]' lines (newline or ';' separated).
+
+        Returns (entries, errors); entries are (debtor_id, creditor_id, amount) and
+        nothing should be applied unless errors is empty.
+        """
+        entries = []
+        errors = []
+        
+        for line in re.split(r"[;\n]", entries_text):
+            if not line.strip(): continue
+            
+            user_ids = [int(uid) for uid in MENTION_RE.findall(line)]
+            # Allow the natural "@A owes @B, @C 2 each" phrasing
+            rest = [word for word in MENTION_RE.sub("", line).replace(",", " ").split()
+                    if word.lower() not in ("owes", "owe", "each")]
+            
+            if len(user_ids) < 2:
+                errors.append(f"❌ `{line.strip()}` -> Needs a debtor and at least one creditor")
+                continue
+            
+            unknown = [word for word in rest if not re.fullmatch(r"[+-]?\d+", word)]
+            if unknown:
+                errors.append(f"❌ `{line.strip()}` -> Don't understand `{unknown[0]}`")
+                continue
+            if len(rest) > 1:
+                errors.append(f"❌ `{line.strip()}` -> Only one amount per entry")
+                continue
+            amount = int(rest[0]) if rest else 1
+            if amount <= 0 or amount > 100:
+                errors.append(f"❌ `{line.strip()}` -> Amount: 1-100!")
+                continue
+            
+            debtor_id, creditor_ids = user_ids[0], user_ids[1:]
+            if any(guild.get_member(uid) is None for uid in user_ids):
+                errors.append(f"❌ `{line.strip()}` -> Unknown member")
+                continue
+            if debtor_id in creditor_ids:
+                errors.append(f"❌ `{line.strip()}` -> Can't owe yourself!")
+                continue
+            if len(set(creditor_ids)) < len(creditor_ids):
+                errors.append(f"❌ `{line.strip()}` -> Same creditor listed twice")
+                continue
+            
+            entries.extend((debtor_id, creditor_id, amount) for creditor_id in creditor_ids)
+        
+        return entries, errors
+    
+    async def settle_channel(self, guild_id: int, channel_id: int, apply: bool = False) -> tuple[int, list]:
+        return await self.ledger.settle(guild_id, channel_id, apply)
+    
+    # ===== RENDERING =====
+    
+    def _render_stamp(self, guild: discord.Guild, channel, server: bool) -> tuple:
+        if server:
+            return (self.ledger.guild_version(guild.id), self.name_versions.get(guild.id, 0), guild.name)
+        return (self.ledger.version(guild.id, channel.id), self.name_versions.get(guild.id, 0), channel.name)
+    
+    def _scope_footer(self, guild: discord.Guild, channel, server: bool) -> str:
+        return f"🌐 {guild.name} (all channels)" if server else f"#{channel.name}"
+    
+    def _cached_embed(self, key: tuple, stamp: tuple) -> Optional[discord.Embed]:
+        cached = self.render_cache.get(key)
+        if cached is None or cached[0] != stamp:
+            return None
+        self.render_cache.move_to_end(key)
+        return cached[1]
+    
+    def _store_embed(self, key: tuple, stamp: tuple, embed: discord.Embed):
+        self.render_cache[key] = (stamp, embed)
+        self.render_cache.move_to_end(key)
+        if len(self.render_cache) > RENDER_CACHE_SIZE:
+            self.render_cache.popitem(last=False)
+    
+    async def render_drinks(self, guild: discord.Guild, channel, target: discord.Member, 
+                            server: bool = False) -> discord.Embed:
+        key = ("drinks", guild.id if server else channel.id, target.id, server)
+        stamp = self._render_stamp(guild, channel, server)
+        embed = self._cached_embed(key, stamp)
+        if embed is not None:
+            return embed
+        
+        if server:
+            debts = await self.get_server_user_debts(guild.id, target.id)
+        else:
+            debts = await self.get_user_debts(guild.id, channel.id, target.id)
+        embed = discord.Embed(title=f"🍻 {target.display_name}", color=discord.Color.gold())
+        
+        if debts["owes"]:
+            owes_text = "\n".join([f"• {member_name(guild, cid)}: {amt} 🍺" for cid, amt in debts["owes"]])
+            embed.add_field(name=f"📤 Owes ({sum(a for _, a in debts['owes'])})", value=owes_text, inline=False)
+        else:
+            embed.add_field(name="📤 Owes", value="Nobody! 🎉", inline=False)
+        
+        if debts["owed"]:
+            owed_text = "\n".join([f"• {member_name(guild, did)}: {amt} 🍺" for did, amt in debts["owed"]])
+            embed.add_field(name=f"📥 Owed ({sum(a for _, a in debts['owed'])})", value=owed_text, inline=False)
+        else:
+            embed.add_field(name="📥 Owed", value="None", inline=False)
+        
+        embed.set_footer(text=self._scope_footer(guild, channel, server))
+        self._store_embed(key, stamp, embed)
+        return embed
+    
+    async def render_leaderboard(self, guild: discord.Guild, channel, server: bool = False) -> discord.Embed:
+        key = ("leaderboard", guild.id if server else channel.id, server)
+        stamp = self._render_stamp(guild, channel, server)
+        embed = self._cached_embed(key, stamp)
+        if embed is not None:
+            return embed
+        
+        if server:
+            debts = await self.get_server_top_debts(guild.id)
+        else:
+            debts = await self.get_top_debts(guild.id, channel.id)
+        
+        if not debts:
+            embed = discord.Embed(title="🍻 Leaderboard", description="No debts! 🎉", color=discord.Color.green())
+        else:
+            embed = discord.Embed(title="🍻 Leaderboard", color=discord.Color.gold())
+            debt_text = "\n".join([
+                f"{i}. **{member_name(guild, d['debtor_id'])}** → **{member_name(guild, d['creditor_id'])}**: {d['amount']} 🍺"
+                for i, d in enumerate(debts, 1)
+            ])
+            embed.add_field(name="Debts", value=debt_text, inline=False)
+        
+        embed.set_footer(text=self._scope_footer(guild, channel, server))
+        self._store_embed(key, stamp, embed)
+        return embed
+    
+    def _bump_names(self, guild_id: int):
+        self.name_versions[guild_id] = self.name_versions.get(guild_id, 0) + 1
+    
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.display_name != after.display_name:
+            self._bump_names(after.guild.id)
+    
+    @commands.Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        # Global name changes show through as display_name for members without a nickname
+        if before.display_name != after.display_name:
+            for guild in after.mutual_guilds:
+                self._bump_names(guild.id)
+    
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self._bump_names(member.guild.id)
+    
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self._bump_names(member.guild.id)
 
     # ===== SLASH COMMANDS =====
     
@@ -300,77 +1336,468 @@ class DrinkCounter(commands.Cog):
         await interaction.response.send_message(embed=embed)
     
     @app_commands.command(name="drinks", description="Check drink status")
-    @app_commands.describe(user="User to check (default: yourself)")
-    async def slash_drinks(self, interaction: discord.Interaction, user: discord.Member = None):
+    @app_commands.describe(user="User to check (default: yourself)", scope="This channel or the whole server")
+    @app_commands.choices(scope=DRINK_SCOPES)
+    async def slash_drinks(self, interaction: discord.Interaction, user: discord.Member = None, scope: str = "channel"):
         target = user or interaction.user
-        debts = await self.get_user_debts(interaction.guild.id, interaction.channel.id, target.id)
+        embed = await self.render_drinks(interaction.guild, interaction.channel, target, server=scope == "server")
+        await interaction.response.send_message(embed=embed)
+    
+    @app_commands.command(name="owe_bulk", description="Record many drink debts at once")
+    @app_commands.describe(
+        entries="@debtor @creditor [@creditor ...] [amount each]; separate multiple entries with ;",
+        reason="Reason"
+    )
+    async def slash_owe_bulk(self, interaction: discord.Interaction, entries: str, reason: str = None):
+        parsed, errors = self.parse_bulk_debts(interaction.guild, entries)
         
-        embed = discord.Embed(title=f"🍻 {target.display_name}", color=discord.Color.gold())
+        if errors or not parsed:
+            embed = discord.Embed(
+                title="❌ Nothing Recorded",
+                description="\n".join(errors) if errors else "No input provided.",
+                color=discord.Color.red()
+            )
+            embed.set_footer(text="Format: @debtor @creditor [@creditor ...] [amount]; ...")
+            return await interaction.response.send_message(embed=embed, ephemeral=True)
         
-        if debts["owes"]:
-            owes_text = "\n".join([f"• {interaction.guild.get_member(cid).display_name if interaction.guild.get_member(cid) else '?'}: {amt} 🍺" 
-                                   for cid, amt in debts["owes"]])
-            embed.add_field(name=f"📤 Owes ({sum(a for _, a in debts['owes'])})", value=owes_text, inline=False)
-        else:
-            embed.add_field(name="📤 Owes", value="Nobody! 🎉", inline=False)
+        try:
+            totals = await self.add_drink_debts(interaction.guild.id, interaction.channel.id, parsed, reason)
+        except Exception as e:
+            print(f"[DrinkCounter] Bulk debts failed: {e}")
+            return await interaction.response.send_message(
+                "❌ Couldn't save the debts, so nothing was recorded. Please try again later.", ephemeral=True
+            )
         
-        if debts["owed"]:
-            owed_text = "\n".join([f"• {interaction.guild.get_member(did).display_name if interaction.guild.get_member(did) else '?'}: {amt} 🍺" 
-                                   for did, amt in debts["owed"]])
-            embed.add_field(name=f"📥 Owed ({sum(a for _, a in debts['owed'])})", value=owed_text, inline=False)
-        else:
-            embed.add_field(name="📥 Owed", value="None", inline=False)
+        lines = [
+            f"**{member_name(interaction.guild, d)}** → **{member_name(interaction.guild, c)}**: +{amt} (now {total}) 🍺"
+            for (d, c, amt), total in zip(parsed, totals)
+        ]
+        if len(lines) > LEADERBOARD_SIZE:
+            lines = lines[:LEADERBOARD_SIZE] + [f"...and {len(lines) - LEADERBOARD_SIZE} more"]
         
+        embed = discord.Embed(
+            title=f"🍻 {len(parsed)} Drink Debts Added!",
+            description="\n".join(lines) + (f"\n📝 Reason: {reason}" if reason else ""),
+            color=discord.Color.orange()
+        )
         embed.set_footer(text=f"#{interaction.channel.name}")
         await interaction.response.send_message(embed=embed)
     
-    @app_commands.command(name="leaderboard", description="Show all drink debts in this channel")
-    async def slash_leaderboard(self, interaction: discord.Interaction):
-        debts = await self.get_all_debts(interaction.guild.id, interaction.channel.id)
+    @app_commands.command(name="settle", description="Net out this channel's drink debts into as few as possible")
+    @app_commands.describe(apply="Replace the channel's debts with the settlement (default: preview only)")
+    async def slash_settle(self, interaction: discord.Interaction, apply: bool = False):
+        # Applying rewrites everyone's debts in the channel, so it's for server managers only
+        if apply and not interaction.user.guild_permissions.manage_guild:
+            return await interaction.response.send_message(
+                "❌ You need the Manage Server permission to apply a settlement. Run /settle to preview it.", ephemeral=True
+            )
         
-        if not debts:
-            embed = discord.Embed(title="🍻 Leaderboard", description="No debts! 🎉", color=discord.Color.green())
+        try:
+            before, transfers = await self.settle_channel(interaction.guild.id, interaction.channel.id, apply)
+        except Exception as e:
+            print(f"[DrinkCounter] Settlement failed: {e}")
+            return await interaction.response.send_message(
+                "❌ Couldn't save the settlement, so nothing was changed. Please try again later.", ephemeral=True
+            )
+        
+        if not transfers:
+            embed = discord.Embed(title="🤝 Settlement", description="No debts to settle! 🎉", color=discord.Color.green())
         else:
-            embed = discord.Embed(title="🍻 Leaderboard", color=discord.Color.gold())
-            debt_text = "\n".join([
-                f"{i}. **{interaction.guild.get_member(d['debtor_id']).display_name if interaction.guild.get_member(d['debtor_id']) else '?'}** → "
-                f"**{interaction.guild.get_member(d['creditor_id']).display_name if interaction.guild.get_member(d['creditor_id']) else '?'}**: {d['amount']} 🍺"
-                for i, d in enumerate(debts[:15], 1)
+            embed = discord.Embed(
+                title="🤝 Debts Settled!" if apply else "🤝 Settlement Preview",
+                color=discord.Color.green() if apply else discord.Color.gold()
+            )
+            transfer_text = "\n".join([
+                f"**{member_name(interaction.guild, d)}** → **{member_name(interaction.guild, c)}**: {amt} 🍺"
+                for d, c, amt in transfers[:LEADERBOARD_SIZE]
             ])
-            embed.add_field(name="Debts", value=debt_text, inline=False)
+            if len(transfers) > LEADERBOARD_SIZE:
+                transfer_text += f"\n...and {len(transfers) - LEADERBOARD_SIZE} more"
+            embed.add_field(name=f"Transfers ({before} debts → {len(transfers)})", value=transfer_text, inline=False)
         
-        embed.set_footer(text=f"#{interaction.channel.name}")
+        hint = " | A server manager can run /settle apply:True to apply" if transfers and not apply else ""
+        embed.set_footer(text=f"#{interaction.channel.name}{hint}")
+        await interaction.response.send_message(embed=embed)
+    
+    @app_commands.command(name="leaderboard", description="Show all drink debts in this channel")
+    @app_commands.describe(scope="This channel or the whole server")
+    @app_commands.choices(scope=DRINK_SCOPES)
+    async def slash_leaderboard(self, interaction: discord.Interaction, scope: str = "channel"):
+        embed = await self.render_leaderboard(interaction.guild, interaction.channel, server=scope == "server")
         await interaction.response.send_message(embed=embed)
 
 
 # ========================= EVENT ANNOUNCER COG =========================
 
+# ===== EVENT PARSING =====
+# Plain functions so whole files can be parsed in a worker thread.
+
+EVENT_DATE_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})(?:/(\d{1,2}):(\d{2}))?")
+ISO_DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::\d{2})?)?")
+ICS_DATE_RE = re.compile(r"(\d{4})(\d{2})(\d{2})(?:T(\d{2})(\d{2})(\d{2})?(Z)?)?")
+PAST_EVENT = "Event is in the past"
+
+def parse_event_date(text: str) -> tuple[datetime, bool]:
+    """MM/DD/YYYY[/HH:MM] or YYYY-MM-DD[ HH:MM] in HK time -> (datetime, has_time)"""
+    text = text.strip()
+    match = EVENT_DATE_RE.fullmatch(text)
+    if match:
+        month, day, year, hour, minute = match.groups()
+    else:
+        match = ISO_DATE_RE.fullmatch(text)
+        if not match:
+            raise ValueError("Invalid date")
+        year, month, day, hour, minute = match.groups()
+    return datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0)), hour is not None
+
+def validate_events(records, now: float) -> tuple[list, list]:
+    """Check (line_no, raw, date, name, role, recurrence) records.
+
+    Returns (events, errors): events are (event_date epoch, name, has_time, role_mention,
+    rrule, ends_at), errors are (line_no, raw, reason).
+    """
+    events, errors = [], []
+    for line_no, raw, date_text, name, role, recurrence in records:
+        try:
+            dt, has_time = parse_event_date(date_text)
+        except ValueError:
+            errors.append((line_no, raw, "Invalid date"))
+            continue
+        if not name:
+            errors.append((line_no, raw, "Missing event name"))
+            continue
+        rule = None
+        if recurrence:
+            try:
+                rule = RecurrenceRule.parse(recurrence)
+            except ValueError:
+                errors.append((line_no, raw, "Invalid recurrence"))
+                continue
+        event_ts = hk_to_epoch(dt)
+        # A series is fine as long as it still has an occurrence to come
+        if (next(rule.occurrences(event_ts, now), None) is None) if rule else event_ts < now:
+            errors.append((line_no, raw, PAST_EVENT))
+            continue
+        events.append((event_ts, name, has_time, role or None,
+                       str(rule) if rule else None, rule.last_occurrence(event_ts) if rule else None))
+    return events, errors
+
+def text_records(text: str):
+    """`MM/DD/YYYY/HH:MM|Name|@Role|Recurrence` lines"""
+    for line_no, line in enumerate(text.strip().split('\n'), 1):
+        if not line.strip():
+            continue
+        parts = [part.strip() for part in line.split('|')] + [None, None]
+        yield line_no, line, parts[0], parts[1] or "", parts[2] or None, parts[3]
+
+def csv_records(lines):
+    """date,name[,role[,recurrence]] rows; a header row is skipped"""
+    reader = csv.reader(lines)
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if reader.line_num == 1 and row[0].strip().lower() in ("date", "event_date"):
+            continue
+        cells = [cell.strip() for cell in row] + ["", "", ""]
+        yield reader.line_num, ",".join(row), cells[0], cells[1], cells[2] or None, cells[3] or None
+
+def _ics_lines(lines):
+    """Unfold iCalendar continuation lines, keeping the number of each logical line's first line"""
+    current, start = None, 0
+    for line_no, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, line_no
+    if current is not None:
+        yield start, current
+
+def _ics_date(value: str, params: list[str]) -> str:
+    """DTSTART value -> HK time as YYYY-MM-DD[ HH:MM] (floating times are taken as HK time)"""
+    match = ICS_DATE_RE.fullmatch(value.strip())
+    if not match:
+        return value
+    year, month, day, hour, minute, _, utc = match.groups()
+    if hour is None:
+        return f"{year}-{month}-{day}"
+    dt = datetime(int(year), int(month), int(day), int(hour), int(minute))
+    tzid = next((p.split("=", 1)[1] for p in params if p.upper().startswith("TZID=")), None)
+    zone = timezone.utc if utc else None
+    if zone is None and tzid:
+        try:
+            from zoneinfo import ZoneInfo
+            zone = ZoneInfo(tzid.strip('"'))
+        except Exception:
+            zone = None  # Unknown zone: treat as HK time
+    if zone is not None:
+        dt = dt.replace(tzinfo=zone).astimezone(HK_TZ).replace(tzinfo=None)
+    return dt.strftime("%Y-%m-%d %H:%M")
+
+def ics_records(lines):
+    """One record per VEVENT (DTSTART, SUMMARY and RRULE)"""
+    event = None
+    for line_no, line in _ics_lines(lines):
+        name, _, value = line.partition(":")
+        prop, *params = name.split(";")
+        prop = prop.upper()
+        if prop == "BEGIN" and value.upper() == "VEVENT":
+            event = {"line": line_no}
+        elif event is None:
+            continue
+        elif prop == "END" and value.upper() == "VEVENT":
+            summary = event.get("SUMMARY", "")
+            yield (event["line"], f"{event.get('DTSTART', '')} {summary}".strip(), event.get("DTSTART", ""),
+                   summary, None, event.get("RRULE"))
+            event = None
+        elif prop == "DTSTART":
+            event["DTSTART"] = _ics_date(value, params)
+        elif prop == "RRULE":
+            event["RRULE"] = value
+        elif prop == "SUMMARY":
+            event["SUMMARY"] = value.replace("\\,", ",").replace("\\;", ";").replace("\\n", " ").strip()
+
+RECURRENCE_SHORTHANDS = {
+    "daily": "FREQ=DAILY",
+    "weekly": "FREQ=WEEKLY",
+    "biweekly": "FREQ=WEEKLY;INTERVAL=2",
+    "monthly": "FREQ=MONTHLY",
+}
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+class RecurrenceRule:
+    """The supported RRULE subset: FREQ=DAILY/WEEKLY/MONTHLY with INTERVAL, BYDAY (weekly),
+    COUNT and UNTIL. Occurrences are generated on demand in HK wall-clock time, jumping
+    straight to the requested point of the series, so cost doesn't depend on its age.
+    Monthly series fall on the start's day of the month, or the month's last day if shorter.
+    """
+
+    def __init__(self, freq: str, interval: int = 1, byday: tuple[int, ...] = (),
+                 count: Optional[int] = None, until: Optional[int] = None):
+        self.freq = freq
+        self.interval = interval
+        self.byday = byday
+        self.count = count
+        self.until = until
+
+    @classmethod
+    def parse(cls, text: str) -> "RecurrenceRule":
+        text = text.strip()
+        text = RECURRENCE_SHORTHANDS.get(text.lower(), text)
+        if text.upper().startswith("RRULE:"):
+            text = text[6:]
+        parts = dict(part.split("=", 1) for part in text.upper().split(";") if part)
+        freq = parts.pop("FREQ", None)
+        if freq not in ("DAILY", "WEEKLY", "MONTHLY"):
+            raise ValueError("Unsupported recurrence")
+        interval = int(parts.pop("INTERVAL", 1))
+        byday = tuple(sorted({WEEKDAYS.index(day) for day in parts.pop("BYDAY", "").split(",") if day}))
+        if byday and freq != "WEEKLY":
+            raise ValueError("BYDAY is only supported for weekly events")
+        count = int(parts["COUNT"]) if "COUNT" in parts else None
+        parts.pop("COUNT", None)
+        until = None
+        if "UNTIL" in parts:
+            value = parts.pop("UNTIL")
+            until_dt = _ics_date(value, [])
+            dt, has_time = parse_event_date(until_dt)
+            # A date-only UNTIL includes that whole day
+            until = hk_to_epoch(dt if has_time else dt + timedelta(days=1)) - (0 if has_time else 1)
+        parts.pop("WKST", None)
+        if parts or interval < 1 or (count is not None and count < 1):
+            raise ValueError("Unsupported recurrence")
+        return cls(freq, interval, byday, count, until)
+
+    def __str__(self) -> str:
+        text = f"FREQ={self.freq}"
+        if self.interval != 1:
+            text += f";INTERVAL={self.interval}"
+        if self.byday:
+            text += ";BYDAY=" + ",".join(WEEKDAYS[day] for day in self.byday)
+        if self.count is not None:
+            text += f";COUNT={self.count}"
+        if self.until is not None:
+            text += ";UNTIL=" + datetime.fromtimestamp(self.until, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        return text
+
+    def describe(self) -> str:
+        unit = {"DAILY": "day", "WEEKLY": "week", "MONTHLY": "month"}[self.freq]
+        text = f"every {unit}" if self.interval == 1 else f"every {self.interval} {unit}s"
+        if self.byday:
+            text += " on " + ", ".join(WEEKDAYS[day].title() for day in self.byday)
+        if self.count is not None:
+            text += f", {self.count} times"
+        if self.until is not None:
+            text += f", until {epoch_to_hk(self.until).strftime('%m/%d/%Y')}"
+        return text
+
+    @property
+    def min_gap(self) -> int:
+        """Shortest time between two occurrences (seconds)"""
+        days = {"DAILY": 1, "WEEKLY": 7, "MONTHLY": 28}[self.freq] * self.interval
+        if len(self.byday) > 1:
+            gaps = [b - a for a, b in zip(self.byday, self.byday[1:])] + [self.byday[0] + 7 * self.interval - self.byday[-1]]
+            days = min(gaps)
+        return days * 86400
+
+    def _occurrence(self, start: datetime, index: int) -> datetime:
+        """The index-th candidate date counted from the start (before COUNT/UNTIL)"""
+        if self.freq == "DAILY":
+            return start + timedelta(days=index * self.interval)
+        if self.freq == "MONTHLY":
+            month = start.month - 1 + index * self.interval
+            year, month = start.year + month // 12, month % 12 + 1
+            last_day = (datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+            return start.replace(year=year, month=month, day=min(start.day, last_day))
+        if not self.byday:
+            return start + timedelta(weeks=index * self.interval)
+        # Weekly on several days: candidates are numbered from the start's week, skipping days before the start
+        index += sum(1 for day in self.byday if day < start.weekday())
+        week, slot = divmod(index, len(self.byday))
+        monday = start - timedelta(days=start.weekday())
+        return monday + timedelta(weeks=week * self.interval, days=self.byday[slot])
+
+    def _first_index(self, start: datetime, earliest: datetime) -> int:
+        """An index at or just before the first occurrence >= earliest"""
+        if earliest <= start:
+            return 0
+        days = (earliest - start).days
+        if self.freq == "DAILY":
+            return days // self.interval
+        if self.freq == "MONTHLY":
+            months = (earliest.year - start.year) * 12 + earliest.month - start.month
+            return max(0, months // self.interval - 1)
+        weeks = days // (7 * self.interval)
+        return max(0, weeks * max(1, len(self.byday)) - len(self.byday))
+
+    def occurrences(self, start_ts: int, earliest_ts: float = 0):
+        """Yield occurrence timestamps >= earliest_ts, in order"""
+        start = epoch_to_hk(start_ts)
+        index = self._first_index(start, epoch_to_hk(max(earliest_ts, start_ts)))
+        while self.count is None or index < self.count:
+            occurrence = hk_to_epoch(self._occurrence(start, index))
+            if self.until is not None and occurrence > self.until:
+                return
+            if occurrence >= earliest_ts:
+                yield occurrence
+            index += 1
+
+    def next_occurrence(self, start_ts: int, earliest_ts: float = 0) -> Optional[int]:
+        """The first occurrence >= earliest_ts: None once the series is over"""
+        return next(self.occurrences(start_ts, earliest_ts), None)
+
+    def last_occurrence(self, start_ts: int) -> Optional[int]:
+        """When the series ends: None if it never does"""
+        if self.count is not None:
+            last = hk_to_epoch(self._occurrence(epoch_to_hk(start_ts), self.count - 1))
+            return min(last, self.until) if self.until is not None else last
+        return self.until
+
+
+def parse_event_file(data: bytes, filename: str, now: float) -> tuple[list, list]:
+    """Parse an uploaded CSV or .ics file (runs in a worker thread)"""
+    text = data.decode("utf-8-sig", errors="replace")
+    lines = io.StringIO(text, newline="")
+    if filename.lower().endswith(".ics") or text.lstrip().upper().startswith("BEGIN:VCALENDAR"):
+        return validate_events(ics_records(lines), now)
+    return validate_events(csv_records(lines), now)
+
+
+class EventPageView(discord.ui.View):
+    """Prev/next buttons for /view_events. Each click fetches just the page it shows."""
+
+    def __init__(self, cog: "EventAnnouncer", days: Optional[int], role_mention: Optional[str]):
+        super().__init__(timeout=EVENTS_VIEW_TIMEOUT)
+        self.cog = cog
+        self.days = days
+        self.role_mention = role_mention
+        # Keyset cursor (event_date, id) each visited page starts after; None = first page
+        self.starts: list[Optional[tuple[int, int]]] = [None]
+        self.next_start: Optional[tuple[int, int]] = None
+        self.message: Optional[discord.Message] = None
+
+    async def render(self) -> discord.Embed:
+        embed, self.next_start = await self.cog.events_page(self.starts[-1], len(self.starts), self.days, self.role_mention)
+        self.prev_button.disabled = len(self.starts) == 1
+        self.next_button.disabled = self.next_start is None
+        return embed
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self.starts) > 1:
+            self.starts.pop()
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.next_start is not None:
+            self.starts.append(self.next_start)
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+    async def on_timeout(self):
+        if self.message is not None:
+            for item in self.children:
+                item.disabled = True
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+
 class EventAnnouncer(commands.Cog):
     """Cog for managing and announcing events automatically"""
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.db_path = DB_PATH
+        self.db: Optional[Database] = None
+        # Min-heap of (due epoch seconds, event_id, "1w"/"1d", generation, occurrence). Editing or
+        # removing an event bumps/drops its generation; outdated entries are skipped when popped.
+        # A recurring series only ever has its next occurrence in here.
+        self.deadlines = []
+        self.generations = {}
+        self.stale_deadlines = 0
+        # (event_id, kind) -> failed attempts so far, for retry back-off
+        self.retries: dict[tuple[int, str], int] = {}
+        self.wakeup = asyncio.Event()
+        self._scheduler_task: Optional[asyncio.Task] = None
+        # Rendered /view_events pages: (cursor, page, days, role) -> (stamp, embed, next cursor)
+        self.page_cache: OrderedDict[tuple, tuple[tuple, discord.Embed, Optional[tuple[int, int]]]] = OrderedDict()
+        # Bumped whenever events change, so cached pages are never stale
+        self.events_version = 0
     
     async def cog_load(self):
+        self.db = await Database.attach(self.bot)
         await self.init_db()
-        self.event_check_loop.start()
-        print(f"[EventAnnouncer] Cog loaded! Checking events every 30 minutes in HK Time.")
+        self._scheduler_task = asyncio.create_task(self.run_scheduler())
+        self.cleanup_loop.start()
+        print(f"[EventAnnouncer] Cog loaded! Announcing events on schedule in HK Time.")
 
     async def cog_unload(self):
-        self.event_check_loop.cancel()
+        if self._scheduler_task is not None:
+            self._scheduler_task.cancel()
+        self.cleanup_loop.cancel()
+        await self.db.detach()
 
     async def init_db(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            # Create base table
+        async with self.db.connection() as db:
+            # Create base table (event_date is UTC epoch seconds)
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS upcoming_events (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    event_date TIMESTAMP NOT NULL,
+                    event_date INTEGER NOT NULL,
                     event_name TEXT NOT NULL,
                     has_time BOOLEAN NOT NULL,
                     announced_1w BOOLEAN DEFAULT 0,
-                    announced_1d BOOLEAN DEFAULT 0
+                    announced_1d BOOLEAN DEFAULT 0,
+                    role_mention TEXT,
+                    rrule TEXT,
+                    ends_at INTEGER,
+                    announced_through_1w INTEGER NOT NULL DEFAULT 0,
+                    announced_through_1d INTEGER NOT NULL DEFAULT 0,
+                    next_occurrence INTEGER
                 )
             """)
             
@@ -379,97 +1806,329 @@ class EventAnnouncer(commands.Cog):
                 await db.execute("ALTER TABLE upcoming_events ADD COLUMN role_mention TEXT")
             except aiosqlite.OperationalError:
                 pass # Column already exists, safe to ignore
+            
+            # Auto-migrate ISO date strings (HK time) to epoch seconds
+            cursor = await db.execute("PRAGMA table_info(upcoming_events)")
+            columns = {row['name']: row['type'] for row in await cursor.fetchall()}
+            if columns['event_date'].upper() != "INTEGER":
+                await self.migrate_event_dates(db)
+                print("[EventAnnouncer] Migrated upcoming_events to epoch timestamps")
+            
+            # Auto-migrate for recurring events: a series is one row with an rrule, event_date is
+            # its first occurrence, and the latest occurrence announced is kept per announcement
+            for column in ("rrule TEXT", "ends_at INTEGER",
+                           "announced_through_1w INTEGER NOT NULL DEFAULT 0",
+                           "announced_through_1d INTEGER NOT NULL DEFAULT 0",
+                           "next_occurrence INTEGER"):
+                try:
+                    await db.execute(f"ALTER TABLE upcoming_events ADD COLUMN {column}")
+                except aiosqlite.OperationalError:
+                    pass # Column already exists, safe to ignore
+            
+            # The scheduler's startup load finds pending rows through this partial index and reads
+            # rrule and announced_through_* from the table; listings and cleanup go by date
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_upcoming_events_pending
+                ON upcoming_events (event_date, announced_1w) WHERE announced_1d = 0
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_upcoming_events_date ON upcoming_events (event_date, id)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_upcoming_events_role ON upcoming_events (role_mention, event_date, id)")
+            # Series are listed by their next occurrence, with the same (date, id) keyset as one-offs
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_upcoming_events_series
+                ON upcoming_events (next_occurrence, id) WHERE rrule IS NOT NULL
+            """)
+            await self.refresh_next_occurrences(db)
                 
             await db.commit()
 
+    @staticmethod
+    async def migrate_event_dates(db: aiosqlite.Connection):
+        """Rebuild upcoming_events with event_date as INTEGER epoch seconds, in one transaction"""
+        hk_offset = f"{-int(HK_TZ.utcoffset(None).total_seconds())} seconds"
+        if db.in_transaction:
+            await db.commit()
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            # A crash mid-migration can leave the rebuilt table behind; start over from the original
+            await db.execute("DROP TABLE IF EXISTS upcoming_events_new")
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS upcoming_events_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_date INTEGER NOT NULL,
+                    event_name TEXT NOT NULL,
+                    has_time BOOLEAN NOT NULL,
+                    announced_1w BOOLEAN DEFAULT 0,
+                    announced_1d BOOLEAN DEFAULT 0,
+                    role_mention TEXT
+                )
+            """)
+            await db.execute("""
+                INSERT INTO upcoming_events_new (id, event_date, event_name, has_time, announced_1w, announced_1d, role_mention)
+                SELECT id, CAST(strftime('%s', event_date, ?) AS INTEGER), event_name, has_time, announced_1w, announced_1d, role_mention
+                FROM upcoming_events
+                WHERE strftime('%s', event_date) IS NOT NULL
+            """, (hk_offset,))
+            
+            # Rows whose date doesn't parse are kept as they were so they can be fixed by hand
+            cursor = await db.execute(
+                "SELECT id, event_date, event_name FROM upcoming_events WHERE strftime('%s', event_date) IS NULL"
+            )
+            unparsed = await cursor.fetchall()
+            if unparsed:
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS upcoming_events_unmigrated AS
+                    SELECT * FROM upcoming_events WHERE 0
+                """)
+                await db.execute("""
+                    INSERT INTO upcoming_events_unmigrated
+                    SELECT * FROM upcoming_events WHERE strftime('%s', event_date) IS NULL
+                """)
+                for row in unparsed:
+                    print(f"[EventAnnouncer] Couldn't migrate event {row['id']} ({row['event_name']!r}): "
+                          f"bad date {row['event_date']!r}, kept in upcoming_events_unmigrated")
+            
+            await db.execute("DROP TABLE upcoming_events")
+            await db.execute("ALTER TABLE upcoming_events_new RENAME TO upcoming_events")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+    @staticmethod
+    async def refresh_next_occurrences(db: aiosqlite.Connection):
+        """Move next_occurrence of series that have passed it up to their next occurrence from now"""
+        now = int(time.time())
+        cursor = await db.execute("""
+            SELECT id, event_date, rrule FROM upcoming_events
+            WHERE rrule IS NOT NULL AND (next_occurrence IS NULL OR next_occurrence < ?)
+        """, (now,))
+        rows = await cursor.fetchall()
+        await db.executemany(
+            "UPDATE upcoming_events SET next_occurrence = ? WHERE id = ?",
+            [(RecurrenceRule.parse(row['rrule']).next_occurrence(row['event_date'], now), row['id']) for row in rows]
+        )
+
     async def parse_and_store_events(self, input_text: str) -> tuple[list, list]:
         """Parses user input text and stores valid events in DB. Returns (success_list, fail_list)"""
-        success = []
-        failed = []
-        
-        lines = input_text.strip().split('\n')
+        events, errors = validate_events(text_records(input_text), time.time())
+        await self.store_events(events)
         
-        async with aiosqlite.connect(self.db_path) as db:
-            for line in lines:
-                if not line.strip(): continue
-                
-                try:
-                    parts = line.split('|')
-                    date_part = parts[0].strip()
-                    name_part = parts[1].strip()
-                    
-                    # Check if a role was provided
-                    role_mention = parts[2].strip() if len(parts) > 2 else None
-                    
-                    has_time = False
-                    try:
-                        # Try parsing with time first
-                        dt = datetime.strptime(date_part, "%m/%d/%Y/%H:%M")
-                        has_time = True
-                    except ValueError:
-                        # Fallback to date only (assume midnight)
-                        dt = datetime.strptime(date_part, "%m/%d/%Y")
-                    
-                    # Prevent adding past events (using HK Time)
-                    if dt < get_hk_now():
-                        failed.append(f"{line} (Event is in the past)")
-                        continue
-
-                    await db.execute(
-                        "INSERT INTO upcoming_events (event_date, event_name, has_time, role_mention) VALUES (?, ?, ?, ?)",
-                        (dt.isoformat(), name_part, has_time, role_mention)
-                    )
-                    
-                    role_str = f" [Ping: {role_mention}]" if role_mention else ""
-                    success.append(f"✅ **{name_part}** on {dt.strftime('%B %d, %Y' + (' at %H:%M' if has_time else ''))}{role_str}")
-                except Exception as e:
-                    failed.append(f"❌ `{line}` -> Invalid format")
-                    
-            await db.commit()
-            
+        success = []
+        for event_ts, name, has_time, role_mention, rrule, _ in events:
+            dt = epoch_to_hk(event_ts)
+            role_str = f" [Ping: {role_mention}]" if role_mention else ""
+            repeat_str = f" 🔁 {RecurrenceRule.parse(rrule).describe()}" if rrule else ""
+            success.append(f"✅ **{name}** on {dt.strftime('%B %d, %Y' + (' at %H:%M' if has_time else ''))}{role_str}{repeat_str}")
+        failed = [
+            f"{raw} ({PAST_EVENT})" if reason == PAST_EVENT else f"❌ `{raw}` -> Invalid format"
+            for _, raw, reason in errors
+        ]
         return success, failed
 
-    # ===== VIEW EVENTS =====
-    async def get_all_events(self) -> list:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT * FROM upcoming_events ORDER BY event_date ASC")
-            return await cursor.fetchall()
+    async def store_events(self, events: list):
+        """Insert (event_date, name, has_time, role_mention, rrule, ends_at) rows with one executemany and schedule them"""
+        if not events:
+            return
+        now = time.time()
+        rows = [
+            (*event, RecurrenceRule.parse(event[4]).next_occurrence(event[0], now) if event[4] else None)
+            for event in events
+        ]
+        async with self.db.connection() as db:
+            if db.in_transaction:
+                await db.commit()
+            # The write lock keeps other inserts out, so the ids after the highest one ever used are ours
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = await db.execute("""
+                    SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'upcoming_events'), 0),
+                               COALESCE((SELECT MAX(id) FROM upcoming_events), 0))
+                """)
+                first_id = (await cursor.fetchone())[0] + 1
+                await db.executemany(
+                    """INSERT INTO upcoming_events (id, event_date, event_name, has_time, role_mention, rrule, ends_at, next_occurrence)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    [(event_id, *row) for event_id, row in enumerate(rows, first_id)]
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        
+        self.events_version += 1
+        for event_id, (event_ts, _, _, _, rrule, _) in enumerate(events, first_id):
+            if rrule:
+                self.schedule_series(event_id, event_ts, RecurrenceRule.parse(rrule))
+            else:
+                self.schedule(event_id, event_ts)
 
-    async def handle_view_events(self, ctx_or_int):
-        events = await self.get_all_events()
+    # ===== VIEW EVENTS =====
+    async def events_page(self, after: Optional[tuple[int, int]], page: int, days: Optional[int],
+                          role_mention: Optional[str]) -> tuple[discord.Embed, Optional[tuple[int, int]]]:
+        """Render one page of events after a keyset cursor. Returns (embed, cursor of the next page)"""
+        key = (after, page, days, role_mention)
+        stamp = (self.events_version, int(time.time() // EVENTS_PAGE_CACHE_TTL))
+        cached = self.page_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            self.page_cache.move_to_end(key)
+            return cached[1], cached[2]
         
+        # One-offs and series occurrences share the same lower bound: nothing before now is listed
+        now = int(time.time())
+        upper = now + days * 86400 if days is not None else None
+        conditions, params = ["rrule IS NULL", "event_date >= ?"], [now]
+        if after is not None:
+            conditions.append("(event_date, id) > (?, ?)")
+            params += after
+        if upper is not None:
+            conditions.append("event_date <= ?")
+            params.append(upper)
+        if role_mention is not None:
+            conditions.append("role_mention = ?")
+            params.append(role_mention)
+        
+        earliest = max(now, after[0]) if after is not None else now
+        rules = {}
+        
+        def occurrences(row):
+            # Each rule is parsed once per page and expanded from the cursor, not from the series' first date
+            rule = rules.get(row['rrule'])
+            if rule is None:
+                rule = rules[row['rrule']] = RecurrenceRule.parse(row['rrule'])
+            for occurrence in rule.occurrences(row['event_date'], earliest):
+                if upper is not None and occurrence > upper:
+                    return
+                if after is None or (occurrence, row['id']) > after:
+                    yield occurrence
+        
+        # Heap of (event_date, id, row, remaining occurrences); one-offs have no occurrences left to push
+        heap = []
+        
+        def push(row, expansion):
+            occurrence = next(expansion, None)
+            if occurrence is not None:
+                heapq.heappush(heap, (occurrence, row['id'], row, expansion))
+        
+        async with self.db.connection() as db:
+            cursor = await db.execute(
+                f"SELECT * FROM upcoming_events WHERE {' AND '.join(conditions)} ORDER BY event_date, id LIMIT ?",
+                (*params, EVENTS_PAGE_SIZE + 1)
+            )
+            for row in await cursor.fetchall():
+                heap.append((row['event_date'], row['id'], dict(row), None))
+            heapq.heapify(heap)
+            
+            # Series come off the index in (next_occurrence, id) order and join the heap as they are read.
+            # No occurrence still to be listed sorts before its series' key, so while the heap's top is at
+            # or before the last key read it can go on the page; only past that is another batch needed
+            events, series_after, more_series = [], None, True
+            while len(events) <= EVENTS_PAGE_SIZE:
+                if more_series and (not heap or series_after is None or heap[0][:2] > series_after):
+                    series_conditions, series_params = ["rrule IS NOT NULL", "next_occurrence IS NOT NULL"], []
+                    if series_after is not None:
+                        series_conditions.append("(next_occurrence, id) > (?, ?)")
+                        series_params += series_after
+                    if upper is not None:
+                        series_conditions.append("next_occurrence <= ?")
+                        series_params.append(upper)
+                    if role_mention is not None:
+                        series_conditions.append("role_mention = ?")
+                        series_params.append(role_mention)
+                    cursor = await db.execute(
+                        f"SELECT * FROM upcoming_events WHERE {' AND '.join(series_conditions)} "
+                        f"ORDER BY next_occurrence, id LIMIT ?",
+                        (*series_params, EVENTS_SERIES_BATCH)
+                    )
+                    batch = await cursor.fetchall()
+                    more_series = len(batch) == EVENTS_SERIES_BATCH
+                    if batch:
+                        series_after = (batch[-1]['next_occurrence'], batch[-1]['id'])
+                    for row in batch:
+                        row = dict(row)
+                        push(row, occurrences(row))
+                    continue
+                if not heap:
+                    break
+                event_date, _, row, expansion = heapq.heappop(heap)
+                events.append({**row, 'event_date': event_date})
+                if expansion is not None:
+                    push(row, expansion)
+        
+        # The extra row only tells us whether there is a next page
+        next_start = None
+        if len(events) > EVENTS_PAGE_SIZE:
+            events = events[:EVENTS_PAGE_SIZE]
+            next_start = (events[-1]['event_date'], events[-1]['id'])
+        
+        filters = []
+        if days is not None:
+            filters.append(f"next {days} days")
+        if role_mention is not None:
+            filters.append(f"pinging {role_mention}")
+        embed = discord.Embed(title="📅 Upcoming Events", color=discord.Color.blurple())
+        if filters:
+            embed.description = "Showing " + ", ".join(filters)
         if not events:
-            embed = discord.Embed(title="📅 Upcoming Events", description="No upcoming events scheduled!", color=discord.Color.blurple())
-        else:
-            embed = discord.Embed(title="📅 Upcoming Events", color=discord.Color.blurple())
-            for event in events:
-                dt = datetime.fromisoformat(event['event_date'])
-                time_str = dt.strftime('%m/%d/%Y') + (f" at {dt.strftime('%H:%M')}" if event['has_time'] else "")
-                role_str = f" [Ping: {event['role_mention']}]" if event['role_mention'] else ""
-                
-                embed.add_field(
-                    name=f"ID: `{event['id']}` | {event['event_name']}",
-                    value=f"**Date:** {time_str}{role_str}",
-                    inline=False
-                )
+            embed.description = "No upcoming events scheduled!" if page == 1 else "No more events."
+        for event in events:
+            dt = epoch_to_hk(event['event_date'])
+            time_str = dt.strftime('%m/%d/%Y') + (f" at {dt.strftime('%H:%M')}" if event['has_time'] else "")
+            role_str = f" [Ping: {event['role_mention']}]" if event['role_mention'] else ""
+            repeat_str = f"\n🔁 {rules[event['rrule']].describe()}" if event['rrule'] else ""
+            
+            embed.add_field(
+                name=f"ID: `{event['id']}` | {event['event_name']}",
+                value=f"**Date:** {time_str}{role_str}{repeat_str}",
+                inline=False
+            )
+        if page > 1 or next_start is not None:
+            embed.set_footer(text=f"Page {page}")
+        
+        self.page_cache[key] = (stamp, embed, next_start)
+        self.page_cache.move_to_end(key)
+        if len(self.page_cache) > EVENTS_PAGE_CACHE_SIZE:
+            self.page_cache.popitem(last=False)
+        return embed, next_start
+
+    async def handle_view_events(self, ctx_or_int, days: Optional[int] = None, role: Optional[discord.Role] = None):
+        view = EventPageView(self, days, role.mention if role else None)
+        embed = await view.render()
+        # Buttons only when there is more than one page
+        extra = {"view": view} if view.next_start is not None else {}
 
         if isinstance(ctx_or_int, discord.Interaction):
-            await ctx_or_int.response.send_message(embed=embed)
+            await ctx_or_int.response.send_message(embed=embed, **extra)
+            message = await ctx_or_int.original_response() if extra else None
         else:
-            await ctx_or_int.send(embed=embed)
+            message = await ctx_or_int.send(embed=embed, **extra)
+        if extra:
+            view.message = message
+        else:
+            view.stop()
 
     @commands.command(name="view_events")
-    async def prefix_view_events(self, ctx):
-        """List all upcoming events"""
-        await self.handle_view_events(ctx)
+    async def prefix_view_events(self, ctx, days: Optional[int] = None, role: Optional[discord.Role] = None):
+        """List upcoming events, optionally only the next N days and/or one role's"""
+        if days is not None and not 1 <= days <= EVENTS_MAX_DAYS:
+            return await ctx.send(f"❌ `days` must be between 1 and {EVENTS_MAX_DAYS}.")
+        await self.handle_view_events(ctx, days, role)
 
     @app_commands.command(name="view_events", description="List all upcoming events")
-    async def slash_view_events(self, interaction: discord.Interaction):
-        await self.handle_view_events(interaction)
+    @app_commands.describe(days="Only events in the next N days (e.g. 7)", role="Only events that ping this role")
+    async def slash_view_events(self, interaction: discord.Interaction, days: Optional[app_commands.Range[int, 1, EVENTS_MAX_DAYS]] = None,
+                                role: Optional[discord.Role] = None):
+        await self.handle_view_events(interaction, days, role)
 
     # ===== ADD EVENT =====
     async def handle_add_event(self, ctx_or_int, events_text: str):
+        if not events_text.strip():
+            msg = ("❌ Usage: `add_event MM/DD/YYYY/HH:MM | Event Name | @Role | weekly` "
+                   "(one event per line), or attach a CSV/.ics file.")
+            if isinstance(ctx_or_int, discord.Interaction):
+                return await ctx_or_int.response.send_message(msg, ephemeral=True)
+            return await ctx_or_int.send(msg)
+        
         success, failed = await self.parse_and_store_events(events_text)
         
         embed = discord.Embed(title="📅 Event Addition Results", color=discord.Color.blurple())
@@ -477,7 +2136,7 @@ class EventAnnouncer(commands.Cog):
         if success:
             embed.add_field(name="Successfully Added", value="\n".join(success), inline=False)
         if failed:
-            embed.add_field(name="Failed to Add", value="\n".join(failed) + "\n\n*Format: MM/DD/YYYY/HH:MM|Name|@Role*", inline=False)
+            embed.add_field(name="Failed to Add", value="\n".join(failed) + "\n\n*Format: MM/DD/YYYY/HH:MM|Name|@Role|Recurrence*", inline=False)
             
         if not success and not failed:
             embed.description = "No input provided."
@@ -487,22 +2146,60 @@ class EventAnnouncer(commands.Cog):
         else:
             await ctx_or_int.send(embed=embed)
 
+    async def handle_import_events(self, ctx_or_int, attachment: discord.Attachment):
+        """Bulk-add events from a CSV (date,name,role) or iCalendar attachment"""
+        is_interaction = isinstance(ctx_or_int, discord.Interaction)
+        if attachment.size > EVENT_IMPORT_MAX_BYTES:
+            msg = f"❌ File is too large (max {EVENT_IMPORT_MAX_BYTES // 1024 ** 2} MB)."
+            return await (ctx_or_int.response.send_message(msg) if is_interaction else ctx_or_int.send(msg))
+        if is_interaction:
+            await ctx_or_int.response.defer()
+        send = ctx_or_int.followup.send if is_interaction else ctx_or_int.send
+        
+        data = await attachment.read()
+        events, errors = await asyncio.to_thread(parse_event_file, data, attachment.filename, time.time())
+        if len(events) > EVENT_IMPORT_MAX_EVENTS:
+            return await send(f"❌ Too many events ({len(events)}); the limit is {EVENT_IMPORT_MAX_EVENTS} per file.")
+        await self.store_events(events)
+        
+        embed = discord.Embed(title="📅 Event Import Results", color=discord.Color.blurple())
+        embed.add_field(name="Imported", value=f"{len(events)} events from `{attachment.filename}`", inline=False)
+        if not errors:
+            return await send(embed=embed)
+        
+        embed.add_field(name="Skipped", value=f"{len(errors)} lines, see the attached report", inline=False)
+        report = "\n".join(f"line {line_no}: {raw} -> {reason}" for line_no, raw, reason in errors)
+        file = discord.File(io.BytesIO(report.encode("utf-8")), filename="event_import_errors.txt")
+        await send(embed=embed, file=file)
+
     @commands.command(name="add_event")
-    async def prefix_add_event(self, ctx, *, events_text: str):
-        """Add events. Use Shift+Enter for multiple events."""
+    async def prefix_add_event(self, ctx, *, events_text: str = ""):
+        """Add events. Use Shift+Enter for multiple events, or attach a CSV/.ics file."""
+        if ctx.message.attachments:
+            return await self.handle_import_events(ctx, ctx.message.attachments[0])
         await self.handle_add_event(ctx, events_text)
 
     @app_commands.command(name="add_event", description="Add one or multiple events")
-    @app_commands.describe(events_text="Format: MM/DD/YYYY/HH:MM | Event Name | @Role (Newlines for multiple)")
-    async def slash_add_event(self, interaction: discord.Interaction, events_text: str):
-        await self.handle_add_event(interaction, events_text)
+    @app_commands.describe(
+        events_text="Format: MM/DD/YYYY/HH:MM | Event Name | @Role | weekly (Newlines for multiple)",
+        file="CSV (date,name,role) or iCalendar (.ics) file to import instead"
+    )
+    async def slash_add_event(self, interaction: discord.Interaction, events_text: Optional[str] = None,
+                              file: Optional[discord.Attachment] = None):
+        if file is not None:
+            if events_text:
+                return await interaction.response.send_message("❌ Attach a file or type events, not both.", ephemeral=True)
+            return await self.handle_import_events(interaction, file)
+        await self.handle_add_event(interaction, events_text or "")
 
     # ===== REMOVE EVENT =====
     async def handle_remove_event(self, ctx_or_int, event_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.db.connection() as db:
             cursor = await db.execute("DELETE FROM upcoming_events WHERE id = ?", (event_id,))
             if cursor.rowcount > 0:
                 await db.commit()
+                self.events_version += 1
+                self.unschedule(event_id)
                 msg = f"✅ Event ID `{event_id}` has been removed successfully!"
             else:
                 msg = f"❌ Event ID `{event_id}` not found. Use `/view_events` to see valid IDs."
@@ -529,30 +2226,37 @@ class EventAnnouncer(commands.Cog):
             date_part = parts[0].strip()
             name_part = parts[1].strip()
             role_mention = parts[2].strip() if len(parts) > 2 else None
+            rule = RecurrenceRule.parse(parts[3]) if len(parts) > 3 and parts[3].strip() else None
 
-            has_time = False
-            try:
-                dt = datetime.strptime(date_part, "%m/%d/%Y/%H:%M")
-                has_time = True
-            except ValueError:
-                dt = datetime.strptime(date_part, "%m/%d/%Y")
+            dt, has_time = parse_event_date(date_part)
+            event_ts = hk_to_epoch(dt)
 
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.db.connection() as db:
                 cursor = await db.execute(
                     """UPDATE upcoming_events 
-                       SET event_date = ?, event_name = ?, has_time = ?, role_mention = ?, announced_1w = 0, announced_1d = 0
+                       SET event_date = ?, event_name = ?, has_time = ?, role_mention = ?, rrule = ?, ends_at = ?,
+                           next_occurrence = ?, announced_1w = 0, announced_1d = 0,
+                           announced_through_1w = 0, announced_through_1d = 0
                        WHERE id = ?""",
-                    (dt.isoformat(), name_part, has_time, role_mention, event_id)
+                    (event_ts, name_part, has_time, role_mention, str(rule) if rule else None,
+                     rule.last_occurrence(event_ts) if rule else None,
+                     rule.next_occurrence(event_ts, time.time()) if rule else None, event_id)
                 )
                 if cursor.rowcount > 0:
                     await db.commit()
+                    self.events_version += 1
+                    if rule:
+                        self.schedule_series(event_id, event_ts, rule)
+                    else:
+                        self.schedule(event_id, event_ts)
                     role_str = f" [Ping: {role_mention}]" if role_mention else ""
-                    msg = f"✅ Event ID `{event_id}` updated to: **{name_part}** on {dt.strftime('%B %d, %Y' + (' at %H:%M' if has_time else ''))}{role_str}"
+                    repeat_str = f" 🔁 {rule.describe()}" if rule else ""
+                    msg = f"✅ Event ID `{event_id}` updated to: **{name_part}** on {dt.strftime('%B %d, %Y' + (' at %H:%M' if has_time else ''))}{role_str}{repeat_str}"
                 else:
                     msg = f"❌ Event ID `{event_id}` not found."
                     
         except Exception as e:
-            msg = f"❌ Invalid format! Use: `MM/DD/YYYY/HH:MM|Event Name|@Role`"
+            msg = f"❌ Invalid format! Use: `MM/DD/YYYY/HH:MM|Event Name|@Role|weekly`"
 
         if isinstance(ctx_or_int, discord.Interaction):
             await ctx_or_int.response.send_message(msg)
@@ -561,86 +2265,246 @@ class EventAnnouncer(commands.Cog):
 
     @commands.command(name="edit_event")
     async def prefix_edit_event(self, ctx, event_id: int, *, new_data: str):
-        """Edit an event. Format: !edit_event <id> MM/DD/YYYY/HH:MM | Event Name | @Role"""
+        """Edit an event. Format: !edit_event <id> MM/DD/YYYY/HH:MM | Event Name | @Role | Recurrence"""
         await self.handle_edit_event(ctx, event_id, new_data)
 
     @app_commands.command(name="edit_event", description="Edit an existing event by ID")
     @app_commands.describe(
         event_id="The ID of the event to edit",
-        new_data="Format: MM/DD/YYYY/HH:MM | Event Name | @Role"
+        new_data="Format: MM/DD/YYYY/HH:MM | Event Name | @Role | daily/weekly/monthly/RRULE (optional)"
     )
     async def slash_edit_event(self, interaction: discord.Interaction, event_id: int, new_data: str):
         await self.handle_edit_event(interaction, event_id, new_data)
 
-    # ===== ANNOUNCEMENT LOOP =====
-    @tasks.loop(minutes=30)
-    async def event_check_loop(self):
-        """Background loop to check for upcoming events and post announcements"""
+    # ===== ANNOUNCEMENT SCHEDULER =====
+    def _new_generation(self, event_id: int) -> int:
+        self._forget_retries(event_id)
+        if event_id in self.generations:
+            self.stale_deadlines += 2
+        generation = self.generations[event_id] = self.generations.get(event_id, 0) + 1
+        return generation
+
+    def schedule(self, event_id: int, event_ts: int, announced_1w: bool = False, announced_1d: bool = False):
+        """(Re)arm the announcement deadlines of an event, replacing any it already had"""
+        generation = self._new_generation(event_id)
+        if not announced_1w:
+            heapq.heappush(self.deadlines, (event_ts - ANNOUNCE_OFFSETS["1w"], event_id, "1w", generation, event_ts))
+        if not announced_1d:
+            heapq.heappush(self.deadlines, (event_ts - ANNOUNCE_OFFSETS["1d"], event_id, "1d", generation, event_ts))
+        self._compact_deadlines()
+        self.wakeup.set()
+
+    def schedule_series(self, event_id: int, start_ts: int, rule: RecurrenceRule,
+                        through_1w: int = 0, through_1d: int = 0):
+        """(Re)arm a recurring event: just the next occurrence for each announcement"""
+        generation = self._new_generation(event_id)
+        self._push_next_occurrence(event_id, generation, start_ts, rule, "1d", through_1d)
+        # Week-ahead posts only make sense when occurrences are more than a week apart
+        if rule.min_gap > ANNOUNCE_OFFSETS["1w"]:
+            self._push_next_occurrence(event_id, generation, start_ts, rule, "1w", through_1w)
+        self._compact_deadlines()
+        self.wakeup.set()
+
+    def _push_next_occurrence(self, event_id: int, generation: int, start_ts: int, rule: RecurrenceRule,
+                              kind: str, after_ts: int):
+        # Skip occurrences already announced, or too close for this announcement to still apply
+        earliest = max(after_ts + 1, time.time() + (ANNOUNCE_OFFSETS["1d"] if kind == "1w" else 0))
+        occurrence = next(rule.occurrences(start_ts, earliest), None)
+        if occurrence is not None:
+            heapq.heappush(self.deadlines, (occurrence - ANNOUNCE_OFFSETS[kind], event_id, kind, generation, occurrence))
+
+    def unschedule(self, event_id: int):
+        self._forget_retries(event_id)
+        if self.generations.pop(event_id, None) is not None:
+            self.stale_deadlines += 2
+            self._compact_deadlines()
+
+    def _forget_retries(self, event_id: int):
+        for kind in ANNOUNCE_OFFSETS:
+            self.retries.pop((event_id, kind), None)
+
+    def _retry_later(self, entry: tuple, now: float):
+        """Put an announcement that couldn't be posted back on the heap, with back-off"""
+        _, event_id, kind, generation, occurrence = entry
+        attempt = self.retries[(event_id, kind)] = self.retries.get((event_id, kind), 0) + 1
+        delay = min(EVENT_RETRY_MAX_DELAY, EVENT_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        heapq.heappush(self.deadlines, (now + delay, event_id, kind, generation, occurrence))
+
+    def _compact_deadlines(self):
+        # Rebuild once outdated entries make up most of the heap, so it stays O(live events)
+        if self.stale_deadlines > len(self.deadlines) // 2:
+            self.deadlines = [entry for entry in self.deadlines if self.generations.get(entry[1]) == entry[3]]
+            heapq.heapify(self.deadlines)
+            self.stale_deadlines = 0
+
+    async def load_deadlines(self):
+        async with self.db.connection() as db:
+            cursor = await db.execute("""
+                SELECT id, event_date, announced_1w, rrule, announced_through_1w, announced_through_1d
+                FROM upcoming_events WHERE announced_1d = 0
+            """)
+            rows = await cursor.fetchall()
+        self.deadlines, self.generations, self.stale_deadlines = [], {}, 0
+        for row in rows:
+            if row['rrule']:
+                continue
+            self.generations[row['id']] = 1
+            if not row['announced_1w']:
+                self.deadlines.append((row['event_date'] - ANNOUNCE_OFFSETS["1w"], row['id'], "1w", 1, row['event_date']))
+            self.deadlines.append((row['event_date'] - ANNOUNCE_OFFSETS["1d"], row['id'], "1d", 1, row['event_date']))
+        heapq.heapify(self.deadlines)
+        for row in rows:
+            if row['rrule']:
+                self.schedule_series(row['id'], row['event_date'], RecurrenceRule.parse(row['rrule']),
+                                     row['announced_through_1w'], row['announced_through_1d'])
+        print(f"[EventAnnouncer] Scheduled announcements for {len(rows)} events")
+
+    async def run_scheduler(self):
+        """Sleep until the next announcement is due, post it, repeat"""
         await self.bot.wait_until_ready()
+        await self.load_deadlines()
+        while True:
+            while self.deadlines and self.generations.get(self.deadlines[0][1]) != self.deadlines[0][3]:
+                heapq.heappop(self.deadlines)
+                self.stale_deadlines = max(0, self.stale_deadlines - 1)
+            
+            timeout = EVENT_SCHEDULER_MAX_SLEEP
+            if self.deadlines:
+                timeout = min(timeout, max(0.0, self.deadlines[0][0] - time.time()))
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+                continue  # Schedule changed; look at the new earliest deadline
+            except asyncio.TimeoutError:
+                pass
+            
+            try:
+                await self.announce_due()
+            except Exception as e:
+                print(f"[EventAnnouncer] Announcement failed: {e}")
+                await asyncio.sleep(60)
+
+    async def announce_due(self):
+        now = time.time()
+        due = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            entry = heapq.heappop(self.deadlines)
+            if self.generations.get(entry[1]) == entry[3]:
+                due.append(entry)
+            else:
+                self.stale_deadlines = max(0, self.stale_deadlines - 1)
+        if not due:
+            return
         
         channel = self.bot.get_channel(ANNOUNCEMENT_CHANNEL_ID)
         if not channel:
-            print(f"[EventAnnouncer] WARNING: Announcement channel {ANNOUNCEMENT_CHANNEL_ID} not found.")
+            print(f"[EventAnnouncer] WARNING: Announcement channel {ANNOUNCEMENT_CHANNEL_ID} not found; "
+                  f"retrying {len(due)} announcement(s) later.")
+            for entry in due:
+                self._retry_later(entry, now)
             return
 
-        # Use HK time for checking
-        now = get_hk_now()
-        updates_made = False
+        async with self.db.connection() as db:
+            for entry in due:
+                try:
+                    await self.announce_entry(db, channel, entry, now)
+                except Exception as e:
+                    print(f"[EventAnnouncer] Failed to announce event {entry[1]} ({entry[2]}): {e}")
+                    self._retry_later(entry, now)
+                else:
+                    self.retries.pop((entry[1], entry[2]), None)
 
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT * FROM upcoming_events WHERE announced_1d = 0")
-            events = await cursor.fetchall()
-            
-            for event in events:
-                event_dt = datetime.fromisoformat(event['event_date'])
-                time_diff = event_dt - now
-                days_left = time_diff.total_seconds() / 86400
-
-                # If event passed without being triggered (e.g. bot was offline), mark it complete
-                if days_left < 0:
-                    await db.execute("UPDATE upcoming_events SET announced_1w = 1, announced_1d = 1 WHERE id = ?", (event['id'],))
-                    updates_made = True
-                    continue
+    async def announce_entry(self, db: aiosqlite.Connection, channel, entry: tuple, now: float):
+        """Post one due announcement; raises (before marking anything) if it couldn't be posted"""
+        _, event_id, kind, generation, occurrence = entry
+        cursor = await db.execute("SELECT * FROM upcoming_events WHERE id = ?", (event_id,))
+        event = await cursor.fetchone()
+        if event is None or event['announced_1d']:
+            self.generations.pop(event_id, None)
+            return
+        
+        if event['rrule']:
+            await self.announce_occurrence(db, channel, event, kind, generation, occurrence, now)
+            return
+        
+        event_dt = epoch_to_hk(event['event_date'])
+        days_left = (event['event_date'] - now) / 86400
 
-                # Prepare the ping message content
-                ping_content = event['role_mention'] if event['role_mention'] else None
+        # If event passed without being triggered (e.g. bot was offline), mark it complete
+        if days_left < 0:
+            await db.execute("UPDATE upcoming_events SET announced_1w = 1, announced_1d = 1 WHERE id = ?", (event_id,))
+            await db.commit()
+            self.generations.pop(event_id, None)
+            return
 
-                # 1 Week Announcement (Between 1 and 7 days left)
-                if not event['announced_1w'] and 1 < days_left <= 7:
-                    embed = discord.Embed(
-                        title="⏳ Upcoming Event in 1 Week!",
-                        description=f"**{event['event_name']}** is coming up!",
-                        color=discord.Color.gold()
-                    )
-                    time_str = event_dt.strftime('%A, %B %d, %Y') + (f" at {event_dt.strftime('%H:%M')}" if event['has_time'] else "")
-                    embed.add_field(name="Date", value=time_str)
-                    
-                    await channel.send(content=ping_content, embed=embed)
-                    await db.execute("UPDATE upcoming_events SET announced_1w = 1 WHERE id = ?", (event['id'],))
-                    updates_made = True
-
-                # 1 Day Announcement (Between 0 and 1 days left)
-                elif not event['announced_1d'] and 0 < days_left <= 1:
-                    embed = discord.Embed(
-                        title="🚨 Event Tomorrow!",
-                        description=f"**{event['event_name']}** is happening soon!",
-                        color=discord.Color.red()
-                    )
-                    time_str = event_dt.strftime('%A, %B %d, %Y') + (f" at {event_dt.strftime('%H:%M')}" if event['has_time'] else "")
-                    embed.add_field(name="Date", value=time_str)
-                    
-                    await channel.send(content=ping_content, embed=embed)
-                    await db.execute("UPDATE upcoming_events SET announced_1d = 1 WHERE id = ?", (event['id'],))
-                    updates_made = True
+        # 1 Week Announcement (Between 1 and 7 days left); closer than that, the 1 day one covers it
+        if kind == "1w":
+            if event['announced_1w'] or days_left <= 1:
+                return
+            column = "announced_1w"
+        
+        # 1 Day Announcement (Between 0 and 1 days left)
+        else:
+            column = "announced_1d"
 
-            if updates_made:
-                await db.commit()
+        await channel.send(content=event['role_mention'] or None, embed=self.announcement_embed(event, kind, event_dt))
+        if kind == "1d":
+            self.generations.pop(event_id, None)
+        await self._mark_announced(db, event, f"UPDATE upcoming_events SET {column} = 1 WHERE id = ?", (event_id,))
+
+    async def announce_occurrence(self, db: aiosqlite.Connection, channel, event, kind: str, generation: int,
+                                  occurrence: int, now: float):
+        """Announce one occurrence of a recurring event, then queue up its next one"""
+        through = f"announced_through_{kind}"
+        days_left = (occurrence - now) / 86400
+        if occurrence > event[through] and days_left > (1 if kind == "1w" else 0):
+            embed = self.announcement_embed(event, kind, epoch_to_hk(occurrence))
+            await channel.send(content=event['role_mention'] or None, embed=embed)
+            await self._mark_announced(db, event, f"UPDATE upcoming_events SET {through} = ? WHERE id = ?",
+                                       (occurrence, event['id']))
+        self._push_next_occurrence(event['id'], generation, event['event_date'],
+                                   RecurrenceRule.parse(event['rrule']), kind, occurrence)
+
+    @staticmethod
+    async def _mark_announced(db: aiosqlite.Connection, event, sql: str, params: tuple):
+        # Committed right after each post, so a later failure can't roll it back. The post
+        # already went out, so a failure here is logged rather than retried (that would repost it)
+        try:
+            await db.execute(sql, params)
+            await db.commit()
+        except Exception as e:
+            print(f"[EventAnnouncer] Posted '{event['event_name']}' but couldn't record it; "
+                  f"it may be announced again after a restart: {e}")
+
+    @staticmethod
+    def announcement_embed(event, kind: str, event_dt: datetime) -> discord.Embed:
+        if kind == "1w":
+            embed = discord.Embed(
+                title="⏳ Upcoming Event in 1 Week!",
+                description=f"**{event['event_name']}** is coming up!",
+                color=discord.Color.gold()
+            )
+        else:
+            embed = discord.Embed(
+                title="🚨 Event Tomorrow!",
+                description=f"**{event['event_name']}** is happening soon!",
+                color=discord.Color.red()
+            )
+        time_str = event_dt.strftime('%A, %B %d, %Y') + (f" at {event_dt.strftime('%H:%M')}" if event['has_time'] else "")
+        embed.add_field(name="Date", value=time_str)
+        return embed
 
-        # Clean up old events once a day (run when bot initializes or random cycle)
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM upcoming_events WHERE event_date < ?", ((now - timedelta(days=2)).isoformat(),))
+    @tasks.loop(hours=24)
+    async def cleanup_loop(self):
+        """Delete events (and ended series) that finished more than two days ago, and move series listings on"""
+        cutoff = int(time.time()) - 2 * 86400
+        async with self.db.connection() as db:
+            one_offs = await db.execute("DELETE FROM upcoming_events WHERE event_date < ? AND rrule IS NULL", (cutoff,))
+            series = await db.execute("DELETE FROM upcoming_events WHERE rrule IS NOT NULL AND ends_at < ?", (cutoff,))
+            await self.refresh_next_occurrences(db)
             await db.commit()
+        if one_offs.rowcount > 0 or series.rowcount > 0:
+            self.events_version += 1
 
 
 # ========================= BOT SETUP =========================
@@ -687,18 +2551,22 @@ async def help_command(ctx):
     
     embed.add_field(name="🎭 Role Assignment", value="""
 `!setup_roles` - Create role message (Admin)
+`!role_queue` - Reaction role queue stats (Admin)
 React to role messages to get roles!
     """, inline=False)
     
     embed.add_field(name="🍻 Drink Counter", value="""
 `/owe @debtor @creditor [amount] [reason]`
+`/owe_bulk @debtor @creditor @creditor... [amount]; ...`
 `/paid @debtor @creditor [amount]`
-`/drinks [@user]` | `/leaderboard`
+`/drinks [@user] [scope]` | `/leaderboard [scope]`
+`/settle [apply]` - Net out debts in this channel
     """, inline=False)
     
     embed.add_field(name="📅 Event Announcer", value="""
-`/view_events` - See all scheduled events and their IDs
-`/add_event` - `MM/DD/YYYY/HH:MM|Event Name|@Role`
+`/view_events [days] [@role]` - Browse scheduled events and their IDs
+`/add_event` - `MM/DD/YYYY/HH:MM|Event Name|@Role|weekly` or attach a CSV/.ics file
+Repeats: `daily` `weekly` `biweekly` `monthly` or `FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10`
 `/edit_event <id>` - Overwrite an existing event
 `/remove_event <id>` - Delete an event
     """, inline=False)
@@ -716,7 +2584,7 @@ async def slash_help(interaction: discord.Interaction):
     )
     
     embed.add_field(name="🎭 Role Assignment", value="React to role messages to get roles!", inline=False)
-    embed.add_field(name="🍻 Drink Counter", value="`/owe` `/paid` `/drinks` `/leaderboard`", inline=False)
+    embed.add_field(name="🍻 Drink Counter", value="`/owe` `/owe_bulk` `/paid` `/drinks` `/leaderboard` `/settle`", inline=False)
     embed.add_field(name="📅 Events", value="`/view_events` `/add_event` `/edit_event` `/remove_event`", inline=False)
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -0,0 +1,7 @@
+import os
+import sys
+from pathlib import Path
+
+# calebv3 exits at import time without a token
+os.environ.setdefault("DISCORD_TOKEN", "test-token")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
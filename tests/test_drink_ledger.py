@@ -0,0 +1,228 @@
+"""Concurrency tests for drink debt mutations (run with: python -m pytest tests)"""
+import asyncio
+import random
+
+import calebv3
+
+
+GUILD_ID, CHANNEL_ID = 1, 2
+
+
+class FakeMember:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.display_name = f"user{user_id}"
+
+
+class FakeResponse:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, content=None, **kwargs):
+        self.sent.append({"content": content, **kwargs})
+
+
+class FakeInteraction:
+    def __init__(self, manage_guild: bool = False):
+        self.guild = type("Guild", (), {"id": GUILD_ID, "get_member": lambda self, user_id: FakeMember(user_id)})()
+        self.channel = type("Channel", (), {"id": CHANNEL_ID, "name": "drinks"})()
+        self.user = type("User", (), {"guild_permissions": type("Permissions", (), {"manage_guild": manage_guild})()})()
+        self.response = FakeResponse()
+
+
+class FakeBot:
+    pass
+
+
+async def stored_amount(cog, debtor_id: int, creditor_id: int) -> int:
+    async with cog.db.connection() as db:
+        cursor = await db.execute(
+            "SELECT amount FROM drink_debts_v2 WHERE guild_id = ? AND channel_id = ? AND debtor_id = ? AND creditor_id = ?",
+            (GUILD_ID, CHANNEL_ID, debtor_id, creditor_id)
+        )
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+def run_with_cog(tmp_path, monkeypatch, scenario):
+    monkeypatch.setattr(calebv3, "DB_PATH", tmp_path / "test.db")
+    monkeypatch.setattr(calebv3, "DRINK_PENDING_PATH", tmp_path / "drink_pending.json")
+
+    async def main():
+        cog = calebv3.DrinkCounter(FakeBot())
+        await cog.cog_load()
+        try:
+            return await scenario(cog)
+        finally:
+            await cog.cog_unload()
+
+    return asyncio.run(main())
+
+
+def test_parallel_owe_loses_no_debt(tmp_path, monkeypatch):
+    debtor, creditor = FakeMember(10), FakeMember(20)
+
+    async def scenario(cog):
+        interactions = [FakeInteraction() for _ in range(500)]
+        await asyncio.gather(*(
+            cog.slash_owe.callback(cog, interaction, debtor, creditor, 1) for interaction in interactions
+        ))
+        assert all(interaction.response.sent for interaction in interactions)
+        await cog.ledger.flush()
+        return await stored_amount(cog, debtor.id, creditor.id), (await cog.get_user_debts(GUILD_ID, CHANNEL_ID, debtor.id))
+
+    stored, debts = run_with_cog(tmp_path, monkeypatch, scenario)
+    assert stored == 500
+    assert debts["owes"] == [(20, 500)]
+
+
+def test_parallel_owe_and_paid_net_out(tmp_path, monkeypatch):
+    debtor, creditor = FakeMember(10), FakeMember(20)
+
+    async def scenario(cog):
+        await cog.slash_owe.callback(cog, FakeInteraction(), debtor, creditor, 100)
+        calls = []
+        for i in range(300):
+            if i % 3 == 0:
+                calls.append(cog.slash_paid.callback(cog, FakeInteraction(), debtor, creditor, 1))
+            else:
+                calls.append(cog.slash_owe.callback(cog, FakeInteraction(), debtor, creditor, 1))
+        await asyncio.gather(*calls)
+        await cog.ledger.flush()
+        return await stored_amount(cog, debtor.id, creditor.id)
+
+    # 100 + 200 owed - 100 paid
+    assert run_with_cog(tmp_path, monkeypatch, scenario) == 200
+
+
+def test_parallel_owe_survives_restart(tmp_path, monkeypatch):
+    debtor, creditor = FakeMember(10), FakeMember(20)
+
+    async def first(cog):
+        # No explicit flush: cog_unload must write everything still pending
+        await asyncio.gather(*(
+            cog.slash_owe.callback(cog, FakeInteraction(), debtor, creditor, 2) for _ in range(250)
+        ))
+
+    async def second(cog):
+        return await stored_amount(cog, debtor.id, creditor.id)
+
+    run_with_cog(tmp_path, monkeypatch, first)
+    assert run_with_cog(tmp_path, monkeypatch, second) == 500
+
+
+def test_settle_apply_needs_manage_guild(tmp_path, monkeypatch):
+    async def scenario(cog):
+        await cog.ledger.add_many(GUILD_ID, CHANNEL_ID, [(10, 20, 3), (20, 30, 3), (30, 10, 3)])
+        member, manager = FakeInteraction(), FakeInteraction(manage_guild=True)
+        await cog.slash_settle.callback(cog, member, True)
+        unchanged = dict(await cog.ledger.channel(GUILD_ID, CHANNEL_ID))
+        await cog.slash_settle.callback(cog, manager, True)
+        return member.response.sent[0], unchanged, await stored_amount(cog, 10, 20)
+
+    refused, unchanged, stored = run_with_cog(tmp_path, monkeypatch, scenario)
+    assert refused.get("ephemeral")
+    assert len(unchanged) == 3
+    # The cycle nets out to nothing
+    assert stored == 0
+
+
+def test_failed_settlement_leaves_debts_untouched(tmp_path, monkeypatch):
+    async def failing_write(*args):
+        raise RuntimeError("disk I/O error")
+
+    async def scenario(cog):
+        await cog.ledger.add_many(GUILD_ID, CHANNEL_ID, [(10, 20, 3), (20, 10, 1)])
+        with monkeypatch.context() as patch:
+            patch.setattr(calebv3.DrinkLedger, "write_rows", staticmethod(failing_write))
+            interaction = FakeInteraction(manage_guild=True)
+            await cog.slash_settle.callback(cog, interaction, True)
+        return interaction.response.sent[0], dict(await cog.ledger.channel(GUILD_ID, CHANNEL_ID))
+
+    reply, debts = run_with_cog(tmp_path, monkeypatch, scenario)
+    assert reply.get("ephemeral")
+    assert debts == {(10, 20): 3, (20, 10): 1}
+
+
+def test_failed_bulk_owe_can_be_retried(tmp_path, monkeypatch):
+    async def failing_write(*args):
+        raise RuntimeError("disk I/O error")
+
+    async def scenario(cog):
+        await cog.ledger.add_many(GUILD_ID, CHANNEL_ID, [(10, 20, 3)])
+        await cog.ledger.top(GUILD_ID, CHANNEL_ID, 5)
+        with monkeypatch.context() as patch:
+            patch.setattr(calebv3.DrinkLedger, "write_rows", staticmethod(failing_write))
+            failed = FakeInteraction()
+            await cog.slash_owe_bulk.callback(cog, failed, "<@10> <@20> 2; <@30> <@10>")
+        after_failure = dict(await cog.ledger.channel(GUILD_ID, CHANNEL_ID))
+        ranking = await cog.ledger.top(GUILD_ID, CHANNEL_ID, 5)
+
+        await cog.slash_owe_bulk.callback(cog, FakeInteraction(), "<@10> <@20> 2; <@30> <@10>")
+        return failed.response.sent[0], after_failure, ranking, await stored_amount(cog, 10, 20), await stored_amount(cog, 30, 10)
+
+    reply, after_failure, ranking, stored, new_pair = run_with_cog(tmp_path, monkeypatch, scenario)
+    assert reply.get("ephemeral") and "nothing was recorded" in reply["content"]
+    assert after_failure == {(10, 20): 3}
+    assert ranking == [(10, 20, 3)]
+    # The retry is charged once
+    assert (stored, new_pair) == (5, 1)
+
+
+def test_parse_bulk_debts_rejects_repeats_and_stray_words():
+    cog = calebv3.DrinkCounter(FakeBot())
+    guild = type("Guild", (), {"get_member": lambda self, user_id: FakeMember(user_id)})()
+
+    entries, errors = cog.parse_bulk_debts(guild, "<@1> owes <@2>, <@3> 2 each; <@4> <@5>")
+    assert entries == [(1, 2, 2), (1, 3, 2), (4, 5, 1)] and not errors
+
+    _, errors = cog.parse_bulk_debts(guild, "<@1> <@2> <@2>")
+    assert errors and "listed twice" in errors[0]
+
+    _, errors = cog.parse_bulk_debts(guild, "<@1> <@2> two")
+    assert errors and "`two`" in errors[0]
+
+    _, errors = cog.parse_bulk_debts(guild, "<@1> <@2> 2 3")
+    assert errors and "one amount" in errors[0]
+
+    _, errors = cog.parse_bulk_debts(guild, "<@1> <@2> 500")
+    assert errors and "1-100" in errors[0]
+
+
+def test_server_reads_include_pending_changes_without_writing(tmp_path, monkeypatch):
+    rng = random.Random(3)
+
+    async def stored_total(cog):
+        async with cog.db.connection() as db:
+            return (await (await db.execute("SELECT COALESCE(SUM(amount), 0) FROM drink_debt_totals")).fetchone())[0]
+
+    async def scenario(cog):
+        # Only explicit flushes from here on
+        cog.flush_loop.cancel()
+        ledger = cog.ledger
+        for step in range(400):
+            channel_id, debtor, creditor = rng.randrange(3), rng.randrange(6), rng.randrange(6)
+            if debtor == creditor:
+                continue
+            if rng.random() < 0.3:
+                await ledger.pay(GUILD_ID, channel_id, debtor, creditor, rng.randint(1, 3))
+            else:
+                await ledger.add(GUILD_ID, channel_id, debtor, creditor, rng.randint(1, 3))
+            if step == 200:
+                await ledger.flush()
+
+        async def snapshot():
+            return (await cog.get_server_top_debts(GUILD_ID, 5),
+                    [await cog.get_server_user_debts(GUILD_ID, uid) for uid in range(6)])
+
+        assert ledger._pending
+        before = await stored_total(cog)
+        pending_view = await snapshot()
+        assert await stored_total(cog) == before
+        await ledger.flush()
+        return pending_view, await snapshot()
+
+    (pending_top, pending_users), (flushed_top, flushed_users) = run_with_cog(tmp_path, monkeypatch, scenario)
+    assert [row["amount"] for row in pending_top] == [row["amount"] for row in flushed_top]
+    assert [{k: sorted(v) for k, v in debts.items()} for debts in pending_users] == \
+           [{k: sorted(v) for k, v in debts.items()} for debts in flushed_users]
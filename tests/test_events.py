@@ -0,0 +1,131 @@
+"""Recurrence rules and event date parsing (run with: python -m pytest tests)"""
+import itertools
+from datetime import datetime
+
+import pytest
+
+import calebv3
+from calebv3 import RecurrenceRule, hk_to_epoch, parse_event_date
+
+
+def hk(*args) -> int:
+    return hk_to_epoch(datetime(*args))
+
+
+def test_parse_round_trips_rules():
+    assert str(RecurrenceRule.parse("biweekly")) == "FREQ=WEEKLY;INTERVAL=2"
+    rule = RecurrenceRule.parse("RRULE:FREQ=WEEKLY;BYDAY=TH,MO;COUNT=6;WKST=MO")
+    assert str(rule) == "FREQ=WEEKLY;BYDAY=MO,TH;COUNT=6"
+    assert rule.describe() == "every week on Mo, Th, 6 times"
+    until = RecurrenceRule.parse("FREQ=MONTHLY;INTERVAL=3;UNTIL=20271231T160000Z")
+    assert str(RecurrenceRule.parse(str(until))) == str(until)
+    assert until.describe() == "every 3 months, until 01/01/2028"
+
+
+@pytest.mark.parametrize("text", [
+    "FREQ=YEARLY", "FREQ=DAILY;BYDAY=MO", "FREQ=DAILY;INTERVAL=0", "FREQ=DAILY;COUNT=0", "FREQ=DAILY;FOO=1", "sometimes",
+])
+def test_parse_rejects_unsupported_rules(text):
+    with pytest.raises(ValueError):
+        RecurrenceRule.parse(text)
+
+
+def test_monthly_falls_back_to_the_last_day_of_short_months():
+    rule = RecurrenceRule.parse("monthly")
+    assert list(itertools.islice(rule.occurrences(hk(2027, 1, 31, 10, 0)), 4)) == [
+        hk(2027, 1, 31, 10, 0), hk(2027, 2, 28, 10, 0), hk(2027, 3, 31, 10, 0), hk(2027, 4, 30, 10, 0),
+    ]
+
+
+def test_weekly_byday_skips_days_before_the_start():
+    # 2027-01-06 is a Wednesday
+    rule = RecurrenceRule.parse("FREQ=WEEKLY;BYDAY=MO,TH")
+    assert list(itertools.islice(rule.occurrences(hk(2027, 1, 6, 19, 0)), 4)) == [
+        hk(2027, 1, 7, 19, 0), hk(2027, 1, 11, 19, 0), hk(2027, 1, 14, 19, 0), hk(2027, 1, 18, 19, 0),
+    ]
+
+
+def test_count_and_date_only_until_end_the_series():
+    start = hk(2027, 1, 8, 20, 0)
+    counted = RecurrenceRule.parse("FREQ=DAILY;COUNT=3")
+    assert list(counted.occurrences(start)) == [start, start + 86400, start + 2 * 86400]
+    assert counted.last_occurrence(start) == start + 2 * 86400
+    # A date-only UNTIL includes that whole day
+    until = RecurrenceRule.parse("FREQ=DAILY;UNTIL=20270110")
+    assert len(list(until.occurrences(start))) == 3
+    assert until.next_occurrence(start, start + 3 * 86400) is None
+    assert RecurrenceRule.parse("weekly").last_occurrence(start) is None
+
+
+@pytest.mark.parametrize("text", [
+    "FREQ=DAILY;INTERVAL=3", "FREQ=WEEKLY;INTERVAL=2", "FREQ=WEEKLY;BYDAY=MO,WE,SU",
+    "FREQ=WEEKLY;INTERVAL=3;BYDAY=TU,SA;COUNT=40", "FREQ=MONTHLY", "FREQ=MONTHLY;INTERVAL=5",
+])
+def test_occurrences_jump_to_the_same_point_as_walking(text):
+    rule = RecurrenceRule.parse(text)
+    start = hk(2026, 3, 31, 9, 15)
+    # Far enough past the last earliest below for five more of even the sparsest rule
+    walked = list(itertools.takewhile(lambda ts: ts < start + 2500 * 86400, rule.occurrences(start)))
+    for days in (0, 1, 6, 29, 200, 1500):
+        earliest = start + days * 86400 + 3600
+        expected = [ts for ts in walked if ts >= earliest][:5]
+        assert list(itertools.islice(rule.occurrences(start, earliest), len(expected))) == expected
+        assert rule.next_occurrence(start, earliest) == (expected[0] if expected else None)
+
+
+def test_parse_event_date_formats():
+    assert parse_event_date("3/15/2027/18:30") == (datetime(2027, 3, 15, 18, 30), True)
+    assert parse_event_date(" 2027-03-15 ") == (datetime(2027, 3, 15), False)
+    assert parse_event_date("2027-03-15T18:30:00") == (datetime(2027, 3, 15, 18, 30), True)
+    for text in ("13/01/2027", "02/30/2027", "2027-03-15 25:00", "tomorrow"):
+        with pytest.raises(ValueError):
+            parse_event_date(text)
+
+
+def test_validate_events_reports_each_bad_line():
+    now = hk(2027, 1, 1, 0, 0)
+    text = "\n".join([
+        "03/15/2027/18:30 | Launch | <@&5> | weekly",
+        "03/15/2027 | ",
+        "02/30/2027 | Nope",
+        "03/15/2027 | Odd | | every other day",
+        "06/01/2026 | Over",
+        "",
+        "06/01/2026/20:00 | Still running | | weekly",
+    ])
+    events, errors = calebv3.validate_events(calebv3.text_records(text), now)
+    assert events == [
+        (hk(2027, 3, 15, 18, 30), "Launch", True, "<@&5>", "FREQ=WEEKLY", None),
+        (hk(2026, 6, 1, 20, 0), "Still running", True, None, "FREQ=WEEKLY", None),
+    ]
+    assert [(line_no, reason) for line_no, _, reason in errors] == [
+        (2, "Missing event name"), (3, "Invalid date"), (4, "Invalid recurrence"), (5, calebv3.PAST_EVENT),
+    ]
+
+
+def test_event_files_convert_to_hk_time():
+    now = hk(2027, 1, 1, 0, 0)
+    csv_data = b"date,name,role,recurrence\r\n2027-03-15 18:30,\"Launch, party\",,daily\r\n,,,\r\n"
+    events, errors = calebv3.parse_event_file(csv_data, "events.csv", now)
+    assert not errors and events == [(hk(2027, 3, 15, 18, 30), "Launch, party", True, None, "FREQ=DAILY", None)]
+
+    ics_data = "\r\n".join([
+        "BEGIN:VCALENDAR",
+        "BEGIN:VEVENT",
+        "DTSTART:20270315T103000Z",
+        "SUMMARY:Stand",
+        " up",
+        "RRULE:FREQ=WEEKLY;COUNT=2",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        "DTSTART;VALUE=DATE:20270401",
+        "SUMMARY:All day",
+        "END:VEVENT",
+        "END:VCALENDAR",
+    ]).encode()
+    events, errors = calebv3.parse_event_file(ics_data, "calendar.ics", now)
+    start = hk(2027, 3, 15, 18, 30)
+    assert not errors and events == [
+        (start, "Standup", True, None, "FREQ=WEEKLY;COUNT=2", start + 7 * 86400),
+        (hk(2027, 4, 1, 0, 0), "All day", False, None, None, None),
+    ]
@@ -0,0 +1,129 @@
+"""Music queue journal and incremental saving (run with: python -m pytest tests)"""
+import asyncio
+import random
+import sqlite3
+
+import calebv2
+from calebv2 import GuildQueue, Track
+
+
+class FakeVoiceClient:
+    channel = type("Channel", (), {"id": 9})()
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.voice_client = FakeVoiceClient()
+
+
+class FakeBot:
+    def get_guild(self, guild_id: int):
+        return FakeGuild(guild_id)
+
+
+def saved_urls(guild_id: int) -> list[str]:
+    conn = sqlite3.connect(calebv2.DB_PATH)
+    try:
+        return [url for (url,) in conn.execute(
+            "SELECT url FROM music_queue_tracks WHERE guild_id = ? ORDER BY seq", (guild_id,)
+        )]
+    finally:
+        conn.close()
+
+
+def run_with_cog(tmp_path, monkeypatch, scenario):
+    monkeypatch.setattr(calebv2, "DB_PATH", tmp_path / "test.db")
+
+    async def main():
+        cog = calebv2.Music(FakeBot())
+        await cog.init_db()
+        return await scenario(cog)
+
+    return asyncio.run(main())
+
+
+def test_journal_nets_out_and_collapses_long_backlogs():
+    queue = GuildQueue()
+    queue.extend(Track(f"u{i}", "t") for i in range(3))
+    queue.remove(2)
+    assert [change[0] for change in queue.changes] == ["insert"] * 3 + ["delete"]
+    queue.changes.clear()
+
+    # Moving a track only rewrites its own row, keyed between its new neighbours
+    track = queue.move(2, 1)
+    assert queue.changes == [("delete", 2), ("insert", track)]
+    assert [t.seq for t in queue] == sorted(t.seq for t in queue)
+
+    for i in range(40):
+        queue.append(Track(f"x{i}", "t"))
+        queue.remove(len(queue))
+    assert queue.changes == [("reset",)]
+
+
+def test_saved_rows_follow_random_queue_changes(tmp_path, monkeypatch):
+    rng = random.Random(5)
+
+    async def scenario(cog):
+        queue = cog.queues[1] = GuildQueue()
+        added = 0
+        for step in range(400):
+            op = rng.random()
+            if op < 0.35:
+                added += 1
+                queue.append(Track(f"u{added}", "t"))
+            elif op < 0.45:
+                added += 1
+                queue.extend(Track(f"p{added}-{i}", "t") for i in range(rng.randint(1, 5)))
+            elif op < 0.6 and queue:
+                queue.next()
+            elif op < 0.72 and len(queue) > 1:
+                queue.move(rng.randint(1, len(queue)), rng.randint(1, len(queue)))
+            elif op < 0.8 and queue:
+                queue.remove(rng.randint(1, len(queue)))
+            elif op < 0.83:
+                queue.shuffle()
+            elif op < 0.85:
+                queue.clear()
+            elif op < 0.9:
+                queue.set_loop(rng.choice(calebv2.LOOP_MODES))
+                queue.next()
+            elif op < 0.93:
+                queue.requeue_current()
+            if rng.random() < 0.3:
+                await cog.write_queues()
+                if queue.current is not None or queue:
+                    assert saved_urls(1) == [track.url for track in queue], step
+
+    run_with_cog(tmp_path, monkeypatch, scenario)
+
+
+def test_saving_a_long_queue_writes_only_changed_rows(tmp_path, monkeypatch):
+    async def scenario(cog):
+        queue = cog.queues[2] = GuildQueue()
+        queue.extend(Track(f"x{i}", "t") for i in range(500))
+        queue.next()
+        await cog.write_queues()
+
+        conn = sqlite3.connect(calebv2.DB_PATH)
+        conn.executescript("""
+            CREATE TABLE row_writes (n INTEGER);
+            CREATE TRIGGER count_inserts AFTER INSERT ON music_queue_tracks BEGIN INSERT INTO row_writes VALUES (1); END;
+            CREATE TRIGGER count_deletes AFTER DELETE ON music_queue_tracks BEGIN INSERT INTO row_writes VALUES (1); END;
+        """)
+        conn.close()
+
+        queue.append(Track("new", "t"))
+        queue.next()
+        queue.move(400, 2)
+        await cog.write_queues()
+
+        conn = sqlite3.connect(calebv2.DB_PATH)
+        writes = conn.execute("SELECT COUNT(*) FROM row_writes").fetchone()[0]
+        conn.close()
+        return writes, saved_urls(2), [track.url for track in queue]
+
+    writes, saved, expected = run_with_cog(tmp_path, monkeypatch, scenario)
+    assert saved == expected
+    # One insert for the append, one delete for next(), and a delete plus insert for the move
+    assert writes == 4